@@ -1,22 +1,23 @@
+import os
+import sys
 import mysql.connector
 
+# Share the connection pool of the Lang2Query backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Lang2Query"))
+from sql_pool import get_sql_pool, PoolTimeoutError
+
 def main():
     # Connect to the MySQL database
+    pool = get_sql_pool()
     try:
-        connection = mysql.connector.connect(
-            host="127.0.0.1",
-            port=3306,
-            user="root",
-            password="Ilikedsci551",
-            database="project551"
-        )
+        # Open the first connection up front so a wrong configuration is reported immediately
+        with pool.connection():
+            pass
         print("Connected to the database successfully.")
-    except mysql.connector.Error as err:
+    except (mysql.connector.Error, PoolTimeoutError) as err:
         print(f"Error: {err}")
         return
 
-    cursor = connection.cursor()
-
     print("Please enter the SQL query statement and type 'chatbot-exit' to exit:")
 
     while True:
@@ -29,23 +30,29 @@ def main():
             break
 
         try:
-            # Execute SQL query
-            cursor.execute(sql_query)
-            # Fetch and display results for SELECT queries
-            if sql_query.lower().startswith("select"):
-                results = cursor.fetchall()
-                for row in results:
-                    print(row)
-            else:
-                # Commit changes for non-SELECT queries
-                connection.commit()
-                print(f"Query executed successfully: {cursor.rowcount} rows affected.")
-        except mysql.connector.Error as err:
+            # Every statement borrows a connection from the pool and returns it afterwards
+            with pool.connection() as connection:
+                cursor = connection.cursor()
+                try:
+                    # Execute SQL query
+                    cursor.execute(sql_query)
+                    # Fetch and display results for SELECT queries
+                    if sql_query.lower().startswith("select"):
+                        results = cursor.fetchall()
+                        for row in results:
+                            print(row)
+                    else:
+                        # Commit changes for non-SELECT queries
+                        connection.commit()
+                        print(f"Query executed successfully: {cursor.rowcount} rows affected.")
+                finally:
+                    cursor.close()
+        except (mysql.connector.Error, PoolTimeoutError) as err:
             print(f"Error executing query: {err}")
 
-    # Close the database connection
-    cursor.close()
-    connection.close()
+    # Close the database connections
+    print("Pool statistics:", pool.stats())
+    pool.close_all()
     print("Database connection closed.")
 
 # Run the main function
@@ -165,11 +165,13 @@ function sendMessage() {
     }
 
     // (7) send the message to the backend using a variable called 'data'
-    fetch(`http://localhost:6600/generate_query?query=${query_text}&files=${JSON.stringify(attachedFiles)}`, {
-        method: 'GET',
+    // the query and files go in a JSON body, so long file lists do not hit the URL length limit
+    fetch('http://localhost:6600/generate_query', {
+        method: 'POST',
         headers: {
             'Content-Type': 'application/json'
-        }
+        },
+        body: JSON.stringify({ query: query_text, files: attachedFiles })
     })
     .then(response => {
         if (!response.ok) {
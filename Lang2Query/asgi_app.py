@@ -0,0 +1,513 @@
+"""
+Asynchronous serving mode of the /generate_query API.
+
+The contract is the one of the Flask app in my.py, but database round trips use
+async drivers (aiomysql, motor) and the CPU-bound compilation runs in a thread pool,
+so the event loop keeps serving other requests while a query waits on a database.
+
+Run from the Lang2Query folder with: uvicorn asgi_app:app --port 6600
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import aiomysql
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from compression import choose_encoding, compress_body, should_compress
+from execute_nosql import MONGO_URI, MONGO_DATABASE, MONGO_POOL_SIZE, as_mongo_plan, open_cursor, run_mongo_plan, summarize_write_result
+from execute_sql import paginate_sql
+from metrics import add_request_timing, count_error, leave_request_timings, observe_request, request_timings, stage_timer, start_timings
+from mongo_plan import READ_OPERATIONS
+from my import (DEFAULT_FILE_PATHS, MAX_BATCH_SIZE, cache_statistics, compile_query, index_advice, json_argument,
+                metrics_text, record_execution, response_body, run_batch, runnable_batch_items)
+from request_log import current_request_id, get_logger, in_request_context, start_request
+from request_profile import profile_call, profile_mode, profiles
+from result_stream import MAX_PAGE_SIZE, STREAM_BATCH_SIZE, dumps_json, ndjson_lines_async, encode_page_token, decode_page_token
+from sql_pool import MYSQL_CONFIG, SQL_POOL_SIZE, SQL_POOL_RECYCLE
+
+# Threads that run the lexer, parser, semantic analysis and code generation
+COMPILE_WORKERS = int(os.environ.get("CHATDB_COMPILE_WORKERS", "4"))
+compile_executor = ThreadPoolExecutor(max_workers=COMPILE_WORKERS, thread_name_prefix="chatdb-compile")
+logger = get_logger("asgi_app")
+
+_sql_pool = None
+_sql_pool_lock = None
+_mongo_client = None
+
+
+async def get_async_sql_pool():
+    """Return the aiomysql pool of the process, creating it on first use."""
+    global _sql_pool, _sql_pool_lock
+    if _sql_pool is None:
+        if _sql_pool_lock is None:
+            _sql_pool_lock = asyncio.Lock()
+        async with _sql_pool_lock:
+            if _sql_pool is None:
+                config = dict(MYSQL_CONFIG)
+                config["db"] = config.pop("database")
+                _sql_pool = await aiomysql.create_pool(minsize=1, maxsize=SQL_POOL_SIZE,
+                                                       pool_recycle=int(SQL_POOL_RECYCLE), **config)
+    return _sql_pool
+
+
+def get_async_mongo_database():
+    """Return the motor database of the process; the client connects lazily."""
+    global _mongo_client
+    if _mongo_client is None:
+        _mongo_client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=MONGO_POOL_SIZE)
+    return _mongo_client[MONGO_DATABASE]
+
+
+async def close_databases():
+    global _sql_pool, _mongo_client
+    if _sql_pool is not None:
+        _sql_pool.close()
+        await _sql_pool.wait_closed()
+        _sql_pool = None
+    if _mongo_client is not None:
+        _mongo_client.close()
+        _mongo_client = None
+
+
+async def execute_sql_query_async(sql_query, params=None):
+    """The async counterpart of execute_sql.execute_sql_query, returning (success, rows or message)."""
+    try:
+        pool = await get_async_sql_pool()
+        async with pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(sql_query, tuple(params) if params is not None else None)
+                if sql_query.strip().lower().startswith("select"):
+                    return True, list(await cursor.fetchall())
+                await connection.commit()
+                return True, f"{cursor.rowcount} rows affected."
+    except (aiomysql.Error, asyncio.TimeoutError) as err:
+        return False, str(err)
+
+
+async def stream_sql_query_async(sql_query, batch_size=STREAM_BATCH_SIZE, params=None):
+    # An unbuffered cursor, so only one batch of rows is held in memory
+    pool = await get_async_sql_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute(sql_query, tuple(params) if params is not None else None)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield list(rows)
+
+
+async def fetch_sql_page_async(sql_query, offset, page_size, params=None):
+    success, rows = await execute_sql_query_async(paginate_sql(sql_query, offset, page_size), params)
+    if not success:
+        return False, rows, False
+    return True, rows[:page_size], len(rows) > page_size
+
+
+async def execute_nosql_query_async(nosql_query):
+    """
+    The async counterpart of execute_nosql.execute_nosql_query for a query without files to load.
+    A structured plan runs as it is, only a query string is parsed.
+    """
+    try:
+        plan = as_mongo_plan(nosql_query)
+        database = get_async_mongo_database()
+        if plan["operation"] in READ_OPERATIONS:
+            return True, await open_cursor(plan, database=database).to_list(length=None)
+        result = await run_mongo_plan(plan, database)
+        if plan["operation"] == "find_one":
+            return True, [result] if result is not None else []
+        return True, summarize_write_result(result)
+    except Exception as err:
+        return False, str(err)
+
+
+async def execute_compiled_query_async(data_collected):
+    """The async counterpart of my.execute_compiled_query."""
+    with stage_timer("execute"):
+        if data_collected["target"] == "SQL":
+            prepared = data_collected.get("prepared")
+            if prepared:
+                success, exe_result = await execute_sql_query_async(prepared["query"], prepared["params"])
+            else:
+                success, exe_result = await execute_sql_query_async(data_collected["result"])
+        else:
+            success, exe_result = await execute_nosql_query_async(data_collected.get("plan", data_collected["result"]))
+    if success:
+        record_execution(data_collected["target"], data_collected["result"])
+    else:
+        count_error("execute")
+    return success, exe_result
+
+
+async def stream_nosql_query_async(nosql_query, batch_size=STREAM_BATCH_SIZE):
+    cursor = open_cursor(as_mongo_plan(nosql_query), database=get_async_mongo_database())
+    try:
+        while True:
+            batch = await cursor.to_list(length=batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        await cursor.close()
+
+
+async def fetch_nosql_page_async(nosql_query, offset, page_size):
+    try:
+        cursor = open_cursor(as_mongo_plan(nosql_query), skip=offset, limit=page_size + 1,
+                             database=get_async_mongo_database())
+        documents = await cursor.to_list(length=None)
+        return True, documents[:page_size], len(documents) > page_size
+    except Exception as err:
+        return False, str(err), False
+
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type"),
+]
+
+
+def error_body(payload, status):
+    # The Flask app answers errors with jsonify(payload, status), which sends [payload, status] with status 200
+    return [payload, status]
+
+
+async def send_body(send, body, content_type, status=200):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type)] + CORS_HEADERS})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, data, status=200):
+    await send_body(send, dumps_json(data).encode("utf-8"), b"application/json", status)
+
+
+async def send_result(send, args, data_collected):
+    # like my.timed_jsonify: the timings block when asked for, and the serialization timed for /metrics;
+    # error bodies are the [payload, status] lists of error_body and get no timings
+    if isinstance(data_collected, dict) and is_timings_request(args):
+        data_collected["timings"] = request_timings()
+    with stage_timer("serialize"):
+        body = dumps_json(response_body(data_collected) if isinstance(data_collected, dict) else data_collected).encode("utf-8")
+    await send_body(send, body, b"application/json")
+
+
+def request_id_send(send, request_id):
+    # Every response carries the id its log lines are tagged with, like the Flask app
+    async def send_with_id(message):
+        if message["type"] == "http.response.start":
+            message = dict(message, headers=list(message["headers"]) + [(b"x-request-id", request_id.encode("ascii"))])
+        await send(message)
+
+    return send_with_id
+
+
+def compressing_send(send, accept_encoding):
+    """
+    Wrap send so that a large response sent in one body message goes out with gzip/br,
+    like the after_request hook of the Flask app. Streamed responses are passed through.
+    """
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return send
+    pending_start = None
+
+    async def send_compressed(message):
+        nonlocal pending_start
+        if message["type"] == "http.response.start":
+            # held back until the first body message tells whether the response is streamed
+            pending_start = message
+            return
+        if pending_start is not None:
+            start, pending_start = pending_start, None
+            body = message.get("body", b"")
+            if not message.get("more_body") and should_compress(body, encoding):
+                start = dict(start, headers=list(start["headers"]) + [
+                    (b"content-encoding", encoding.encode("ascii")), (b"vary", b"Accept-Encoding")])
+                message = dict(message, body=compress_body(body, encoding))
+            await send(start)
+        await send(message)
+
+    return send_compressed
+
+
+async def send_ndjson(send, header, batches):
+    # batches is closed even when send fails on a disconnected client, so its pooled
+    # connection and open cursor are given back at once rather than when it is collected
+    async with contextlib.aclosing(batches):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson")] + CORS_HEADERS})
+        async for chunk in ndjson_lines_async(header, batches):
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+
+def is_streaming_request(args):
+    return str(args.get("stream", "")).lower() in ["1", "true", "yes"]
+
+
+def is_explain_request(args):
+    return str(args.get("explain", "")).lower() in ["1", "true", "yes"]
+
+
+def is_timings_request(args):
+    return str(args.get("timings", "")).lower() in ["1", "true", "yes"]
+
+
+def is_paginated_request(args):
+    return "page_size" in args or "page_token" in args
+
+
+async def page_body(args, target, query, fetch_page):
+    try:
+        page_size = min(int(args.get("page_size", MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if page_size < 1:
+            raise ValueError("The page size must be positive.")
+        page_token = args.get("page_token")
+        offset = decode_page_token(query, page_token) if page_token else 0
+    except ValueError as e:
+        return error_body({"error": f"Pagination error: {e}"}, 400)
+    with stage_timer("execute"):
+        success, rows, has_more = await fetch_page(query, offset, page_size)
+    if not success:
+        count_error("execute")
+        return error_body({"error": f"Error executing query: {rows}"}, 400)
+    if offset == 0:
+        record_execution(target, query)
+    return {
+        "target": target,
+        "result": rows,
+        "ast": "",
+        "type": "execute",
+        "next_page_token": encode_page_token(query, offset + len(rows)) if has_more else None
+    }
+
+
+async def generate_query(args, send, profile=None):
+    """
+    GET /generate_query (args from the query string) or POST (args from the JSON body), answered like my.generate_result.
+
+    :param profile: The X-ChatDB-Profile header; with it or ?profile=, the compilation on the
+                    worker thread is profiled (the async execution paths are not).
+    """
+    try:
+        input_query = args.get("query")
+        file_paths = json_argument(args.get("files"))
+        if not input_query:
+            return await send_json(send, error_body({"error": "The input query is required."}, 400))
+        if not file_paths:
+            file_paths = list(DEFAULT_FILE_PATHS)
+
+        if input_query.startswith("execute sql:"):
+            extracted_query = input_query[len("execute sql: "):]
+            params = json_argument(args["params"]) if args.get("params") else None
+            if is_streaming_request(args):
+                header = {"target": "SQL", "ast": "", "type": "execute"}
+                record_execution("SQL", extracted_query)
+                return await send_ndjson(send, header, stream_sql_query_async(extracted_query, params=params))
+            if is_paginated_request(args):
+                return await send_result(send, args, await page_body(
+                    args, "SQL", extracted_query,
+                    lambda query, offset, page_size: fetch_sql_page_async(query, offset, page_size, params)))
+            with stage_timer("execute"):
+                success, exe_result = await execute_sql_query_async(extracted_query, params)
+            if not success:
+                count_error("execute")
+                logger.warning("Error executing query: %s", exe_result)
+                return await send_json(send, error_body({"error": "Error executing sql query"}, 400))
+            record_execution("SQL", extracted_query)
+            return await send_result(send, args, {"target": "SQL", "result": exe_result, "ast": "", "type": "execute"})
+
+        if input_query.startswith("execute nosql:"):
+            extracted_query = input_query[len("execute nosql: "):]
+            if is_streaming_request(args):
+                header = {"target": "NOSQL", "ast": "", "type": "execute"}
+                record_execution("NOSQL", extracted_query)
+                return await send_ndjson(send, header, stream_nosql_query_async(extracted_query))
+            if is_paginated_request(args):
+                return await send_result(send, args, await page_body(args, "NOSQL", extracted_query, fetch_nosql_page_async))
+            with stage_timer("execute"):
+                success, exe_result = await execute_nosql_query_async(extracted_query)
+            if not success:
+                count_error("execute")
+                logger.warning("Error executing query: %s", exe_result)
+                return await send_json(send, error_body({"error": "Error executing sql query:"}, 400))
+            record_execution("NOSQL", extracted_query)
+            return await send_result(send, args, {"target": "NOSQL", "result": exe_result, "ast": "", "type": "execute"})
+
+        # Compilation is CPU-bound, it runs on the thread pool instead of the event loop
+        loop = asyncio.get_running_loop()
+        compile_function = compile_query
+        mode = profile_mode(args.get("profile") or profile)
+        if mode:
+            compile_function = functools.partial(profile_call, mode, current_request_id(), input_query, compile_query)
+        # the EXPLAIN of ?explain=1 runs with the blocking drivers, on the same worker thread
+        data_collected, status = await loop.run_in_executor(
+            compile_executor, in_request_context(compile_function), input_query, file_paths, None, is_explain_request(args))
+        if status != 200:
+            return await send_json(send, error_body(data_collected, status))
+        return await send_result(send, args, data_collected)
+    except Exception as e:
+        logger.exception("Cannot answer /generate_query")
+        return await send_json(send, error_body({"error": f"The server error occurred: {e}"}, 500))
+
+
+async def read_json_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body) if body else {}
+    except ValueError:
+        return {}
+
+
+async def generate_batch(receive, send):
+    """POST /generate_query/batch, answered like my.generate_batch."""
+    try:
+        payload = await read_json_body(receive)
+        queries = payload.get("queries")
+        if not isinstance(queries, list) or not queries:
+            return await send_json(send, error_body({"error": "The queries are required."}, 400))
+        if len(queries) > MAX_BATCH_SIZE:
+            return await send_json(send, error_body({"error": f"At most {MAX_BATCH_SIZE} queries can be sent in one batch."}, 400))
+        file_paths = payload.get("files") or list(DEFAULT_FILE_PATHS)
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(compile_executor, in_request_context(run_batch), queries, file_paths)
+        if payload.get("execute"):
+            # at most one query per pooled connection at a time
+            limit = asyncio.Semaphore(SQL_POOL_SIZE if payload.get("parallel", True) else 1)
+
+            async def execute(item):
+                # every task runs in a copy of the context, the gather as a whole is timed below
+                leave_request_timings()
+                async with limit:
+                    success, exe_result = await execute_compiled_query_async(item)
+                item["execution"] = {"success": success, "result": exe_result}
+
+            start = time.perf_counter()
+            await asyncio.gather(*(execute(item) for item in runnable_batch_items(results)))
+            add_request_timing("execute", time.perf_counter() - start)
+        return await send_json(send, {"results": [response_body(item) for item in results]})
+    except Exception as e:
+        return await send_json(send, error_body({"error": f"The server error occurred: {e}"}, 500))
+
+
+async def generate_index_advice(values, send, apply):
+    """GET/POST /index_advice, answered like my.index_advice_route."""
+    try:
+        loop = asyncio.get_running_loop()
+        # reading the datasets for the selectivity and creating indexes both block
+        advice = await loop.run_in_executor(compile_executor, in_request_context(index_advice), values, apply)
+        return await send_json(send, advice)
+    except PermissionError as e:
+        return await send_json(send, error_body({"error": str(e)}, 403))
+    except ValueError as e:
+        return await send_json(send, error_body({"error": f"Invalid parameter: {e}"}, 400))
+    except Exception as e:
+        return await send_json(send, error_body({"error": f"The server error occurred: {e}"}, 500))
+
+
+async def send_profile(send, request_id, args):
+    """GET /profiles/<request_id>, answered like my.get_profile."""
+    entry = profiles.get(request_id)
+    if entry is None:
+        return await send_json(send, error_body({"error": f"No profile for request {request_id}."}, 404))
+    if args.get("format") == "pstats":
+        if "dump" not in entry:
+            return await send_json(send, error_body({"error": "Sampled profiles have no pstats dump."}, 400))
+        return await send_body(send, entry["dump"], b"application/octet-stream")
+    return await send_body(send, entry["report"].encode("utf-8"), b"text/plain; charset=utf-8")
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_databases()
+            compile_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    headers = dict(scope.get("headers", []))
+    request_id = start_request(headers.get(b"x-request-id", b"").decode("latin-1"))
+    start_timings()
+    started = time.perf_counter()
+    try:
+        return await route_request(scope, receive, send, headers, request_id)
+    finally:
+        observe_request(route_label(scope["path"]), time.perf_counter() - started)
+
+
+# The paths served by route_request, the route label of chatdb_request_seconds
+ROUTES = {"/", "/generate_query", "/generate_query/batch", "/cache_stats", "/metrics", "/profiles", "/index_advice"}
+
+
+def route_label(path):
+    # the route patterns of the Flask app, so unknown paths share one series
+    if path in ROUTES:
+        return path
+    if path.startswith("/profiles/"):
+        return "/profiles/<request_id>"
+    return "unmatched"
+
+
+async def route_request(scope, receive, send, headers, request_id):
+    send = request_id_send(send, request_id)
+    send = compressing_send(send, headers.get(b"accept-encoding", b"").decode("latin-1"))
+    if scope["method"] == "OPTIONS":
+        return await send_body(send, b"", b"text/plain", status=204)
+    # Like Flask's request.args, the first value of every parameter
+    query_string = scope.get("query_string", b"").decode("latin-1")
+    args = {key: values[0] for key, values in parse_qs(query_string, keep_blank_values=True).items()}
+
+    path = scope["path"]
+    if path == "/" and scope["method"] == "GET":
+        return await send_body(send, b"hello", b"text/html; charset=utf-8")
+    profile = headers.get(b"x-chatdb-profile", b"").decode("latin-1")
+    if path == "/generate_query" and scope["method"] == "GET":
+        return await generate_query(args, send, profile)
+    if path == "/generate_query" and scope["method"] == "POST":
+        return await generate_query(await read_json_body(receive), send, profile)
+    if path == "/generate_query/batch" and scope["method"] == "POST":
+        return await generate_batch(receive, send)
+    if path == "/cache_stats" and scope["method"] == "GET":
+        return await send_json(send, cache_statistics())
+    if path == "/metrics" and scope["method"] == "GET":
+        return await send_body(send, metrics_text().encode("utf-8"), b"text/plain; version=0.0.4")
+    if path == "/profiles" and scope["method"] == "GET":
+        return await send_json(send, {"profiles": profiles.summaries()})
+    if path.startswith("/profiles/") and scope["method"] == "GET":
+        return await send_profile(send, path[len("/profiles/"):], args)
+    if path == "/index_advice" and scope["method"] == "GET":
+        return await generate_index_advice(args, send, apply=False)
+    if path == "/index_advice" and scope["method"] == "POST":
+        return await generate_index_advice(await read_json_body(receive), send, apply=True)
+    return await send_json(send, {"error": "Not Found"}, status=404)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, port=6600)
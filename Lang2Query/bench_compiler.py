@@ -0,0 +1,209 @@
+"""
+Benchmark every stage of the compiler on a generated query corpus.
+
+The corpus is built from the generate_example_query templates (join, group, sort,
+limit, where) on the shipped datasets, with a fixed seed. Every sentence runs through
+lexical_analysis, Parser.parse, SemanticAnalyzer.analyze and CodeGenerator, each timed
+on its own. The report has the p50/p99 latency, the throughput and the memory allocated
+per call (tracemalloc, measured in a second pass so it does not slow the timed one).
+
+Usage: python3 bench_compiler.py [--queries N] [--seed S] [--output results.json]
+                                 [--compare baseline.json] [--threshold 1.5]
+(run inside the Lang2Query folder; --compare exits with 1 when a stage got slower than threshold x baseline)
+"""
+import argparse
+import glob
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import my
+
+DATASETS = {
+    "SQL": sorted(glob.glob("../Database/SQL/data/*.csv")),
+    "NoSQL": sorted(glob.glob("../Database/NoSQL/Data/*.json")),
+}
+EXAMPLE_KINDS = ["join", "group", "sort", "limit", "where"]
+STAGES = ["lex", "parse", "analyze", "generate"]
+
+
+def build_corpus(contexts, query_count, seed):
+    """Return query_count (target, kind, sentence) tuples, the same ones for the same seed."""
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < query_count:
+        target = rng.choice(sorted(contexts))
+        kind = rng.choice(EXAMPLE_KINDS)
+        kinds, sentences = my.example_sentences(kind, 3, target, contexts[target], rng)
+        corpus.extend((target, kind, sentence) for sentence in sentences)
+    return corpus[:query_count]
+
+
+def run_stages(context, target, sentence, measure):
+    """
+    Run one sentence through the stages, each call wrapped by measure(stage, function).
+
+    Returns the stage that failed, or None. The later stages of a failed sentence are skipped.
+    """
+    results = {}
+    stages = [
+        ("lex", lambda: my.lexical_analysis(sentence, context)),
+        ("parse", lambda: my.Parser(results["lex"]).parse()),
+        ("analyze", lambda: my.SemanticAnalyzer(context.symbol_table, target).analyze(results["parse"])),
+        ("generate", lambda: my.CodeGenerator(target).generate_sql(results["parse"]) if target == "SQL"
+                             else my.CodeGenerator(target).generate_mongo(results["parse"])),
+    ]
+    for stage, function in stages:
+        try:
+            results[stage] = measure(stage, function)
+        except Exception:
+            # some random combinations of fields are not valid queries
+            return stage
+    return None
+
+
+def percentile(values, fraction):
+    # nearest-rank percentile of sorted values
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def time_corpus(contexts, corpus):
+    """Time every stage of every sentence; return stage -> durations (ns) and stage -> failures."""
+    durations = {stage: [] for stage in STAGES}
+    failures = {stage: 0 for stage in STAGES}
+
+    def measure(stage, function):
+        start = time.perf_counter_ns()
+        result = function()
+        durations[stage].append(time.perf_counter_ns() - start)
+        return result
+
+    for target, kind, sentence in corpus:
+        # lexing may add fields to the context, every sentence gets a fresh one
+        failed = run_stages(contexts[target].fork(), target, sentence, measure)
+        if failed:
+            failures[failed] += 1
+    return durations, failures
+
+
+def trace_allocations(contexts, corpus):
+    """Return stage -> peak bytes allocated per call, traced with tracemalloc."""
+    allocations = {stage: [] for stage in STAGES}
+
+    def measure(stage, function):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        allocations[stage].append(tracemalloc.get_traced_memory()[1] - before)
+        return result
+
+    tracemalloc.start()
+    try:
+        for target, kind, sentence in corpus:
+            run_stages(contexts[target].fork(), target, sentence, measure)
+    finally:
+        tracemalloc.stop()
+    return allocations
+
+
+def summarize(durations, failures, allocations):
+    stages = {}
+    for stage in STAGES:
+        times = sorted(durations[stage])
+        sizes = sorted(allocations[stage])
+        total = sum(times)
+        stages[stage] = {
+            "calls": len(times),
+            "failures": failures[stage],
+            "p50_us": round(percentile(times, 0.50) / 1000, 2) if times else None,
+            "p99_us": round(percentile(times, 0.99) / 1000, 2) if times else None,
+            "mean_us": round(total / len(times) / 1000, 2) if times else None,
+            "throughput_per_s": round(len(times) / (total / 1e9), 1) if total else None,
+            "alloc_p50_bytes": percentile(sizes, 0.50),
+            "alloc_p99_bytes": percentile(sizes, 0.99),
+        }
+    return stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """Print the p50/p99 ratio of every stage to the baseline; return the stages slower than threshold x."""
+    regressions = []
+    for stage, stats in report["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        for key in ["p50_us", "p99_us"]:
+            if not stats[key] or not before.get(key):
+                continue
+            ratio = stats[key] / before[key]
+            flag = "  REGRESSION" if ratio > threshold else ""
+            print(f"{stage:>9} {key:>7} {before[key]:>10.2f} -> {stats[key]:>10.2f} us  {ratio:>5.2f}x{flag}")
+            if ratio > threshold:
+                regressions.append(f"{stage} {key}")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--queries", type=int, default=2000)
+    arg_parser.add_argument("--seed", type=int, default=551)
+    arg_parser.add_argument("--output", help="write the JSON report to this file")
+    arg_parser.add_argument("--compare", help="a JSON report of an earlier run")
+    arg_parser.add_argument("--threshold", type=float, default=1.5)
+    args = arg_parser.parse_args()
+
+    contexts = {target: my.load_schema(paths) for target, paths in DATASETS.items() if paths}
+    corpus = build_corpus(contexts, args.queries, args.seed)
+    # one untimed pass warms the compiled lexers and the caches of the compiler
+    time_corpus(contexts, corpus[:50])
+    started = time.perf_counter()
+    durations, failures = time_corpus(contexts, corpus)
+    elapsed = time.perf_counter() - started
+    allocations = trace_allocations(contexts, corpus)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "queries": len(corpus),
+        "kinds": {kind: sum(1 for item in corpus if item[1] == kind) for kind in EXAMPLE_KINDS},
+        "elapsed_s": round(elapsed, 3),
+        "queries_per_s": round(len(corpus) / elapsed, 1) if elapsed else None,
+        "stages": summarize(durations, failures, allocations),
+    }
+
+    print(f"{'stage':>9} {'calls':>6} {'fail':>5} {'p50 us':>9} {'p99 us':>9} {'per s':>10} {'alloc p50':>10} {'alloc p99':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:>9} {stats['calls']:>6} {stats['failures']:>5} {stats['p50_us'] or 0:>9.2f} "
+              f"{stats['p99_us'] or 0:>9.2f} {stats['throughput_per_s'] or 0:>10.1f} "
+              f"{stats['alloc_p50_bytes'] or 0:>10} {stats['alloc_p99_bytes'] or 0:>10}")
+    print(f"{report['queries']} queries in {report['elapsed_s']} s, {report['queries_per_s']} queries/s end to end")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("Slower than the baseline:", ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare the rule-by-rule lexer with the compiled master pattern lexer.
+
+Usage: python3 bench_lexer.py [--repeat N]
+"""
+import argparse
+import re
+import time
+
+import my
+from lexer import compile_token_rules
+
+
+def legacy_lexical_analysis(input_text, token_rules):
+    # The original lexer: every rule is compiled and tried at every position
+    tokens = []
+    pos = 0
+    while pos < len(input_text):
+        match = None
+        for token_type, pattern in token_rules:
+            regex = re.compile(pattern)
+            match = regex.match(input_text, pos)
+            if match:
+                if token_type not in ("WHITESPACE", "INVALID"):
+                    tokens.append(my.Token(token_type, match.group(0)))
+                pos = match.end()
+                break
+        if not match:
+            raise SyntaxError(f"Illegal character at position {pos}: {input_text[pos]}")
+    return tokens
+
+
+def compiled_lexical_analysis(input_text, token_rules):
+    tokens = []
+    pos = 0
+    lexer = compile_token_rules(token_rules)
+    while pos < len(input_text):
+        token_type, match = lexer.match(input_text, pos)
+        if not match:
+            raise SyntaxError(f"Illegal character at position {pos}: {input_text[pos]}")
+        if token_type not in ("WHITESPACE", "INVALID"):
+            tokens.append(my.Token(token_type, match.group(0)))
+        pos = match.end()
+    return tokens
+
+
+def wide_schema(table_count, field_count):
+    # Synthetic symbol table with table_count tables of field_count columns each
+    return {
+        f"table_{t}": {f"column_{t}_{f}": "TEXT" for f in range(field_count)}
+        for t in range(table_count)
+    }
+
+
+def long_query(symbol_table, conditions):
+    table_name = next(iter(symbol_table))
+    fields = list(symbol_table[table_name])
+    parts = [f"search for items from {table_name} table whose"]
+    for i in range(conditions):
+        if i:
+            parts.append("and")
+        parts.append(f"{fields[i % len(fields)]} is equal to \"value {i}\"")
+    return " ".join(parts)
+
+
+def timed(function, input_text, token_rules, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tokens = function(input_text, token_rules)
+    return (time.perf_counter() - start) / repeat, tokens
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    print(f"{'tables':>6} {'fields':>6} {'conds':>5} {'legacy ms':>10} {'compiled ms':>12} {'speed-up':>9}")
+    for table_count, field_count, conditions in [(1, 10, 2), (5, 20, 10), (20, 50, 40), (50, 100, 100)]:
+        symbol_table = wide_schema(table_count, field_count)
+        token_rules = my.build_token_rules(symbol_table, list(symbol_table))
+        input_text = long_query(symbol_table, conditions)
+
+        legacy_time, legacy_tokens = timed(legacy_lexical_analysis, input_text, token_rules, args.repeat)
+        compiled_time, compiled_tokens = timed(compiled_lexical_analysis, input_text, token_rules, args.repeat)
+        if repr(legacy_tokens) != repr(compiled_tokens):
+            raise AssertionError("The compiled lexer produced a different token stream.")
+
+        print(f"{table_count:>6} {field_count:>6} {conditions:>5} {legacy_time * 1000:>10.3f} "
+              f"{compiled_time * 1000:>12.3f} {legacy_time / compiled_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
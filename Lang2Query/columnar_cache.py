@@ -0,0 +1,375 @@
+"""
+Columnar, memory-mapped cache of the uploaded CSV/JSON datasets.
+
+Ingesting a file writes a folder with a meta.json and one set of column files:
+  <column>.data + <column>.offsets  the UTF-8 text of every cell and the int64 start of each cell
+  <column>.values                   int64/float64 columns of JSON datasets, as a flat array
+                                    (a column mixing ints and floats stays json, so 1 is not read back as 1.0)
+  <column>.nulls                    the sorted int64 row numbers without a value
+The files are memory-mapped when the dataset is read again, so the schema, the
+explore preview and the MongoDB loader do not parse the CSV/JSON text.
+A cache is only used while the size and mtime of its source file are unchanged.
+
+Usage: python3 columnar_cache.py [--cache-dir DIR] [file or folder ...]
+(default: ../Database/SQL/data and ../Database/NoSQL/Data)
+"""
+import argparse
+import bisect
+import csv
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from json_stream import iter_json_documents, read_json_documents
+from request_log import get_logger
+
+logger = get_logger("columnar_cache")
+
+# 2: columns mixing ints and floats are no longer stored as float64
+FORMAT_VERSION = 2
+# Where the caches are written, by default a .columnar folder next to every data file
+COLUMNAR_CACHE_DIR = os.environ.get("CHATDB_COLUMNAR_DIR", "")
+DEFAULT_DATA_DIRS = ["../Database/SQL/data", "../Database/NoSQL/Data"]
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def cache_path(file_path: str, cache_dir: str = COLUMNAR_CACHE_DIR) -> str:
+    """Return the folder of the columnar cache of a data file."""
+    base_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(file_path)), ".columnar")
+    return os.path.join(base_dir, os.path.basename(file_path))
+
+
+def _map_file(path: str):
+    # An empty file cannot be memory-mapped, it has no cells to read anyway
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _ColumnWriter:
+    """Appends the cells of one column to its .data/.offsets files while a dataset is ingested."""
+    def __init__(self, folder: str, index: int, name: str, start_row: int, encode_json: bool):
+        self.name = name
+        self.prefix = os.path.join(folder, f"c{index}")
+        self.encode_json = encode_json
+        self.data = open(self.prefix + ".data", "wb")
+        self.offsets = array("q", [0])
+        self.nulls = array("q")
+        self.size = 0
+        # numbers are kept aside as long as every cell of a JSON column is one
+        self.numbers: Optional[array] = array("q") if encode_json else None
+        for row in range(start_row):
+            self.append(row, None, present=False)
+
+    def append(self, row: int, value: Any, present: bool = True) -> None:
+        if not present or (value is None and not self.encode_json):
+            self.nulls.append(row)
+            self.numbers = None
+            encoded = b""
+        else:
+            encoded = (json.dumps(value, ensure_ascii=False) if self.encode_json else value).encode("utf-8")
+            self._track_number(value)
+        self.data.write(encoded)
+        self.size += len(encoded)
+        self.offsets.append(self.size)
+
+    def _track_number(self, value: Any) -> None:
+        # A column is numeric while all its cells are ints (int64) or all are floats (float64);
+        # a mixed column stays json, so every cell reads back with its own type
+        if self.numbers is None:
+            return
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            self.numbers = None
+        elif isinstance(value, int):
+            if self.numbers.typecode == "q" and INT64_MIN <= value <= INT64_MAX:
+                self.numbers.append(value)
+            else:
+                self.numbers = None
+        elif self.numbers.typecode == "d":
+            self.numbers.append(value)
+        elif not self.numbers:
+            # the first cell is a float
+            self.numbers = array("d", [value])
+        else:
+            self.numbers = None
+
+    def close(self) -> Dict[str, Any]:
+        self.data.close()
+        if self.numbers is not None and len(self.numbers) == len(self.offsets) - 1:
+            # every cell is a number, the column is stored as a flat array instead of text
+            os.remove(self.prefix + ".data")
+            with open(self.prefix + ".values", "wb") as f:
+                self.numbers.tofile(f)
+            kind = "int64" if self.numbers.typecode == "q" else "float64"
+        else:
+            with open(self.prefix + ".offsets", "wb") as f:
+                self.offsets.tofile(f)
+            kind = "json" if self.encode_json else "str"
+        with open(self.prefix + ".nulls", "wb") as f:
+            self.nulls.tofile(f)
+        return {"name": self.name, "kind": kind, "file": os.path.basename(self.prefix)}
+
+
+def _source_state(file_path: str) -> Dict[str, int]:
+    stat = os.stat(file_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def ingest_file(file_path: str, cache_dir: str = COLUMNAR_CACHE_DIR) -> str:
+    """
+    Convert a CSV or JSON data file into its columnar cache.
+
+    The cache is written to a temporary folder and moved into place, so readers
+    never see a half-written cache.
+
+    :param file_path: Path to the CSV/JSON file.
+    :param cache_dir: The folder of the caches, by default .columnar next to the file.
+    :return: The folder of the cache.
+    """
+    if file_path.endswith(".csv"):
+        file_format = "csv"
+    elif file_path.endswith(".json"):
+        file_format = "json"
+    else:
+        raise ValueError(f"Unsupported file format: {file_path}")
+
+    target = cache_path(file_path, cache_dir)
+    folder = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    source = _source_state(file_path)
+    writers: Dict[str, _ColumnWriter] = {}
+    rows = 0
+    layout = None
+    try:
+        if file_format == "csv":
+            with open(file_path, "r", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                if not reader.fieldnames:
+                    raise ValueError("CSV file is empty or has no headers.")
+                for index, field in enumerate(reader.fieldnames):
+                    writers[field] = _ColumnWriter(folder, index, field, 0, encode_json=False)
+                for row in reader:
+                    for field, writer in writers.items():
+                        writer.append(rows, row.get(field))
+                    rows += 1
+        else:
+            for layout, document in iter_json_documents(file_path):
+                if not isinstance(document, dict):
+                    raise ValueError("Unsupported JSON structure. Expected a dictionary or a list.")
+                for field in document:
+                    if field not in writers:
+                        writers[field] = _ColumnWriter(folder, len(writers), field, rows, encode_json=True)
+                for field, writer in writers.items():
+                    writer.append(rows, document.get(field), present=field in document)
+                rows += 1
+        columns = [writer.close() for writer in writers.values()]
+    except BaseException:
+        for writer in writers.values():
+            writer.data.close()
+        shutil.rmtree(folder, ignore_errors=True)
+        raise
+
+    meta = {"version": FORMAT_VERSION, "source": os.path.abspath(file_path), "format": file_format,
+            "layout": layout, "rows": rows, "columns": columns, **source}
+    with open(os.path.join(folder, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(folder, target)
+    return target
+
+
+class ColumnarTable:
+    """
+    A memory-mapped columnar cache of one dataset.
+
+    Offsets, null rows and numeric columns are read through memoryviews of the mapped
+    files, so nothing but the cells that are asked for is copied.
+    """
+    def __init__(self, folder: str):
+        with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.folder = folder
+        self.format = self.meta["format"]
+        self.layout = self.meta["layout"]
+        self.row_count = self.meta["rows"]
+        self.fields = [column["name"] for column in self.meta["columns"]]
+        self.maps = []
+        self.columns = {}
+        for column in self.meta["columns"]:
+            prefix = os.path.join(folder, column["file"])
+            nulls = self._view(prefix + ".nulls", "q")
+            if column["kind"] in ["int64", "float64"]:
+                values = self._view(prefix + ".values", "q" if column["kind"] == "int64" else "d")
+                self.columns[column["name"]] = (column["kind"], values, None, nulls)
+            else:
+                data = self._map(prefix + ".data")
+                offsets = self._view(prefix + ".offsets", "q")
+                self.columns[column["name"]] = (column["kind"], data, offsets, nulls)
+
+    def _map(self, path: str):
+        mapped = _map_file(path)
+        self.maps.append(mapped)
+        return mapped
+
+    def _view(self, path: str, typecode: str):
+        mapped = self._map(path)
+        return memoryview(mapped).cast(typecode) if mapped else memoryview(array(typecode))
+
+    def is_current(self, file_path: str) -> bool:
+        # the cache belongs to the file as long as its size and mtime are unchanged
+        try:
+            source = _source_state(file_path)
+        except OSError:
+            return False
+        return source["mtime_ns"] == self.meta["mtime_ns"] and source["size"] == self.meta["size"]
+
+    def cell(self, field: str, row: int) -> Tuple[bool, Any]:
+        """Return (present, value) of one cell."""
+        kind, values, offsets, nulls = self.columns[field]
+        # the null rows are written in order, a binary search finds them without a set
+        if nulls:
+            index = bisect.bisect_left(nulls, row)
+            if index < len(nulls) and nulls[index] == row:
+                return self.format == "csv", None
+        if offsets is None:
+            return True, values[row]
+        text = bytes(values[offsets[row]:offsets[row + 1]]).decode("utf-8")
+        return True, json.loads(text) if kind == "json" else text
+
+    def column(self, field: str):
+        """Return a whole column: a memoryview for numeric columns, otherwise a list of values."""
+        kind, values, offsets, nulls = self.columns[field]
+        if offsets is None:
+            return values
+        return [self.cell(field, row)[1] for row in range(self.row_count)]
+
+    def row(self, index: int) -> Dict[str, Any]:
+        # CSV rows keep every field like csv.DictReader, JSON documents only the fields they have
+        row = {}
+        for field in self.fields:
+            present, value = self.cell(field, index)
+            if present:
+                row[field] = value
+        return row
+
+    def rows(self, limit: Optional[int] = None, start: int = 0) -> List[Dict[str, Any]]:
+        end = self.row_count if limit is None else min(self.row_count, start + limit)
+        return [self.row(index) for index in range(start, end)]
+
+    def iter_rows(self) -> Iterator[Dict[str, Any]]:
+        for index in range(self.row_count):
+            yield self.row(index)
+
+    def close(self) -> None:
+        self.columns = {}
+        for mapped in self.maps:
+            if isinstance(mapped, mmap.mmap):
+                try:
+                    mapped.close()
+                except BufferError:
+                    # a memoryview handed out by column() is still alive, the map is freed with it
+                    pass
+        self.maps = []
+
+
+_open_tables: Dict[str, ColumnarTable] = {}
+_open_lock = threading.Lock()
+
+
+def open_columnar(file_path: str, cache_dir: str = COLUMNAR_CACHE_DIR) -> Optional[ColumnarTable]:
+    """
+    Return the memory-mapped cache of a data file, or None if the file has not been
+    ingested or has changed since. Opened tables are shared by all requests.
+    """
+    folder = cache_path(file_path, cache_dir)
+    with _open_lock:
+        table = _open_tables.get(folder)
+        if table is not None and table.is_current(file_path):
+            return table
+        if table is not None:
+            # the file changed, its stale cache is unmapped
+            del _open_tables[folder]
+            table.close()
+        if not os.path.exists(os.path.join(folder, "meta.json")):
+            return None
+        try:
+            table = ColumnarTable(folder)
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning("Ignoring the columnar cache of %s: %s", file_path, err)
+            return None
+        if table.meta.get("version") != FORMAT_VERSION or not table.is_current(file_path):
+            table.close()
+            return None
+        _open_tables[folder] = table
+        return table
+
+
+def cached_csv_rows(file_path: str, limit: Optional[int] = None) -> Optional[Tuple[List[str], List[Dict[str, str]]]]:
+    """Return (field names, first rows) of a CSV file from its cache, or None without a current cache."""
+    table = open_columnar(file_path)
+    if table is None:
+        return None
+    return table.fields, table.rows(limit)
+
+
+def cached_json_documents(file_path: str, limit: Optional[int] = None) -> Tuple[Optional[str], List[Any]]:
+    """read_json_documents, served from the columnar cache when the file has a current one."""
+    table = open_columnar(file_path)
+    if table is None:
+        return read_json_documents(file_path, limit)
+    documents = table.rows(limit)
+    return (table.layout if documents else None), documents
+
+
+def iter_cached_json_documents(file_path: str) -> Iterator[Tuple[str, Any]]:
+    """iter_json_documents, served from the columnar cache when the file has a current one."""
+    table = open_columnar(file_path)
+    if table is None:
+        yield from iter_json_documents(file_path)
+        return
+    for document in table.iter_rows():
+        yield table.layout, document
+
+
+def data_files(paths: List[str]) -> List[str]:
+    # the CSV/JSON files among the paths, folders are searched one level deep
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith((".csv", ".json")))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("paths", nargs="*", default=DEFAULT_DATA_DIRS)
+    arg_parser.add_argument("--cache-dir", default=COLUMNAR_CACHE_DIR)
+    args = arg_parser.parse_args()
+
+    failed = 0
+    for file_path in data_files(args.paths):
+        try:
+            folder = ingest_file(file_path, args.cache_dir)
+        except (OSError, ValueError) as err:
+            failed += 1
+            print(f"{file_path}: {err}")
+            continue
+        with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        print(f"{file_path}: {meta['rows']} rows, {len(meta['columns'])} columns -> {folder}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
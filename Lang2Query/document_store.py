@@ -0,0 +1,706 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from columnar_cache import iter_cached_json_documents
+
+# "local" runs the Mongo plans on the in-process document store instead of mongod
+NOSQL_BACKEND = os.environ.get("CHATDB_NOSQL_BACKEND", "mongo")
+# The collection <name> is read from <LOCAL_DATA_DIR>/<name>.json
+LOCAL_DATA_DIR = os.environ.get("CHATDB_LOCAL_DATA_DIR", "../Database/NoSQL/Data")
+
+MISSING = object()
+
+def _from_extended_json(value: Any) -> Any:
+    # {"$oid": ...} and {"$date": ...} of exported collections become their string value, bson is not needed
+    if isinstance(value, dict):
+        if len(value) == 1 and next(iter(value)) in ["$oid", "$date", "$numberLong", "$numberDecimal"]:
+            return next(iter(value.values()))
+        return {key: _from_extended_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_from_extended_json(item) for item in value]
+    return value
+
+
+def get_path(document: Any, path: str) -> Any:
+    """Return the value at a dotted path of a document, or MISSING."""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+
+def set_path(document: Dict[str, Any], path: str, value: Any) -> None:
+    # The nested documents on the path are copied, so documents shared with readers are never changed
+    parts = path.split(".")
+    for part in parts[:-1]:
+        child = document.get(part)
+        document[part] = dict(child) if isinstance(child, dict) else {}
+        document = document[part]
+    document[parts[-1]] = value
+
+
+def unset_path(document: Dict[str, Any], path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        child = document.get(part)
+        if not isinstance(child, dict):
+            return
+        document[part] = dict(child)
+        document = document[part]
+    document.pop(parts[-1], None)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def value_key(value: Any) -> tuple:
+    """A hashable key under which equal values collide, e.g. 1 and 1.0, as MongoDB compares them."""
+    if value is None or value is MISSING:
+        return ("null",)
+    if isinstance(value, bool):
+        return ("bool", value)
+    if _is_number(value):
+        return ("number", float(value))
+    if isinstance(value, str):
+        return ("string", value)
+    return ("json", json.dumps(value, sort_keys=True, default=str))
+
+
+# The order of the BSON types in comparisons and sorts
+def _type_rank(value: Any) -> int:
+    if value is None or value is MISSING:
+        return 0
+    if _is_number(value):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, bool):
+        return 5
+    return 6
+
+
+def sort_key(value: Any) -> tuple:
+    rank = _type_rank(value)
+    if rank == 0:
+        return (rank, 0)
+    if rank in [1, 2, 5]:
+        return (rank, value)
+    return (rank, value_key(value)[-1] if rank != 6 else str(value))
+
+
+def _equal(actual: Any, expected: Any) -> bool:
+    if actual is MISSING:
+        return expected is None
+    if value_key(actual) == value_key(expected):
+        return True
+    # an array field matches a value it contains
+    return isinstance(actual, list) and any(value_key(item) == value_key(expected) for item in actual)
+
+
+def _ordered(operator: str, actual: Any, expected: Any) -> bool:
+    if isinstance(actual, list):
+        return any(_ordered(operator, item, expected) for item in actual)
+    # only values of the same type are ordered, a string never compares with a number
+    if actual is MISSING or _type_rank(actual) != _type_rank(expected) or _type_rank(actual) in [0, 3, 4, 6]:
+        return False
+    if operator == "$gt":
+        return actual > expected
+    if operator == "$gte":
+        return actual >= expected
+    if operator == "$lt":
+        return actual < expected
+    return actual <= expected
+
+
+def _compare(operator: str, actual: Any, expected: Any) -> bool:
+    if operator == "$eq":
+        return _equal(actual, expected)
+    if operator == "$ne":
+        return not _equal(actual, expected)
+    if operator in ["$gt", "$gte", "$lt", "$lte"]:
+        return _ordered(operator, actual, expected)
+    if operator == "$in":
+        return any(_equal(actual, item) for item in expected)
+    if operator == "$nin":
+        return not any(_equal(actual, item) for item in expected)
+    if operator == "$exists":
+        return (actual is not MISSING) == bool(expected)
+    raise ValueError(f"Unsupported query operator: {operator}")
+
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """Return whether a document matches a find filter ($eq ... $exists, $and/$or/$nor, dotted fields)."""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif field == "$nor":
+            if any(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif field.startswith("$"):
+            raise ValueError(f"Unsupported query operator: {field}")
+        else:
+            actual = get_path(document, field)
+            if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+                if not all(_compare(operator, actual, expected) for operator, expected in condition.items()):
+                    return False
+            elif not _equal(actual, condition):
+                return False
+    return True
+
+
+def evaluate(expression: Any, document: Dict[str, Any]) -> Any:
+    """Evaluate an aggregation expression: "$field" paths, documents of expressions and literals."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = get_path(document, expression[1:])
+        return None if value is MISSING else value
+    if isinstance(expression, dict):
+        if len(expression) == 1 and "$literal" in expression:
+            return expression["$literal"]
+        return {key: evaluate(item, document) for key, item in expression.items()}
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    return expression
+
+
+class _Accumulator:
+    """The state of one $group accumulator ($sum, $avg, $min, $max, $push, $addToSet, $first, $last, $count)."""
+    def __init__(self, operator: str, expression: Any):
+        if operator not in ["$sum", "$avg", "$min", "$max", "$push", "$addToSet", "$first", "$last", "$count"]:
+            raise ValueError(f"Unsupported group accumulator: {operator}")
+        self.operator = operator
+        self.expression = expression
+        self.total = 0
+        self.count = 0
+        self.value = MISSING
+        self.values = []
+        self.seen = set()
+
+    def add(self, document: Dict[str, Any]) -> None:
+        if self.operator == "$count":
+            self.total += 1
+            return
+        if self.operator in ["$push", "$addToSet"] and isinstance(self.expression, str) \
+                and self.expression.startswith("$") and get_path(document, self.expression[1:]) is MISSING:
+            # like MongoDB, a missing field is not collected
+            return
+        value = evaluate(self.expression, document)
+        if self.operator in ["$sum", "$avg"]:
+            if _is_number(value):
+                self.total += value
+                self.count += 1
+        elif self.operator in ["$min", "$max"]:
+            if value is not None and (self.value is MISSING or
+                                      (sort_key(value) < sort_key(self.value)) == (self.operator == "$min")):
+                self.value = value
+        elif self.operator == "$push":
+            self.values.append(value)
+        elif self.operator == "$addToSet":
+            key = value_key(value)
+            if key not in self.seen:
+                self.seen.add(key)
+                self.values.append(value)
+        elif self.operator == "$first":
+            if self.value is MISSING:
+                self.value = value
+        else:
+            self.value = value
+
+    def result(self) -> Any:
+        if self.operator in ["$sum", "$count"]:
+            return self.total
+        if self.operator == "$avg":
+            return self.total / self.count if self.count else None
+        if self.operator in ["$push", "$addToSet"]:
+            return self.values
+        return None if self.value is MISSING else self.value
+
+
+def _group(documents: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    groups: Dict[tuple, tuple] = {}
+    for document in documents:
+        group_id = evaluate(spec.get("_id"), document)
+        key = value_key(group_id)
+        if key not in groups:
+            accumulators = {}
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                if not isinstance(accumulator, dict) or len(accumulator) != 1:
+                    raise ValueError(f"The group field {field} must be an accumulator object.")
+                operator, expression = next(iter(accumulator.items()))
+                accumulators[field] = _Accumulator(operator, expression)
+            groups[key] = (group_id, accumulators)
+        for accumulator in groups[key][1].values():
+            accumulator.add(document)
+    for group_id, accumulators in groups.values():
+        output = {"_id": group_id}
+        for field, accumulator in accumulators.items():
+            output[field] = accumulator.result()
+        yield output
+
+
+def _sort(documents: Iterable[Dict[str, Any]], spec: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    ordered = list(documents)
+    # stable sorts from the last key to the first give the multi-key order
+    for field, direction in reversed(list(spec.items())):
+        ordered.sort(key=lambda document: sort_key(get_path(document, field)), reverse=direction < 0)
+    return iter(ordered)
+
+
+def _unwind(documents: Iterable[Dict[str, Any]], spec: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"].lstrip("$")
+    preserve = spec.get("preserveNullAndEmptyArrays", False)
+    for document in documents:
+        value = get_path(document, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                output = dict(document)
+                set_path(output, path, item)
+                yield output
+        elif isinstance(value, list) or value is None or value is MISSING:
+            if preserve:
+                output = dict(document)
+                if isinstance(value, list):
+                    unset_path(output, path)
+                yield output
+        else:
+            # a value that is not an array is unwound to itself
+            yield document
+
+
+def _included(value: Any, parts: List[str]) -> Any:
+    # The part of a value kept by an inclusion of a dotted path; an array keeps that part of each of its documents
+    if not parts:
+        return value
+    if isinstance(value, list):
+        kept = (_included(item, parts) for item in value if isinstance(item, dict))
+        return [item for item in kept if item is not MISSING]
+    if not isinstance(value, dict) or parts[0] not in value:
+        return MISSING
+    inner = _included(value[parts[0]], parts[1:])
+    return MISSING if inner is MISSING else {parts[0]: inner}
+
+
+def _merge(target: Any, addition: Any) -> Any:
+    # Combine the parts kept by two inclusions, e.g. c.Name and c.Code of the same array
+    if isinstance(target, dict) and isinstance(addition, dict):
+        merged = dict(target)
+        for key, value in addition.items():
+            merged[key] = _merge(merged[key], value) if key in merged else value
+        return merged
+    if isinstance(target, list) and isinstance(addition, list) and len(target) == len(addition):
+        return [_merge(left, right) for left, right in zip(target, addition)]
+    return addition
+
+
+def _project(documents: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    excluded = [field for field, value in spec.items() if value in [0, False]]
+    exclusion = bool(excluded) and all(value in [0, False] for field, value in spec.items() if field != "_id")
+    for document in documents:
+        if exclusion:
+            output = dict(document)
+            for field in excluded:
+                unset_path(output, field)
+            yield output
+            continue
+        output = {}
+        if spec.get("_id", 1) not in [0, False] and "_id" in document:
+            output["_id"] = document["_id"] if "_id" not in spec or spec["_id"] in [1, True] \
+                else evaluate(spec["_id"], document)
+        for field, value in spec.items():
+            if field == "_id":
+                continue
+            if value in [1, True]:
+                found = _included(document, field.split("."))
+                if found is not MISSING:
+                    output = _merge(output, found)
+            elif value not in [0, False]:
+                set_path(output, field, evaluate(value, document))
+        yield output
+
+
+def _add_fields(documents: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for document in documents:
+        output = dict(document)
+        for field, expression in spec.items():
+            set_path(output, field, evaluate(expression, document))
+        yield output
+
+
+def _limit(documents: Iterable[Dict[str, Any]], count: int) -> Iterator[Dict[str, Any]]:
+    if count <= 0:
+        return
+    for index, document in enumerate(documents):
+        yield document
+        if index + 1 >= count:
+            return
+
+
+def _skip(documents: Iterable[Dict[str, Any]], count: int) -> Iterator[Dict[str, Any]]:
+    for index, document in enumerate(documents):
+        if index >= count:
+            yield document
+
+
+def _count(documents: Iterable[Dict[str, Any]], field: str) -> Iterator[Dict[str, Any]]:
+    total = sum(1 for document in documents)
+    if total:
+        yield {field: total}
+
+
+class Collection:
+    """
+    The documents of one collection, with optional hash indexes on fields.
+
+    Writes never change a stored document or list in place: they build new ones and
+    swap them in, so a pipeline that is still reading sees the documents it started with.
+    """
+    def __init__(self, name: str, documents: List[Dict[str, Any]], source_state: Optional[tuple] = None):
+        self.name = name
+        self.documents = documents
+        self.source_state = source_state
+        # field -> value key -> documents
+        self.indexes: Dict[str, Dict[tuple, List[Dict[str, Any]]]] = {}
+
+    def create_index(self, field: str) -> bool:
+        """Build a hash index on a field, return False if it already exists."""
+        if field in self.indexes:
+            return False
+        self.indexes[field] = build_hash_table(self.documents, field)
+        return True
+
+    def replace_documents(self, documents: List[Dict[str, Any]]) -> None:
+        self.indexes = {field: build_hash_table(documents, field) for field in self.indexes}
+        self.documents = documents
+
+    def index_for(self, query: Dict[str, Any]) -> Optional[Tuple[str, Any]]:
+        # The first equality on an indexed field, as (field, value), or None when the query needs a scan
+        for field, condition in query.items():
+            if field not in self.indexes:
+                continue
+            if isinstance(condition, dict) and list(condition) == ["$eq"]:
+                condition = condition["$eq"]
+            elif isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+                continue
+            if isinstance(condition, list):
+                continue
+            return field, condition
+        return None
+
+    def candidates(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # An equality on an indexed field narrows the scan to the documents with that value
+        indexed = self.index_for(query)
+        if indexed is None:
+            return self.documents
+        field, value = indexed
+        return self.indexes[field].get(value_key(value), [])
+
+    def find(self, query: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        query = query or {}
+        for document in self.candidates(query):
+            if matches(document, query):
+                yield document
+
+
+def build_hash_table(documents: Iterable[Dict[str, Any]], field: str) -> Dict[tuple, List[Dict[str, Any]]]:
+    """Group documents by the value of a field; documents with an array value are filed under every element."""
+    table: Dict[tuple, List[Dict[str, Any]]] = {}
+    for document in documents:
+        value = get_path(document, field)
+        values = value if isinstance(value, list) and value else [value]
+        for item in values:
+            table.setdefault(value_key(item), []).append(document)
+    return table
+
+
+class DocumentStore:
+    """
+    An in-process stand-in for the MongoDB database: collections are read from
+    <data_dir>/<name>.json (or the files given to register) on first use, and
+    reloaded when the file changes, which also drops the writes made since.
+    """
+    def __init__(self, data_dir: str = LOCAL_DATA_DIR):
+        self.data_dir = data_dir
+        self.files: Dict[str, str] = {}
+        self.collections: Dict[str, Collection] = {}
+        self.lock = threading.RLock()
+
+    def register(self, file_path: str) -> str:
+        # The collection named after the file is read from this file
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        with self.lock:
+            self.files[name] = file_path
+        return name
+
+    def _file_state(self, file_path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def collection(self, name: str) -> Collection:
+        with self.lock:
+            file_path = self.files.get(name, os.path.join(self.data_dir, f"{name}.json"))
+            state = self._file_state(file_path)
+            collection = self.collections.get(name)
+            if collection is not None and (collection.source_state is None or collection.source_state == state):
+                return collection
+            documents = []
+            if state is not None:
+                documents = [_from_extended_json(document) for layout, document in iter_cached_json_documents(file_path)]
+            fresh = Collection(name, documents, state)
+            if collection is not None:
+                # the indexes asked for survive a reload
+                for field in collection.indexes:
+                    fresh.create_index(field)
+            self.collections[name] = fresh
+            return fresh
+
+    def create_index(self, name: str, field: str) -> bool:
+        with self.lock:
+            return self.collection(name).create_index(field)
+
+    def aggregate(self, name: str, pipeline: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Run an aggregation pipeline. Every stage is a generator over the previous one,
+        so $match, $project, $unwind, $lookup, $skip and $limit stream documents;
+        only $group and $sort hold their input.
+        """
+        collection = self.collection(name)
+        documents: Iterable[Dict[str, Any]] = iter(collection.documents)
+        for index, stage in enumerate(pipeline):
+            if not isinstance(stage, dict) or len(stage) != 1:
+                raise ValueError(f"Each pipeline stage must be an object with one field: {stage}")
+            operator, spec = next(iter(stage.items()))
+            if operator == "$match":
+                documents = collection.find(spec) if index == 0 else (d for d in documents if matches(d, spec))
+            elif operator == "$lookup":
+                documents = self._lookup(documents, spec)
+            else:
+                stage_function = STAGES.get(operator)
+                if stage_function is None:
+                    raise ValueError(f"Unsupported aggregation stage: {operator}")
+                documents = stage_function(documents, spec)
+        return iter(documents)
+
+    def foreign_table(self, spec: Dict[str, Any]) -> Dict[tuple, List[Dict[str, Any]]]:
+        # The index of the foreign field when there is one, otherwise a hash table built for this join
+        foreign = self.collection(spec["from"])
+        if spec["foreignField"] in foreign.indexes:
+            return foreign.indexes[spec["foreignField"]]
+        return build_hash_table(foreign.documents, spec["foreignField"])
+
+    def _lookup(self, documents: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """$lookup as a hash join: the foreign collection is hashed once, then the local documents are streamed."""
+        if not all(key in spec for key in ["from", "localField", "foreignField", "as"]):
+            raise ValueError("Only $lookup with from, localField, foreignField and as is supported.")
+        table = self.foreign_table(spec)
+        for document in documents:
+            value = get_path(document, spec["localField"])
+            values = value if isinstance(value, list) and value else [value]
+            joined = []
+            seen = set()
+            for item in values:
+                for foreign in table.get(value_key(item), []):
+                    if id(foreign) not in seen:
+                        seen.add(id(foreign))
+                        joined.append(foreign)
+            output = dict(document)
+            set_path(output, spec["as"], joined)
+            yield output
+
+    def find(self, name: str, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None):
+        documents = self.collection(name).find(query)
+        return _project(documents, projection) if projection else documents
+
+    def insert(self, name: str, documents: List[Dict[str, Any]]) -> int:
+        inserted = []
+        for document in documents:
+            document = dict(document)
+            document.setdefault("_id", uuid.uuid4().hex[:24])
+            inserted.append(document)
+        with self.lock:
+            collection = self.collection(name)
+            collection.replace_documents(collection.documents + inserted)
+        return len(inserted)
+
+    def update(self, name: str, query: Dict[str, Any], update: Dict[str, Any], many: bool = True) -> int:
+        if not update or not all(operator in ["$set", "$unset", "$inc"] for operator in update):
+            raise ValueError("Only $set, $unset and $inc updates are supported.")
+        modified = 0
+        with self.lock:
+            collection = self.collection(name)
+            documents = []
+            for document in collection.documents:
+                if (many or not modified) and matches(document, query):
+                    changed = dict(document)
+                    for field, value in update.get("$set", {}).items():
+                        set_path(changed, field, value)
+                    for field in update.get("$unset", {}):
+                        unset_path(changed, field)
+                    for field, value in update.get("$inc", {}).items():
+                        current = get_path(changed, field)
+                        set_path(changed, field, (0 if current is MISSING else current) + value)
+                    if changed != document:
+                        modified += 1
+                        document = changed
+                documents.append(document)
+            if modified:
+                collection.replace_documents(documents)
+        return modified
+
+    def delete(self, name: str, query: Dict[str, Any], many: bool = True) -> int:
+        with self.lock:
+            collection = self.collection(name)
+            kept = []
+            deleted = 0
+            for document in collection.documents:
+                if (many or not deleted) and matches(document, query):
+                    deleted += 1
+                else:
+                    kept.append(document)
+            if deleted:
+                collection.replace_documents(kept)
+        return deleted
+
+
+STAGES: Dict[str, Callable[[Iterable[Dict[str, Any]], Any], Iterator[Dict[str, Any]]]] = {
+    "$group": _group,
+    "$sort": _sort,
+    "$unwind": _unwind,
+    "$project": _project,
+    "$addFields": _add_fields,
+    "$set": _add_fields,
+    "$limit": _limit,
+    "$skip": _skip,
+    "$count": _count,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_document_store() -> DocumentStore:
+    """Return the process-wide document store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DocumentStore()
+    return _store
+
+
+def iter_local_plan(plan: Dict[str, Any], skip: int = 0, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Return the documents of a find or aggregate plan on the document store, like open_cursor."""
+    store = get_document_store()
+    args = plan["args"]
+    if plan["operation"] == "aggregate":
+        documents = store.aggregate(plan["collection"], list(args[0]) if args else [])
+    elif plan["operation"] == "find":
+        documents = store.find(plan["collection"], *args[:2])
+    else:
+        raise ValueError(f"Only find and aggregate queries return documents, not {plan['operation']}.")
+    if skip:
+        documents = _skip(documents, skip)
+    if limit is not None:
+        documents = _limit(documents, limit)
+    return documents
+
+
+def explain_local_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Describe how the document store runs a plan, in the shape of a MongoDB explain():
+    queryPlanner.winningPlan (COLLSCAN, or FETCH over IXSCAN with indexName) and
+    executionStats.totalDocsExamined, plus the names of the later pipeline stages.
+    """
+    store = get_document_store()
+    operation, args = plan["operation"], plan["args"]
+    pipeline = list(args[0]) if operation == "aggregate" and args else []
+    if operation == "aggregate":
+        first = pipeline[0] if pipeline and isinstance(pipeline[0], dict) else {}
+        query = first.get("$match", {})
+        later = pipeline[1:] if "$match" in first else pipeline
+    elif operation in ["insert_one", "insert_many", "create_index"]:
+        raise ValueError(f"There is no query plan for {operation}.")
+    else:
+        query = args[0] if args else {}
+        later = []
+    collection = store.collection(plan["collection"])
+    indexed = collection.index_for(query or {})
+    if indexed is None:
+        winning_plan = {"stage": "COLLSCAN"}
+    else:
+        winning_plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": f"{indexed[0]}_1"}}
+    stages = []
+    for stage in later:
+        operator = next(iter(stage)) if isinstance(stage, dict) and stage else str(stage)
+        entry = {operator: stage.get(operator) if isinstance(stage, dict) else None}
+        if operator == "$lookup" and isinstance(stage[operator], dict) and "from" in stage[operator]:
+            # the join probes the index of the foreign field, or a hash table built for the query
+            foreign = store.collection(stage[operator]["from"])
+            if stage[operator].get("foreignField") in foreign.indexes:
+                entry["indexName"] = f"{stage[operator]['foreignField']}_1"
+        stages.append(entry)
+    return {
+        "queryPlanner": {"namespace": plan["collection"], "winningPlan": winning_plan},
+        "executionStats": {"totalDocsExamined": len(collection.candidates(query or {}))},
+        "stages": stages,
+    }
+
+
+def execute_local_plan(plan: Dict[str, Any]) -> tuple:
+    """
+    Executes a structured query plan on the in-process document store.
+
+    Args:
+        plan (dict): {"collection": str, "operation": pymongo method, "args": list}.
+
+    Returns:
+        tuple: The same (success, documents or status message/error message) as execute_nosql_plan.
+    """
+    store = get_document_store()
+    operation, name, args = plan["operation"], plan["collection"], plan["args"]
+    try:
+        if operation in ["find", "aggregate"]:
+            return True, list(iter_local_plan(plan))
+        if operation == "find_one":
+            return True, list(_limit(store.find(name, *args[:2]), 1))
+        if operation == "count_documents":
+            return True, sum(1 for document in store.find(name, args[0] if args else {}))
+        if operation == "insert_one":
+            store.insert(name, [args[0]])
+            return True, "1 document inserted."
+        if operation == "insert_many":
+            return True, f"{store.insert(name, args[0])} documents inserted."
+        if operation in ["update_one", "update_many"]:
+            modified = store.update(name, args[0], args[1], many=operation == "update_many")
+            return True, f"{modified} documents modified."
+        if operation == "create_index":
+            # a single-field index, given as "field", [("field", 1)] or {"field": 1}
+            keys = args[0]
+            field = keys if isinstance(keys, str) else list(keys.items() if isinstance(keys, dict) else keys)[0][0]
+            store.create_index(name, field)
+            return True, f"{field}_1"
+        if operation in ["delete_one", "delete_many"]:
+            deleted = store.delete(name, args[0] if args else {}, many=operation == "delete_many")
+            return True, f"{deleted} documents deleted."
+        return False, f"Unsupported MongoDB operation: {operation}"
+    except (ValueError, TypeError, KeyError, IndexError, OSError) as err:
+        return False, str(err)
@@ -1,65 +1,376 @@
-import json
-from pymongo import MongoClient
-from bson import json_util
+import hashlib
+import itertools
+import os
+import threading
+from datetime import datetime, timezone
+from columnar_cache import iter_cached_json_documents
+from document_store import NOSQL_BACKEND, execute_local_plan, explain_local_plan, get_document_store, iter_local_plan
+from lookup_indexes import LookupIndexes, lookup_fields
+from mongo_plan import READ_OPERATIONS, parse_mongo_query, plan_arguments
+from result_stream import STREAM_BATCH_SIZE
 
-def execute_nosql_query(nosql_query, json_file_list):
+# Connect to MongoDB (default localhost:27017)
+MONGO_URI = "mongodb://127.0.0.1:27017/"
+MONGO_DATABASE = "example_database"  # Replace with your desired database name
+MONGO_POOL_SIZE = int(os.environ.get("CHATDB_MONGO_POOL_SIZE", "10"))
+
+# Documents are inserted in batches of this size when a dataset is loaded
+LOAD_BATCH_SIZE = 1000
+# Remembers the content hash of every loaded collection
+DATASET_STATE_COLLECTION = "_chatdb_datasets"
+DUPLICATE_KEY_ERROR = 11000
+
+_client = None
+_client_lock = threading.Lock()
+_load_lock = threading.Lock()
+# The indexes known on the foreign side of $lookup joins
+lookup_indexes = LookupIndexes()
+
+
+def get_mongo_client():
     """
-    Executes a NoSQL query on a MongoDB database and returns the results.
+    Return the process-wide MongoClient, creating it on first use.
+
+    MongoClient keeps its own connection pool and is safe to share between threads,
+    so it is created once instead of once per query.
+    """
+    global _client
+    if _client is None:
+        # pymongo is only needed on the MongoDB backend, CHATDB_NOSQL_BACKEND=local runs without it
+        from pymongo import MongoClient
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, maxPoolSize=MONGO_POOL_SIZE)
+    return _client
+
+
+def get_database():
+    return get_mongo_client()[MONGO_DATABASE]
+
+
+def file_content_hash(file_path):
+    # SHA-256 of the file, read in chunks
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _from_extended_json(value):
+    # Convert MongoDB extended JSON ({"$oid": ...}, {"$date": ...}) the way json_util.loads does
+    from bson import json_util
+    if isinstance(value, dict):
+        return json_util.object_hook({key: _from_extended_json(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_from_extended_json(item) for item in value]
+    return value
+
+
+def _insert_batch(collection, batch):
+    from pymongo.errors import BulkWriteError
+    try:
+        collection.insert_many(batch, ordered=False)
+    except BulkWriteError as err:
+        # Duplicate _id values inside the file are skipped, anything else is an error
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in err.details.get("writeErrors", [])):
+            raise
+
+
+def load_dataset(json_file_list, batch_size=LOAD_BATCH_SIZE):
+    """
+    Imports JSON files into MongoDB collections, once per file content.
+
+    Each file becomes the collection named after the file. The SHA-256 of the file is stored
+    in the _chatdb_datasets collection, so a file that is already loaded with the same content
+    is skipped. A changed file replaces its collection. Documents are read incrementally and
+    inserted with unordered batched inserts. An ingested file is read from its columnar cache.
 
     Args:
-        nosql_query (str): The NoSQL query string (e.g., aggregate pipeline or find query).
         json_file_list (list): A list of file paths containing JSON data to import into MongoDB collections.
+        batch_size (int): The number of documents per insert_many call.
+
+    Returns:
+        dict: The collection name mapped to "loaded" or "skipped".
+    """
+    db = get_database()
+    state = db[DATASET_STATE_COLLECTION]
+    status = {}
+    with _load_lock:
+        for file_path in json_file_list:
+            collection_name = os.path.splitext(os.path.basename(file_path))[0]
+            content_hash = file_content_hash(file_path)
+            loaded = state.find_one({"_id": collection_name})
+            if loaded and loaded.get("sha256") == content_hash:
+                status[collection_name] = "skipped"
+                continue
+
+            collection = db[collection_name]
+            collection.drop()
+            lookup_indexes.forget(collection_name)
+            # Forget the old content first, an interrupted load is repeated next time
+            state.delete_one({"_id": collection_name})
+
+            count = 0
+            batch = []
+            for layout, document in iter_cached_json_documents(file_path):
+                batch.append(_from_extended_json(document))
+                if len(batch) >= batch_size:
+                    _insert_batch(collection, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                _insert_batch(collection, batch)
+                count += len(batch)
+
+            state.replace_one(
+                {"_id": collection_name},
+                {"_id": collection_name, "sha256": content_hash, "source": file_path,
+                 "documents": count, "loaded_at": datetime.now(timezone.utc)},
+                upsert=True,
+            )
+            status[collection_name] = "loaded"
+    return status
+
+
+def as_mongo_plan(nosql_query):
+    # A plan from CodeGenerator.generate_mongo_plan is used as-is, the displayed string form is parsed (and cached)
+    if isinstance(nosql_query, dict):
+        return nosql_query
+    return parse_mongo_query(nosql_query)
+
+
+def run_mongo_plan(plan, database=None):
+    """
+    Dispatch a plan to the pymongo method of its collection and return the raw pymongo result.
+
+    database defaults to the shared pymongo database; a motor database works as well,
+    the result is then awaitable (or an async cursor).
+    """
+    database = get_database() if database is None else database
+    collection = database[plan["collection"]]
+    return getattr(collection, plan["operation"])(*plan_arguments(plan))
+
+
+def ensure_lookup_indexes(plan):
+    """
+    Index the foreignField of every $lookup stage of a plan on the backend that runs it,
+    so the join is an index lookup instead of a scan of the foreign collection per document.
+    Return the joins that run without an index.
+    """
+    if not lookup_fields(plan):
+        return []
+    if NOSQL_BACKEND == "local":
+        store = get_document_store()
+        return lookup_indexes.ensure(plan, lambda name: store.collection(name).indexes, store.create_index)
+    database = get_database()
+    return lookup_indexes.ensure(
+        plan,
+        lambda name: [info["key"][0][0] for info in database[name].index_information().values()],
+        lambda name, field: database[name].create_index(field))
+
+
+def summarize_write_result(result):
+    # The counterpart of "N rows affected." for write operations
+    if hasattr(result, "inserted_ids"):
+        return f"{len(result.inserted_ids)} documents inserted."
+    if hasattr(result, "inserted_id"):
+        return "1 document inserted."
+    if hasattr(result, "modified_count"):
+        return f"{result.modified_count} documents modified."
+    if hasattr(result, "deleted_count"):
+        return f"{result.deleted_count} documents deleted."
+    return result
+
+
+def execute_nosql_plan(plan):
+    """
+    Executes a structured query plan on the MongoDB database without parsing or evaluating any code.
+
+    Args:
+        plan (dict): {"collection": str, "operation": pymongo method, "args": list}.
 
     Returns:
         tuple: A tuple where the first element is a boolean indicating success,
                and the second element is the query result or an error message.
     """
     try:
-        # Connect to MongoDB (default localhost:27017)
-        client = MongoClient("mongodb://127.0.0.1:27017/")
-        db = client["example_database"]  # Replace with your desired database name
+        ensure_lookup_indexes(plan)
+        if NOSQL_BACKEND == "local":
+            # CHATDB_NOSQL_BACKEND=local runs the plan on the in-process document store
+            return execute_local_plan(plan)
+        result = run_mongo_plan(plan)
+        if plan["operation"] in READ_OPERATIONS:
+            return True, list(result)  # Convert cursor to list for easier handling
+        if plan["operation"] == "find_one":
+            return True, [result] if result is not None else []
+        return True, summarize_write_result(result)
+    except Exception as err:
+        # Return error details
+        return False, str(err)
+
+
+def explain_command(plan):
+    # The database command that a plan runs, in the form the explain command takes
+    name, args, operation = plan["collection"], plan["args"], plan["operation"]
+    query = args[0] if args else {}
+    if operation in ["find", "find_one"]:
+        command = {"find": name, "filter": query}
+        if len(args) > 1 and args[1]:
+            command["projection"] = args[1]
+        if operation == "find_one":
+            command["limit"] = 1
+        return command
+    if operation == "aggregate":
+        return {"aggregate": name, "pipeline": list(query or []), "cursor": {}}
+    if operation == "count_documents":
+        return {"count": name, "query": query}
+    if operation in ["update_one", "update_many"]:
+        return {"update": name, "updates": [{"q": query, "u": args[1], "multi": operation == "update_many"}]}
+    if operation in ["delete_one", "delete_many"]:
+        return {"delete": name, "deletes": [{"q": query, "limit": 1 if operation == "delete_one" else 0}]}
+    raise ValueError(f"There is no query plan for {operation}.")
 
-        # Import JSON files into MongoDB collections
-        for file_path in json_file_list:
-            collection_name = file_path.split("/")[-1].replace(".json", "")
-            collection = db[collection_name]
 
-            # Load JSON data from file, parsing with `json_util` for MongoDB compatibility
-            with open(file_path, 'r', encoding='utf-8') as json_file:
-                data = json_util.loads(json_file.read())
-                if isinstance(data, list):
-                    collection.insert_many(data)
-                else:
-                    collection.insert_one(data)
+def explain_nosql_plan(plan):
+    """
+    Runs explain on a structured query plan, with executionStats verbosity.
 
-        # Parse and execute the NoSQL query
-        # Assuming the query is written as valid Python code (e.g., "db.collection_name.aggregate([...])")
-        result = eval(nosql_query, {"db": db})
-        print("result: ", result)
-        return True, list(result)  # Convert cursor to list for easier handling
+    The query runs to count the documents it examines, but writes are not applied.
 
+    Returns:
+        tuple: (success, the explain document or an error message).
+    """
+    try:
+        if NOSQL_BACKEND == "local":
+            return True, explain_local_plan(plan)
+        return True, get_database().command({"explain": explain_command(plan), "verbosity": "executionStats"})
+    except Exception as err:
+        return False, str(err)
+
+
+def execute_nosql_query(nosql_query, json_file_list):
+    """
+    Executes a NoSQL query on a MongoDB database and returns the results.
+
+    Args:
+        nosql_query (str or dict): The NoSQL query string (e.g., aggregate pipeline or find query)
+                                   or the structured plan produced by CodeGenerator.generate_mongo_plan.
+        json_file_list (list): A list of file paths containing JSON data to import into MongoDB collections.
+                               Files that are already loaded with the same content are not imported again.
+
+    Returns:
+        tuple: A tuple where the first element is a boolean indicating success,
+               and the second element is the query result or an error message.
+    """
+    try:
+        # Import JSON files into MongoDB collections (idempotent)
+        if json_file_list and NOSQL_BACKEND == "local":
+            for file_path in json_file_list:
+                get_document_store().register(file_path)
+        elif json_file_list:
+            load_dataset(json_file_list)
+
+        # The query string is turned into a plan (e.g. "db.collection_name.aggregate([...])"), nothing is evaluated
+        plan = as_mongo_plan(nosql_query)
     except Exception as err:
         # Return error details
         return False, str(err)
+    return execute_nosql_plan(plan)
+
+
+def open_cursor(plan, skip=0, limit=None, database=None):
+    """Open the cursor of a find or aggregate plan, skipping and limiting on the server."""
+    if plan["operation"] == "aggregate":
+        pipeline = list(plan["args"][0]) if plan["args"] else []
+        if skip:
+            pipeline.append({"$skip": skip})
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+        database = get_database() if database is None else database
+        return database[plan["collection"]].aggregate(pipeline, *plan["args"][1:])
+    if plan["operation"] == "find":
+        cursor = run_mongo_plan(plan, database)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return cursor
+    raise ValueError(f"Only find and aggregate queries return documents, not {plan['operation']}.")
+
 
+def stream_nosql_query(nosql_query, batch_size=STREAM_BATCH_SIZE):
+    """
+    Executes a find or aggregate query and yields its documents in batches,
+    so only one batch is held in memory.
+
+    Args:
+        nosql_query (str or dict): The NoSQL query string or plan.
+        batch_size (int): The number of documents per batch, also used as the cursor batch size.
+
+    Yields:
+        list: The next batch of documents.
+    """
+    plan = as_mongo_plan(nosql_query)
+    ensure_lookup_indexes(plan)
+    if NOSQL_BACKEND == "local":
+        documents = iter_local_plan(plan)
+        while True:
+            batch = list(itertools.islice(documents, batch_size))
+            if not batch:
+                break
+            yield batch
+        return
+    cursor = open_cursor(plan)
+    cursor.batch_size(batch_size)
+    try:
+        while True:
+            batch = list(itertools.islice(cursor, batch_size))
+            if not batch:
+                break
+            yield batch
     finally:
-        # Close the MongoDB connection
-        client.close()
+        cursor.close()
+
+
+def fetch_nosql_page(nosql_query, offset, page_size):
+    """
+    Executes a find or aggregate query and returns one page of its documents.
+
+    A find cursor skips on the server, an aggregate pipeline gets $skip/$limit stages appended.
+
+    Returns:
+        tuple: (success, documents or error message, whether there are more documents).
+    """
+    try:
+        plan = as_mongo_plan(nosql_query)
+        ensure_lookup_indexes(plan)
+        if NOSQL_BACKEND == "local":
+            cursor = iter_local_plan(plan, skip=offset, limit=page_size + 1)
+        else:
+            cursor = open_cursor(plan, skip=offset, limit=page_size + 1)
+        documents = list(cursor)
+        return True, documents[:page_size], len(documents) > page_size
+    except Exception as err:
+        return False, str(err), False
 
 # Example usage
 if __name__ == "__main__":
     # Example NoSQL query
     query = "db.city.aggregate([{'$sort': {'CountryCode': -1}}, {'$project': {'Name': 1}}])"
-    
+
     # Example JSON file paths
     json_files1 = [
-        "../Database/NoSQL/city.json",
-        "../Database/NoSQL/country.json",
-        "../Database/NoSQL/countrylanguage.json",
-        "../Database/NoSQL/sampleCultureProducts.json"
+        "../Database/NoSQL/Data/city.json",
+        "../Database/NoSQL/Data/country.json",
+        "../Database/NoSQL/Data/countrylanguage.json",
+        "../Database/NoSQL/Data/sampleCultureProducts.json"
     ]
     json_files2 = []
 
+    # Load the example collections once, later runs skip them
+    print("Dataset status:", load_dataset(json_files1))
+
     # Execute the query and display results
     success, result = execute_nosql_query(query, json_files2)
     if success:
@@ -1,49 +1,161 @@
-import mysql.connector
+import re
+from sql_pool import get_sql_pool, PoolTimeoutError
+from result_stream import STREAM_BATCH_SIZE
+from execute_sqlite import SQL_BACKEND, execute_sqlite_query, explain_sqlite_query, stream_sqlite_query
 
-def execute_sql_query(sql_query):
+def execute_sql_query(sql_query, params=None):
     """
     Executes an SQL query on the MySQL database and returns the results or status.
 
+    The connection is borrowed from the process-wide pool in sql_pool, so the
+    TCP and authentication handshake is not repeated for every query.
+    With params, the query runs as a server-side prepared statement.
+    With CHATDB_SQL_BACKEND=sqlite, it runs on the embedded SQLite copy of the CSV files instead.
+
     Args:
-        sql_query (str): The SQL query to be executed.
+        sql_query (str): The SQL query to be executed, with %s markers if params are given.
+        params (list, optional): The bind parameters of the %s markers.
 
     Returns:
         tuple: A tuple where the first element is a boolean indicating success,
                and the second element is the query result or an error message.
     """
+    if SQL_BACKEND == "sqlite":
+        return execute_sqlite_query(sql_query, params)
+    # the MySQL driver is only needed on the MySQL backend
+    import mysql.connector
     try:
-        # Connect to the MySQL database
-        connection = mysql.connector.connect(
-            host="127.0.0.1",
-            port=3306,
-            user="root",
-            password="Ilikedsci551",
-            database="project551"
-        )
-        cursor = connection.cursor()
-
-        # Execute the SQL query
-        cursor.execute(sql_query)
-
-        # If the query is a SELECT statement, fetch and return results
-        if sql_query.strip().lower().startswith("select"):
-            results = cursor.fetchall()
-            return True, results
-        else:
-            # Commit changes for non-SELECT queries
-            connection.commit()
-            return True, f"{cursor.rowcount} rows affected."
-
-    except mysql.connector.Error as err:
+        # Borrow a connection to the MySQL database from the pool
+        with get_sql_pool().connection() as connection:
+            cursor = connection.cursor(prepared=True) if params is not None else connection.cursor()
+            try:
+                # Execute the SQL query
+                if params is not None:
+                    cursor.execute(sql_query, tuple(params))
+                else:
+                    cursor.execute(sql_query)
+
+                # If the query is a SELECT statement, fetch and return results
+                if sql_query.strip().lower().startswith("select"):
+                    results = cursor.fetchall()
+                    return True, results
+                else:
+                    # The pooled connections autocommit (MYSQL_CONFIG), the change is already committed
+                    return True, f"{cursor.rowcount} rows affected."
+            finally:
+                # Ensure the cursor is cleaned up, the connection goes back to the pool
+                cursor.close()
+
+    except (mysql.connector.Error, PoolTimeoutError) as err:
         # Return error details
         return False, str(err)
 
-    finally:
-        # Ensure resources are cleaned up
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'connection' in locals() and connection:
-            connection.close()
+def stream_sql_query(sql_query, batch_size=STREAM_BATCH_SIZE, params=None):
+    """
+    Executes a SELECT query and yields its rows in batches, so only one batch is held in memory.
+
+    The pooled connection stays checked out until the generator is exhausted or closed.
+
+    Args:
+        sql_query (str): The SELECT query to be executed.
+        batch_size (int): The number of rows fetched per batch.
+        params (list, optional): The bind parameters of the %s markers, as in execute_sql_query.
+
+    Yields:
+        list: The next batch of rows.
+
+    Raises:
+        mysql.connector.Error, PoolTimeoutError: If the query cannot be executed.
+    """
+    if SQL_BACKEND == "sqlite":
+        yield from stream_sqlite_query(sql_query, batch_size, params)
+        return
+    import mysql.connector
+    with get_sql_pool().connection() as connection:
+        cursor = connection.cursor(prepared=True) if params is not None else connection.cursor()
+        try:
+            if params is not None:
+                cursor.execute(sql_query, tuple(params))
+            else:
+                cursor.execute(sql_query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                # rows left unread after an early close are dropped by the rollback in the pool
+                pass
+
+def explain_sql_query(sql_query, params=None):
+    """
+    Runs EXPLAIN on an SQL query without executing it.
+
+    Args:
+        sql_query (str): The SQL query, with %s markers if params are given.
+        params (list, optional): The bind parameters of the %s markers.
+
+    Returns:
+        tuple: (success, list of EXPLAIN rows as column -> value dictionaries or error message).
+    """
+    if SQL_BACKEND == "sqlite":
+        return explain_sqlite_query(sql_query, params)
+    import mysql.connector
+    try:
+        with get_sql_pool().connection() as connection:
+            cursor = connection.cursor(prepared=True) if params is not None else connection.cursor()
+            try:
+                explain = "EXPLAIN " + sql_query.strip().rstrip(";")
+                if params is not None:
+                    cursor.execute(explain, tuple(params))
+                else:
+                    cursor.execute(explain)
+                return True, [dict(zip(cursor.column_names, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+    except (mysql.connector.Error, PoolTimeoutError) as err:
+        return False, str(err)
+
+# LIMIT keywords outside quoted strings, the quoted strings are matched to be skipped
+_LIMIT_PATTERN = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\")|\bLIMIT\b", re.IGNORECASE)
+
+def has_limit(sql_query):
+    return any(match.group(1) is None for match in _LIMIT_PATTERN.finditer(sql_query))
+
+def paginate_sql(sql_query, offset, page_size):
+    # One row more than the page is fetched to tell whether another page follows.
+    # The LIMIT is appended to the query itself: a derived table fails on MySQL (error 1060)
+    # when the columns of a SELECT * join share a name. Only a query that already has a
+    # LIMIT is nested, so the page stays within it.
+    sql_query = sql_query.strip().rstrip(";")
+    page = f"LIMIT {int(page_size) + 1} OFFSET {int(offset)}"
+    if has_limit(sql_query):
+        return f"SELECT * FROM ({sql_query}) AS chatdb_page {page}"
+    return f"{sql_query} {page}"
+
+def fetch_sql_page(sql_query, offset, page_size, params=None):
+    """
+    Executes a SELECT query and returns one page of its rows.
+
+    LIMIT/OFFSET is appended to the query, so the database only sends the page; it still
+    reads the skipped rows, and rows written between two pages can shift the page boundaries.
+
+    Args:
+        sql_query (str): The SELECT query to be executed.
+        offset (int): The number of rows to skip.
+        page_size (int): The number of rows in the page.
+        params (list, optional): The bind parameters of the %s markers, as in execute_sql_query.
+
+    Returns:
+        tuple: (success, rows or error message, whether there are more rows).
+    """
+    success, rows = execute_sql_query(paginate_sql(sql_query, offset, page_size), params)
+    if not success:
+        return False, rows, False
+    return True, rows[:page_size], len(rows) > page_size
 
 # Example function usage
 if __name__ == "__main__":
@@ -53,3 +165,4 @@ if __name__ == "__main__":
         print("Query executed successfully:", result)
     else:
         print("Query execution failed:", result)
+    print("Pool statistics:", get_sql_pool().stats())
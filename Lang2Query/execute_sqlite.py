@@ -0,0 +1,340 @@
+import csv
+import glob
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from columnar_cache import open_columnar
+from result_stream import STREAM_BATCH_SIZE
+from type_inference import infer_csv_column_types
+
+# "sqlite" runs the generated SQL on an embedded SQLite copy of the CSV files instead of MySQL
+SQL_BACKEND = os.environ.get("CHATDB_SQL_BACKEND", "mysql")
+# ":memory:" or the path of a database file, which keeps the loaded tables across restarts
+SQLITE_PATH = os.environ.get("CHATDB_SQLITE_PATH", ":memory:")
+SQLITE_DATA_DIR = os.environ.get("CHATDB_SQLITE_DATA_DIR", "../Database/SQL/data")
+CREATE_TABLE_SQL = os.environ.get("CHATDB_CREATE_TABLE_SQL", "../Database/SQL/sql/create_table.sql")
+
+# Rows are inserted in batches of this size, every table is loaded in one transaction
+LOAD_BATCH_SIZE = 1000
+# Remembers the size and mtime of every loaded CSV file
+DATASET_STATE_TABLE = "_chatdb_datasets"
+# Seconds between two checks of the CSV files for changes
+SQLITE_RECHECK_INTERVAL = float(os.environ.get("CHATDB_SQLITE_RECHECK_INTERVAL", "1"))
+
+_connection = None
+_lock = threading.Lock()
+# The dataset_fingerprint the tables were loaded from, and when the files were last checked
+_loaded_fingerprint = None
+_checked_at = 0.0
+# The stream_sqlite_query cursors still open: SQLite refuses to drop a table they read
+_open_streams = 0
+
+_TABLE_PATTERN = re.compile(r"create\s+table\s+(\w+)\s*\((.*)\)\s*$", re.IGNORECASE | re.DOTALL)
+_COLUMN_PRIMARY_KEY = re.compile(r"^\s*(\w+)\s+\w+.*\bprimary\s+key\b", re.IGNORECASE | re.MULTILINE)
+_TABLE_PRIMARY_KEY = re.compile(r"\bprimary\s+key\s*\(([^)]*)\)", re.IGNORECASE)
+_FOREIGN_KEY = re.compile(r"\bforeign\s+key\s*\((\w+)\)\s*references\s+(\w+)\s*\((\w+)\)", re.IGNORECASE)
+# %s markers outside quoted strings, the quoted strings are kept as they are
+_MARKER_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|%s")
+
+
+class TableDefinition:
+    """A CREATE TABLE statement of create_table.sql, rewritten for SQLite, with its keys."""
+    def __init__(self, name, statement, primary_key, foreign_keys):
+        self.name = name
+        self.statement = statement
+        self.primary_key = primary_key
+        # (column, referenced table, referenced column)
+        self.foreign_keys = foreign_keys
+
+    def index_columns(self):
+        # SQLite indexes the primary key itself; every foreign key that does not
+        # lead the primary key gets its own index for the joins
+        return [column for column, _, _ in self.foreign_keys
+                if not self.primary_key or column.lower() != self.primary_key[0].lower()]
+
+    def __repr__(self):
+        return f"TableDefinition({self.name}, {self.primary_key}, {self.foreign_keys})"
+
+
+def parse_create_tables(ddl_text):
+    """
+    Parse the MySQL CREATE TABLE statements of create_table.sql.
+
+    :param ddl_text: The content of create_table.sql.
+    :return: A dictionary of lower-case table name -> TableDefinition. SQLite compares
+             table names case-insensitively, so Relationship_product_vendor_data.csv
+             loads into Relationship_Product_Vendor_data.
+    """
+    definitions = {}
+    text = re.sub(r"--[^\n]*", "", ddl_text)
+    for statement in text.split(";"):
+        match = _TABLE_PATTERN.search(statement.strip())
+        if not match:
+            continue
+        name, body = match.groups()
+        primary_key = [column.strip() for column in _TABLE_PRIMARY_KEY.search(body).group(1).split(",")] \
+            if _TABLE_PRIMARY_KEY.search(body) else _COLUMN_PRIMARY_KEY.findall(body)[:1]
+        # ENUM is MySQL only, its values are stored as text
+        body = re.sub(r"\bENUM\s*\([^)]*\)", "TEXT", body, flags=re.IGNORECASE)
+        definitions[name.lower()] = TableDefinition(
+            name, f"CREATE TABLE {name} ({body})", primary_key, _FOREIGN_KEY.findall(body))
+    return definitions
+
+
+@lru_cache(maxsize=4)
+def _create_table_definitions(ddl_path, mtime_ns, size):
+    with open(ddl_path, "r", encoding="utf-8") as f:
+        return parse_create_tables(f.read())
+
+
+def create_table_definitions(ddl_path=CREATE_TABLE_SQL):
+    """The TableDefinitions of create_table.sql, parsed again only when the file changes."""
+    if not os.path.exists(ddl_path):
+        return {}
+    stat = os.stat(ddl_path)
+    return _create_table_definitions(ddl_path, stat.st_mtime_ns, stat.st_size)
+
+
+def dataset_fingerprint(data_dir=SQLITE_DATA_DIR, ddl_path=CREATE_TABLE_SQL):
+    """The path, mtime and size of create_table.sql and of every CSV file; only os.stat, no reads."""
+    fingerprint = []
+    for path in [ddl_path] + sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def inferred_definition(table_name, file_path):
+    # A CSV file without a CREATE TABLE statement gets the column types inferred from its rows
+    columns = ", ".join(f'"{field}" {field_type if field_type != "NULL" else "TEXT"}'
+                        for field, (field_type, confidence) in infer_csv_column_types(file_path).items())
+    return TableDefinition(table_name, f"CREATE TABLE {table_name} ({columns})", [], [])
+
+
+def iter_csv_rows(file_path):
+    # The header, then the rows; an ingested file is read from its columnar cache
+    table = open_columnar(file_path)
+    if table is not None:
+        yield table.fields
+        for row in table.iter_rows():
+            yield [row[field] for field in table.fields]
+        return
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        yield from csv.reader(f)
+
+
+def has_text_affinity(declared_type):
+    declared_type = declared_type.upper()
+    return not declared_type or any(name in declared_type for name in ["CHAR", "CLOB", "TEXT"])
+
+
+def load_csv_table(connection, file_path, definition, batch_size=LOAD_BATCH_SIZE):
+    """
+    (Re)create the table of a CSV file and insert its rows with executemany in one transaction.
+
+    Empty cells of numeric columns are stored as NULL. Return the number of rows inserted.
+    """
+    rows = iter_csv_rows(file_path)
+    header = next(rows, None)
+    if not header:
+        raise ValueError(f"CSV file is empty or has no headers: {file_path}")
+
+    count = 0
+    with connection:
+        connection.execute(f"DROP TABLE IF EXISTS {definition.name}")
+        connection.execute(definition.statement)
+        declared = {column[1].lower(): column[2] for column in connection.execute(f"PRAGMA table_info({definition.name})")}
+        numeric = [index for index, field in enumerate(header) if not has_text_affinity(declared.get(field.lower(), ""))]
+        columns = ", ".join(f'"{field}"' for field in header)
+        markers = ", ".join("?" for field in header)
+        insert = f"INSERT INTO {definition.name} ({columns}) VALUES ({markers})"
+        batch = []
+        for row in rows:
+            row = list(row)
+            for index in numeric:
+                if index < len(row) and row[index] == "":
+                    row[index] = None
+            batch.append(row)
+            if len(batch) >= batch_size:
+                connection.executemany(insert, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            connection.executemany(insert, batch)
+            count += len(batch)
+        for column in definition.index_columns():
+            connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{definition.name}_{column} ON {definition.name} ({column})")
+    return count
+
+
+def load_csv_tables(connection, data_dir=SQLITE_DATA_DIR, ddl_path=CREATE_TABLE_SQL):
+    """
+    Load every CSV file of data_dir into the SQLite database, once per file version.
+
+    Tables declared in create_table.sql keep their column types and keys, and get
+    indexes on their foreign keys. A file whose size and mtime are unchanged since
+    it was loaded is skipped, so a database file is only reloaded when a CSV changes.
+
+    Returns:
+        dict: The table name mapped to "loaded" or "skipped".
+    """
+    definitions = create_table_definitions(ddl_path)
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {DATASET_STATE_TABLE} (name TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER)")
+    status = {}
+    for file_path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        table_name = os.path.splitext(os.path.basename(file_path))[0]
+        stat = os.stat(file_path)
+        loaded = connection.execute(f"SELECT mtime_ns, size FROM {DATASET_STATE_TABLE} WHERE name = ?", (table_name,)).fetchone()
+        if loaded == (stat.st_mtime_ns, stat.st_size):
+            status[table_name] = "skipped"
+            continue
+        definition = definitions.get(table_name.lower()) or inferred_definition(table_name, file_path)
+        load_csv_table(connection, file_path, definition)
+        with connection:
+            connection.execute(f"INSERT OR REPLACE INTO {DATASET_STATE_TABLE} VALUES (?, ?, ?)",
+                               (table_name, stat.st_mtime_ns, stat.st_size))
+        status[table_name] = "loaded"
+    return status
+
+
+def get_sqlite_connection():
+    """
+    Return the process-wide SQLite connection with the CSV files loaded.
+
+    The files are loaded on the first call. After that they are statted at most every
+    SQLITE_RECHECK_INTERVAL seconds, outside _lock, and reloaded only when their
+    dataset_fingerprint changed. While a stream is open the reload is put off to the
+    next check, the old tables are served until then. The connection is shared by all
+    threads and used under _lock: call this without _lock held, then take it to use the connection.
+    """
+    global _connection, _loaded_fingerprint, _checked_at
+    now = time.monotonic()
+    if _connection is not None and now - _checked_at < SQLITE_RECHECK_INTERVAL:
+        return _connection
+    fingerprint = dataset_fingerprint()
+    if _connection is None or fingerprint != _loaded_fingerprint:
+        with _lock:
+            if _connection is None:
+                _connection = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+            # another thread may have loaded the same files while this one waited
+            if fingerprint != _loaded_fingerprint and (_loaded_fingerprint is None or not _open_streams):
+                load_csv_tables(_connection)
+                _loaded_fingerprint = fingerprint
+    _checked_at = now
+    return _connection
+
+
+def sqlite_markers(sql_query):
+    # The generated prepared statements use the %s markers of MySQL, SQLite expects ?
+    return _MARKER_PATTERN.sub(lambda match: match.group(1) or "?", sql_query)
+
+
+def execute_sqlite_query(sql_query, params=None):
+    """
+    Executes an SQL query on the embedded SQLite database and returns the results or status.
+
+    Args:
+        sql_query (str): The SQL query to be executed, with %s markers if params are given.
+        params (list, optional): The bind parameters of the %s markers.
+
+    Returns:
+        tuple: The same (success, rows or status message/error message) as execute_sql_query.
+    """
+    try:
+        connection = get_sqlite_connection()
+        with _lock:
+            cursor = connection.cursor()
+            try:
+                if params is not None:
+                    cursor.execute(sqlite_markers(sql_query), tuple(params))
+                else:
+                    cursor.execute(sql_query)
+                if sql_query.strip().lower().startswith("select"):
+                    return True, cursor.fetchall()
+                connection.commit()
+                return True, f"{cursor.rowcount} rows affected."
+            finally:
+                cursor.close()
+    except (sqlite3.Error, OSError, ValueError) as err:
+        if _connection is not None:
+            with _lock:
+                if _connection.in_transaction:
+                    _connection.rollback()
+        return False, str(err)
+
+
+def explain_sqlite_query(sql_query, params=None):
+    """
+    Runs EXPLAIN QUERY PLAN on an SQL query without executing it.
+
+    Returns:
+        tuple: (success, list of {"id", "parent", "detail"} rows or error message).
+    """
+    explain = "EXPLAIN QUERY PLAN " + sql_query.strip().rstrip(";")
+    try:
+        connection = get_sqlite_connection()
+        with _lock:
+            cursor = connection.cursor()
+            try:
+                if params is not None:
+                    cursor.execute(sqlite_markers(explain), tuple(params))
+                else:
+                    cursor.execute(explain)
+                return True, [{"id": row[0], "parent": row[1], "detail": row[3]} for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+    except (sqlite3.Error, OSError, ValueError) as err:
+        return False, str(err)
+
+
+def stream_sqlite_query(sql_query, batch_size=STREAM_BATCH_SIZE, params=None):
+    """
+    Executes a SELECT query on the embedded SQLite database and yields its rows in batches.
+
+    _lock is only held while a batch is fetched, not while the client reads it, so a
+    slow stream does not hold up the other queries. A changed CSV file is reloaded once
+    no stream is open.
+
+    Raises:
+        sqlite3.Error: If the query cannot be executed.
+    """
+    global _open_streams
+    connection = get_sqlite_connection()
+    with _lock:
+        cursor = connection.cursor()
+        try:
+            if params is not None:
+                cursor.execute(sqlite_markers(sql_query), tuple(params))
+            else:
+                cursor.execute(sql_query)
+            rows = cursor.fetchmany(batch_size)
+        except BaseException:
+            cursor.close()
+            raise
+        _open_streams += 1
+    try:
+        while rows:
+            yield rows
+            with _lock:
+                rows = cursor.fetchmany(batch_size)
+    finally:
+        with _lock:
+            cursor.close()
+            _open_streams -= 1
+
+
+# Example function usage
+if __name__ == "__main__":
+    query = "SELECT * FROM Product_data WHERE length > 70;"
+    success, result = execute_sqlite_query(query)
+    if success:
+        print("Query executed successfully:", result[:5])
+    else:
+        print("Query execution failed:", result)
@@ -0,0 +1,66 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable
+
+# Marks the end of a word in a trie node
+_END = ""
+
+
+class IdentifierTrie:
+    """
+    A prefix tree of identifiers (field or table names), compiled into one regex.
+
+    Each node becomes an alternation over its children, which start with distinct
+    characters, so the regex engine follows one branch per character instead of
+    trying every identifier in turn. A word that is a prefix of a longer one is an
+    optional greedy tail, so the longest identifier is tried first. The lookarounds
+    make it boundary aware: an identifier only matches when it is not glued to
+    letters, digits or underscores on either side, so "column_1_1" matches neither
+    inside "column_1_10" nor "xcolumn_1_1".
+    """
+    def __init__(self, words: Iterable[str]):
+        self.words = frozenset(word for word in words if word)
+        self.root: Dict[str, dict] = {}
+        for word in self.words:
+            node = self.root
+            for char in word:
+                node = node.setdefault(char, {})
+            node[_END] = {}
+
+    def _node_pattern(self, node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + self._node_pattern(child)
+                    for char, child in sorted(node.items()) if char != _END]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if _END in node:
+            # the word may end here, but a longer one is tried first
+            return f"(?:{body})?"
+        return body
+
+    def pattern(self) -> str:
+        """Return the regex of the identifiers; a pattern that never matches when there are none."""
+        if not self.words:
+            return r"(?!)"
+        return rf"(?<!\w)(?:{self._node_pattern(self.root)})(?!\w)"
+
+    def __len__(self):
+        return len(self.words)
+
+    def __repr__(self):
+        return f"IdentifierTrie({len(self.words)} words)"
+
+
+@lru_cache(maxsize=64)
+def _identifier_pattern(words: FrozenSet[str]) -> str:
+    return IdentifierTrie(words).pattern()
+
+
+def identifier_pattern(words: Iterable[str]) -> str:
+    """
+    Return the longest-match, boundary-aware regex of a set of identifiers.
+
+    The trie is built once per set of words, so schemas served from the
+    schema cache and repeated insert_into_field calls reuse the pattern.
+    """
+    return _identifier_pattern(frozenset(words))
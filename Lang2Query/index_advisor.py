@@ -0,0 +1,257 @@
+"""
+Propose indexes for the fields that generated queries filter on.
+
+CodeGenerator.traverse_conditions records the (table, field, operator) of every
+condition. compile_query remembers them in query_predicates under the text of the
+generated query, and they are added to predicate_stats each time that query is
+executed: "execute sql: ..." / "execute nosql: ..." or a batch with execute. A query
+that is only translated, or an executed one the backend did not generate, is not
+counted. The advisor ranks the hot fields by how often they are filtered and how
+selective the filter is on the dataset, and proposes CREATE INDEX / createIndex
+statements for them. Creating them from the API needs CHATDB_ADVISOR_ALLOW_APPLY=1.
+
+Usage: python3 index_advisor.py [--url http://127.0.0.1:6600] [--min-hits N] [--max-selectivity S] [--apply]
+(asks the running backend, which holds the statistics)
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from columnar_cache import open_columnar
+from document_store import get_path, value_key, MISSING
+from execute_nosql import execute_nosql_plan
+from execute_sql import execute_sql_query
+from json_stream import iter_json_documents
+from mongo_plan import make_mongo_plan
+from request_log import get_logger
+
+logger = get_logger("index_advisor")
+
+# The number of (target, table, field) entries kept, the least used one is dropped first
+PREDICATE_STATS_SIZE = int(os.environ.get("CHATDB_PREDICATE_STATS_SIZE", "1024"))
+# A field is proposed once it was filtered this often ...
+ADVISOR_MIN_HITS = int(os.environ.get("CHATDB_ADVISOR_MIN_HITS", "5"))
+# ... and a filter on it is expected to keep at most this share of the rows
+ADVISOR_MAX_SELECTIVITY = float(os.environ.get("CHATDB_ADVISOR_MAX_SELECTIVITY", "0.35"))
+# POST /index_advice runs DDL, it is refused unless this is set
+ADVISOR_ALLOW_APPLY = os.environ.get("CHATDB_ADVISOR_ALLOW_APPLY", "").lower() in ["1", "true", "yes"]
+# The number of generated queries whose conditions are kept until they are executed
+QUERY_PREDICATES_SIZE = int(os.environ.get("CHATDB_QUERY_PREDICATES_SIZE", "1024"))
+
+EQUALITY_OPERATORS = ["=", "$eq", "$in"]
+NEGATION_OPERATORS = ["!=", "$ne", "$nin"]
+# The share of rows a range condition keeps when nothing else is known about it
+RANGE_SELECTIVITY = 1 / 3
+
+
+class PredicateStats:
+    """
+    Bounded counters of the filtered fields: (target, table, field) -> hits per operator.
+
+    The data file of every table is remembered, so the selectivity can be computed from it.
+    """
+    def __init__(self, maxsize: int = PREDICATE_STATS_SIZE):
+        self.maxsize = maxsize
+        self.entries: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        self.sources: Dict[Tuple[str, str], str] = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def record(self, target: str, predicates: List[Tuple[str, str, str]], table_files: Dict[str, str]) -> None:
+        """
+        Count the conditions of one query.
+
+        :param target: "SQL" or "NoSQL".
+        :param predicates: The (table, field, operator) of every condition.
+        :param table_files: Table name -> data file, for the tables of the query.
+        """
+        with self.lock:
+            for table, field, operator in predicates:
+                key = (target, table, field)
+                operators = self.entries.get(key)
+                if operators is None:
+                    if len(self.entries) >= self.maxsize:
+                        coldest = min(self.entries, key=lambda entry: sum(self.entries[entry].values()))
+                        del self.entries[coldest]
+                        self.evictions += 1
+                    operators = self.entries[key] = {}
+                operators[operator] = operators.get(operator, 0) + 1
+                if table in table_files:
+                    self.sources[(target, table)] = table_files[table]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [{"target": target, "table": table, "field": field, "operators": dict(operators),
+                     "hits": sum(operators.values()), "source": self.sources.get((target, table))}
+                    for (target, table, field), operators in self.entries.items()]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.sources.clear()
+
+
+def query_text_key(query: str) -> str:
+    # the text of a query as it is generated and as it comes back in "execute sql: ..."
+    return query.strip().rstrip(";").rstrip()
+
+
+class QueryPredicates:
+    """
+    LRU map of the text of a generated query to its target, conditions and table files,
+    so that executing the query counts its conditions.
+    """
+    def __init__(self, maxsize: int = QUERY_PREDICATES_SIZE):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[str, tuple, Dict[str, str]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def remember(self, target: str, queries: List[str], predicates: tuple, table_files: Dict[str, str]) -> None:
+        """Remember the conditions of a generated query under each of its texts (inlined and prepared)."""
+        with self.lock:
+            for query in queries:
+                key = (target.upper(), query_text_key(query))
+                self.entries[key] = (target, predicates, table_files)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get(self, target: str, query: str) -> Optional[Tuple[str, tuple, Dict[str, str]]]:
+        # target is "SQL", "NoSQL" or "NOSQL", the executed queries use the upper case one
+        key = (target.upper(), query_text_key(query))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+def _column_values(file_path: str, field: str) -> List[Any]:
+    # The column from the columnar cache when the file was ingested, otherwise from the file itself
+    table = open_columnar(file_path)
+    if table is not None:
+        return list(table.column(field)) if field in table.fields else []
+    if file_path.endswith(".csv"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            return [row.get(field) for row in csv.DictReader(f)]
+    return [get_path(document, field) for layout, document in iter_json_documents(file_path)
+            if isinstance(document, dict)]
+
+
+@lru_cache(maxsize=256)
+def _column_profile(file_path: str, mtime_ns: int, size: int, field: str) -> Tuple[int, int]:
+    values = _column_values(file_path, field)
+    present = [value for value in values if value is not None and value is not MISSING and value != ""]
+    return len(values), len({value_key(value) for value in present})
+
+
+def column_profile(file_path: str, field: str) -> Tuple[int, int]:
+    """Return (rows, distinct non-null values) of a field; computed once per version of the file."""
+    stat = os.stat(file_path)
+    return _column_profile(file_path, stat.st_mtime_ns, stat.st_size, field)
+
+
+def estimate_selectivity(file_path: Optional[str], field: str, operators: Dict[str, int]) -> Optional[float]:
+    """
+    Estimate the share of rows that the filters on a field keep, weighted by how often each operator was used.
+
+    Equality keeps 1/distinct of the rows (uniform values), a range keeps a third
+    and a negation keeps all but 1/distinct. None if the data file is unknown.
+    """
+    if not file_path or not os.path.exists(file_path):
+        return None
+    rows, distinct = column_profile(file_path, field)
+    if not rows or not distinct:
+        return None
+    weighted = 0.0
+    for operator, hits in operators.items():
+        if operator in EQUALITY_OPERATORS:
+            weighted += hits / distinct
+        elif operator in NEGATION_OPERATORS:
+            weighted += hits * (1 - 1 / distinct)
+        else:
+            weighted += hits * RANGE_SELECTIVITY
+    return weighted / sum(operators.values())
+
+
+def index_statement(target: str, table: str, field: str) -> str:
+    if target == "SQL":
+        return f"CREATE INDEX idx_{table}_{field} ON {table} ({field});"
+    return f"db.{table}.createIndex([('{field}', 1)])"
+
+
+def advise(stats: PredicateStats, min_hits: int = ADVISOR_MIN_HITS,
+           max_selectivity: float = ADVISOR_MAX_SELECTIVITY) -> List[Dict[str, Any]]:
+    """
+    Return the proposed indexes, the most useful first: fields filtered at least min_hits
+    times whose filters are expected to keep at most max_selectivity of the rows.
+    """
+    advice = []
+    for entry in stats.snapshot():
+        if entry["hits"] < min_hits:
+            continue
+        try:
+            selectivity = estimate_selectivity(entry["source"], entry["field"], entry["operators"])
+        except (OSError, ValueError) as err:
+            logger.warning("Cannot estimate the selectivity of %s.%s: %s", entry["table"], entry["field"], err)
+            continue
+        if selectivity is None or selectivity > max_selectivity:
+            continue
+        entry["selectivity"] = round(selectivity, 4)
+        entry["statement"] = index_statement(entry["target"], entry["table"], entry["field"])
+        advice.append(entry)
+    # rows saved by the index, summed over the queries that filter on the field
+    advice.sort(key=lambda entry: entry["hits"] * (1 - entry["selectivity"]), reverse=True)
+    return advice
+
+
+def apply_advice(advice: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Create the proposed indexes on the configured SQL/NoSQL backend and record the outcome in each entry."""
+    for entry in advice:
+        if entry["target"] == "SQL":
+            success, outcome = execute_sql_query(entry["statement"])
+        else:
+            success, outcome = execute_nosql_plan(
+                make_mongo_plan(entry["table"], "create_index", [(entry["field"], 1)]))
+        entry["applied"] = success
+        entry["outcome"] = outcome if isinstance(outcome, str) else str(outcome)
+    return advice
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--url", default="http://127.0.0.1:6600")
+    arg_parser.add_argument("--min-hits", type=int, default=ADVISOR_MIN_HITS)
+    arg_parser.add_argument("--max-selectivity", type=float, default=ADVISOR_MAX_SELECTIVITY)
+    arg_parser.add_argument("--apply", action="store_true", help="create the proposed indexes")
+    args = arg_parser.parse_args()
+
+    payload = {"min_hits": args.min_hits, "max_selectivity": args.max_selectivity}
+    if args.apply:
+        request = urllib.request.Request(f"{args.url}/index_advice", data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+    else:
+        query = "&".join(f"{key}={value}" for key, value in payload.items())
+        request = urllib.request.Request(f"{args.url}/index_advice?{query}")
+    with urllib.request.urlopen(request) as response:
+        body = json.loads(response.read().decode("utf-8"))
+
+    for entry in body.get("advice", []):
+        applied = "" if "applied" not in entry else (" -- applied" if entry["applied"] else f" -- failed: {entry['outcome']}")
+        print(f"{entry['statement']}  -- {entry['hits']} filters, selectivity {entry['selectivity']}{applied}")
+    if not body.get("advice"):
+        print("No index to propose.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import json
+from typing import Any, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+# The characters that end a number or a literal (true, false, null)
+DELIMITERS = WHITESPACE + ",:]}[{\""
+
+_decoder = json.JSONDecoder()
+
+
+class _ChunkReader:
+    """A growing text buffer over a file, read one chunk at a time."""
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # Where the buffer starts in the file, for the positions of errors:
+        # its offset, the newlines before it and the offset of the line it starts in
+        self.offset = 0
+        self.lines = 0
+        self.line_start = 0
+
+    def fill(self, size: Optional[int] = None) -> bool:
+        # Drop what has been consumed and append the next chunk (of size characters)
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        newline = self.buffer.rfind("\n", 0, self.pos)
+        if newline >= 0:
+            self.lines += self.buffer.count("\n", 0, self.pos)
+            self.line_start = self.offset + newline + 1
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def error(self, msg: str, pos: int) -> json.JSONDecodeError:
+        # A JSONDecodeError at pos of the buffer, with its position in the file
+        err = json.JSONDecodeError(msg, self.buffer, pos)
+        newline = self.buffer.rfind("\n", 0, pos)
+        err.pos = self.offset + pos
+        err.lineno = self.lines + self.buffer.count("\n", 0, pos) + 1
+        err.colno = err.pos - (self.offset + newline + 1 if newline >= 0 else self.line_start) + 1
+        err.args = (f"{msg}: line {err.lineno} column {err.colno} (char {err.pos})",)
+        return err
+
+    def peek(self, skip: str = WHITESPACE) -> Optional[str]:
+        # Return the next character that is not in skip, or None at the end of the file
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def grow(self) -> bool:
+        # Read as much again as the pending value holds, so a value spanning many chunks
+        # is decoded O(log n) times and the buffer is rebuilt O(log n) times, not once per chunk
+        return self.fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def truncated(self, err: json.JSONDecodeError) -> bool:
+        # Whether the error comes from the value running past the end of the buffer,
+        # rather than from a syntax error that more data cannot fix
+        if err.pos >= len(self.buffer) or err.msg.startswith("Unterminated string"):
+            return True
+        if err.msg.startswith("Invalid \\uXXXX escape"):
+            return err.pos + 6 > len(self.buffer)
+        # a number or a literal cut at the end of the buffer, e.g. "tr" of "true"
+        return not any(char in DELIMITERS for char in self.buffer[err.pos:])
+
+    def delimited(self, end: int) -> bool:
+        # Whether a delimiter follows end in the buffer; if something else comes first
+        # ("truex"), the syntax error is reported by what decodes the next value
+        if end < len(self.buffer) and self.buffer[end] in DELIMITERS:
+            return True
+        return any(char in DELIMITERS for char in self.buffer[end:])
+
+    def decode(self) -> Any:
+        # Decode one JSON value at the current position, reading more until it is complete
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as err:
+                if self.truncated(err) and self.grow():
+                    continue
+                raise self.error(err.msg, err.pos) from None
+            # A number or a literal is complete only once a delimiter or the end of the file
+            # follows it: "1." of "1.5" decodes as 1 when the buffer ends after the "."
+            if not isinstance(value, (dict, list, str)) and not self.delimited(end) and self.grow():
+                continue
+            self.pos = end
+            return value
+
+def iter_json_documents(file_path: str, limit: Optional[int] = None,
+                        chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    Read the documents of a JSON file incrementally.
+
+    A top-level array yields its elements, NDJSON yields one document per line
+    and a single top-level object yields itself. Reading stops after limit
+    documents, so only the part of the file that is needed is read.
+
+    :param file_path: Path to the JSON file.
+    :param limit: The maximum number of documents to read, or None for all of them.
+    :param chunk_size: The number of characters read at a time.
+    :return: An iterator of (layout, document) where layout is "array", "ndjson" or "object".
+    """
+    if limit is not None and limit <= 0:
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
+        reader = _ChunkReader(f, chunk_size)
+        first = reader.peek()
+        if first is None:
+            raise ValueError("JSON file is empty.")
+
+        count = 0
+        if first == "[":
+            reader.pos += 1
+            if reader.peek() == "]":
+                return
+            while True:
+                if reader.peek() is None:
+                    raise ValueError("JSON array is not terminated.")
+                yield "array", reader.decode()
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+                next_char = reader.peek()
+                if next_char == "]":
+                    return
+                if next_char is None:
+                    raise ValueError("JSON array is not terminated.")
+                if next_char != ",":
+                    raise reader.error("Expecting ',' delimiter", reader.pos)
+                reader.pos += 1
+                if reader.peek() == "]":
+                    raise reader.error("Expecting value", reader.pos)
+
+        document = reader.decode()
+        if reader.peek() is None:
+            # exactly one value in the file
+            yield "object", document
+            return
+        while True:
+            yield "ndjson", document
+            count += 1
+            if limit is not None and count >= limit:
+                return
+            if reader.peek() is None:
+                return
+            document = reader.decode()
+
+
+def read_json_documents(file_path: str, limit: Optional[int] = None) -> Tuple[Optional[str], List[Any]]:
+    """
+    Return the layout of a JSON file and up to limit of its documents.
+
+    :param file_path: Path to the JSON file.
+    :param limit: The maximum number of documents to read, or None for all of them.
+    :return: A tuple of (layout, documents); layout is None if the file holds an empty array.
+    """
+    layout = None
+    documents = []
+    for layout, document in iter_json_documents(file_path, limit):
+        documents.append(document)
+    return layout, documents
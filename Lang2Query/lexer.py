@@ -0,0 +1,52 @@
+import re
+from functools import lru_cache
+from typing import List, Tuple, Optional
+
+
+class CompiledLexer:
+    """
+    One master regular expression built from an ordered list of token rules.
+
+    Every rule becomes a named group of a single alternation, so a single
+    `match` call at a position tries the rules in the same order as the
+    original rule-by-rule loop and stops at the first rule that fits.
+    """
+    def __init__(self, token_rules: Tuple[Tuple[str, str], ...]):
+        self.token_rules = token_rules
+        # group name -> token type, the group names only need to be unique
+        self.group_types = {}
+        alternatives = []
+        for index, (token_type, pattern) in enumerate(token_rules):
+            group_name = f"T{index}"
+            self.group_types[group_name] = token_type
+            alternatives.append(f"(?P<{group_name}>{pattern})")
+        self.regex = re.compile("|".join(alternatives))
+
+    def match(self, input_text: str, pos: int) -> Tuple[Optional[str], Optional[re.Match]]:
+        """
+        Match the token that starts at the given position.
+
+        :param input_text: The natural language input.
+        :param pos: The position where the next token starts.
+        :return: A tuple of (token type, match object), or (None, None) if no rule fits.
+        """
+        match = self.regex.match(input_text, pos)
+        if not match:
+            return None, None
+        # the rule group is the outermost group, so it is always the last one closed
+        return self.group_types[match.lastgroup], match
+
+
+@lru_cache(maxsize=64)
+def _compile_token_rules(token_rules: Tuple[Tuple[str, str], ...]) -> CompiledLexer:
+    return CompiledLexer(token_rules)
+
+
+def compile_token_rules(token_rules: List[Tuple[str, str]]) -> CompiledLexer:
+    """
+    Return the compiled lexer for the token rules, reusing it for identical rules.
+
+    :param token_rules: The ordered list of (token type, pattern) pairs.
+    :return: The compiled lexer.
+    """
+    return _compile_token_rules(tuple(token_rules))
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from request_log import get_logger
+
+logger = get_logger("lookup_indexes")
+
+# Create a missing index on the foreignField of every $lookup before the pipeline runs
+AUTO_INDEX_LOOKUPS = os.environ.get("CHATDB_AUTO_INDEX_LOOKUPS", "1").lower() in ["1", "true", "yes"]
+# Seconds before a failed index listing or creation is tried again, doubled after every failure
+LOOKUP_INDEX_RETRY = float(os.environ.get("CHATDB_LOOKUP_INDEX_RETRY", "30"))
+LOOKUP_INDEX_RETRY_MAX = 3600.0
+
+
+def lookup_fields(plan: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Return the (foreign collection, foreignField) of every $lookup stage of an aggregate plan."""
+    if plan.get("operation") != "aggregate" or not plan.get("args"):
+        return []
+    joins = []
+    for stage in plan["args"][0]:
+        lookup = stage.get("$lookup") if isinstance(stage, dict) else None
+        if isinstance(lookup, dict) and "from" in lookup and "foreignField" in lookup:
+            joins.append((lookup["from"], lookup["foreignField"]))
+    return joins
+
+
+class LookupIndexes:
+    """
+    Makes sure the foreign side of every $lookup join is indexed.
+
+    The indexed fields of a collection are asked for once and remembered, so a
+    pipeline on known collections costs no round trip. The round trips run outside
+    the lock: while one request lists the indexes of a collection or builds an index,
+    the others run their joins without waiting for it. A failed listing or creation
+    is retried after a backoff, not on every query. Joins that still run without an
+    index (auto indexing is off, the index is being built, or creating it failed) are
+    counted and reported.
+    """
+    def __init__(self, auto: bool = AUTO_INDEX_LOOKUPS, retry: float = LOOKUP_INDEX_RETRY):
+        self.auto = auto
+        self.retry = retry
+        # collection -> fields that lead one of its indexes
+        self.known: Dict[str, Set[str]] = {}
+        self.unindexed: Dict[Tuple[str, str], int] = {}
+        # (collection, field) being created, or (collection, None) being listed
+        self.in_flight: Set[Tuple[str, Optional[str]]] = set()
+        # the same keys -> (failed attempts, monotonic time of the next attempt)
+        self.failures: Dict[Tuple[str, Optional[str]], Tuple[int, float]] = {}
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _claim(self, key: Tuple[str, Optional[str]], now: float) -> bool:
+        # Call with the lock held: whether this thread runs the round trip of key
+        if key in self.in_flight or self.failures.get(key, (0, 0.0))[1] > now:
+            return False
+        self.in_flight.add(key)
+        return True
+
+    def _finish(self, key: Tuple[str, Optional[str]], err: Optional[Exception] = None) -> None:
+        # Call with the lock held: release key and remember a failure with its backoff
+        self.in_flight.discard(key)
+        if err is None:
+            self.failures.pop(key, None)
+            return
+        attempts = self.failures.get(key, (0, 0.0))[0] + 1
+        delay = min(self.retry * 2 ** (attempts - 1), LOOKUP_INDEX_RETRY_MAX)
+        self.failures[key] = (attempts, time.monotonic() + delay)
+
+    def ensure(self, plan: Dict[str, Any], list_indexes: Callable[[str], Iterable[str]],
+               create_index: Callable[[str, str], Any]) -> List[Tuple[str, str]]:
+        """
+        Ensure indexes on the foreign fields of the $lookup stages of a plan.
+
+        :param plan: The query plan; plans without $lookup stages are left alone.
+        :param list_indexes: Called with a collection name, returns the fields that lead its indexes.
+        :param create_index: Called with a collection name and a field to create a single-field index.
+        :return: The (collection, field) joins that run without an index.
+        """
+        missing = []
+        for collection, field in lookup_fields(plan):
+            now = time.monotonic()
+            with self.lock:
+                fields = self.known.get(collection)
+                if fields is not None and field in fields:
+                    continue
+                listing = fields is None and self._claim((collection, None), now)
+            if listing:
+                try:
+                    listed = set(list_indexes(collection))
+                except Exception as err:
+                    logger.warning("Could not list the indexes of %s: %s", collection, err)
+                    with self.lock:
+                        self._finish((collection, None), err)
+                else:
+                    with self.lock:
+                        self.known.setdefault(collection, set()).update(listed)
+                        self._finish((collection, None))
+
+            with self.lock:
+                fields = self.known.get(collection)
+                if fields is not None and field in fields:
+                    continue
+                # without the list of its indexes, the collection is left alone until it can be listed
+                creating = self.auto and fields is not None and self._claim((collection, field), now)
+            if creating:
+                try:
+                    create_index(collection, field)
+                except Exception as err:
+                    logger.warning("Could not create an index on %s.%s: %s", collection, field, err)
+                    with self.lock:
+                        self._finish((collection, field), err)
+                else:
+                    with self.lock:
+                        self.known.setdefault(collection, set()).add(field)
+                        self.created += 1
+                        self._finish((collection, field))
+                    logger.info("Created an index on %s.%s for $lookup", collection, field)
+                    continue
+
+            with self.lock:
+                self.unindexed[(collection, field)] = self.unindexed.get((collection, field), 0) + 1
+            logger.info("$lookup on %s.%s runs without an index", collection, field)
+            missing.append((collection, field))
+        return missing
+
+    def forget(self, collection: str) -> None:
+        # The collection was dropped or replaced, its indexes are asked for again
+        with self.lock:
+            self.known.pop(collection, None)
+            for key in [key for key in self.failures if key[0] == collection]:
+                del self.failures[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "auto": self.auto,
+                "created": self.created,
+                "indexed": {collection: sorted(fields) for collection, fields in self.known.items()},
+                "unindexed_joins": {f"{collection}.{field}": count
+                                    for (collection, field), count in self.unindexed.items()},
+                "failed": {f"{collection}.{field}" if field else collection: attempts
+                           for (collection, field), (attempts, retry_at) in self.failures.items()},
+            }
@@ -0,0 +1,205 @@
+"""
+Per-stage timers, histograms and counters, exported in the Prometheus text format.
+
+Every stage of a request (schema load, lexing, parsing, semantic analysis, code
+generation, EXPLAIN, execution, serialization) runs under stage_timer, which adds
+its duration to the chatdb_stage_seconds histogram of the stage and, when it raises,
+counts an error for it. The durations of the current request are also summed in a
+ContextVar, for the "timings" block of /generate_query?timings=1. Work run in parallel
+leaves the request timings out and its caller adds the wall time of the whole, so a
+stage never adds up to more than the request took.
+
+The metrics are kept per process, like the caches.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Upper bounds (seconds) of the histogram buckets, from a lexer call to a slow query
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "chatdb_stage_seconds": "Time spent in each stage of a request.",
+    "chatdb_stage_errors_total": "Errors raised or returned by each stage.",
+    "chatdb_request_seconds": "Time spent answering a request, by route.",
+}
+
+_timings = contextvars.ContextVar("chatdb_timings", default=None)
+# The timings dict is shared by the copies of the request context, e.g. in a thread pool
+_timings_lock = threading.Lock()
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum; observe() is thread-safe."""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # the last slot counts the observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class MetricsRegistry:
+    """The histograms and counters of the process, by metric name and labels."""
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, int]] = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str, labels: Labels) -> Histogram:
+        series = self.histograms.get(name)
+        histogram = series.get(labels) if series is not None else None
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, {}).setdefault(labels, Histogram())
+        return histogram
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        self.histogram(name, labels).observe(value)
+
+    def increment(self, name: str, labels: Labels, amount: int = 1) -> None:
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def clear(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self) -> str:
+        """The histograms and counters in the Prometheus text format."""
+        with self.lock:
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        lines = []
+        for name in sorted(histograms):
+            lines.extend(_header(name, "histogram"))
+            for labels, histogram in sorted(histograms[name].items()):
+                counts, total, count = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total!r}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name in sorted(counters):
+            lines.extend(_header(name, "counter"))
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _header(name: str, metric_type: str):
+    if name in HELP:
+        yield f"# HELP {name} {HELP[name]}"
+    yield f"# TYPE {name} {metric_type}"
+
+
+registry = MetricsRegistry()
+
+
+class stage_timer:
+    """
+    Time a stage of the current request: with stage_timer("parse"): ast = parser.parse()
+
+    An exception leaving the block counts as an error of the stage and is raised again.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = time.perf_counter() - self.start
+        labels = (("stage", self.stage),)
+        registry.observe("chatdb_stage_seconds", labels, elapsed)
+        add_request_timing(self.stage, elapsed)
+        if exc_type is not None:
+            registry.increment("chatdb_stage_errors_total", labels)
+        return False
+
+
+def count_error(stage: str) -> None:
+    """Count an error a stage returned instead of raising, e.g. a failed query execution."""
+    registry.increment("chatdb_stage_errors_total", (("stage", stage),))
+
+
+def observe_request(route: str, seconds: float) -> None:
+    registry.observe("chatdb_request_seconds", (("route", route),), seconds)
+
+
+def start_timings() -> None:
+    """Start collecting the stage durations of a new request in the current context."""
+    _timings.set({})
+
+
+def add_request_timing(stage: str, seconds: float) -> None:
+    # a stage that runs several times in one request (e.g. explain in a batch) is summed
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def leave_request_timings() -> None:
+    """
+    Keep the stages timed from now on in the current context out of the request timings,
+    in a worker of parallel work whose caller adds its wall time with add_request_timing.
+    They are still observed in the histograms.
+    """
+    _timings.set(None)
+
+
+def request_timings() -> Optional[Dict[str, float]]:
+    """The stage durations of the current request so far, in milliseconds."""
+    timings = _timings.get()
+    if timings is None:
+        return None
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+def render_cache_stats(stats: Dict[str, Dict[str, Any]]) -> str:
+    """The hit/miss counters and sizes of cache_statistics() in the Prometheus text format."""
+    lines = []
+    for key, metric_type in [("hits", "counter"), ("misses", "counter"), ("evictions", "counter"),
+                             ("expired", "counter"), ("size", "gauge")]:
+        name = f"chatdb_cache_{key}" + ("_total" if metric_type == "counter" else "")
+        values = [(cache, cache_stats[key]) for cache, cache_stats in sorted(stats.items())
+                  if isinstance(cache_stats, dict) and isinstance(cache_stats.get(key), (int, float))]
+        if not values:
+            continue
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(f'{name}{{cache="{_escape(cache)}"}} {value}' for cache, value in values)
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,83 @@
+import ast
+import copy
+import re
+from functools import lru_cache
+from typing import Any, Dict, List
+
+# mongo shell method -> pymongo method
+MONGO_OPERATIONS = {
+    "find": "find",
+    "findOne": "find_one",
+    "aggregate": "aggregate",
+    "insertOne": "insert_one",
+    "insertMany": "insert_many",
+    "updateOne": "update_one",
+    "updateMany": "update_many",
+    "deleteOne": "delete_one",
+    "deleteMany": "delete_many",
+    "countDocuments": "count_documents",
+    "createIndex": "create_index",
+}
+SHELL_OPERATIONS = {pymongo_name: shell_name for shell_name, pymongo_name in MONGO_OPERATIONS.items()}
+
+# Operations that return a cursor of documents
+READ_OPERATIONS = ["find", "aggregate"]
+
+MONGO_QUERY_PATTERN = re.compile(r"^\s*db\.([A-Za-z_][\w-]*)\.(\w+)\((.*)\)\s*;?\s*$", re.DOTALL)
+
+
+def make_mongo_plan(collection: str, operation: str, *args: Any) -> Dict[str, Any]:
+    """
+    Build a structured MongoDB query plan.
+
+    :param collection: The name of the collection.
+    :param operation: The pymongo method, e.g. "find" or "aggregate".
+    :param args: The positional arguments of the method (filter, pipeline, documents, update).
+    :return: The plan {"collection": ..., "operation": ..., "args": [...]}.
+    """
+    if operation not in SHELL_OPERATIONS:
+        raise ValueError(f"Unsupported MongoDB operation: {operation}")
+    return {"collection": collection, "operation": operation, "args": list(args)}
+
+
+def format_mongo_plan(plan: Dict[str, Any]) -> str:
+    """Return the mongo shell form of a plan, e.g. db.city.find({'Name': {'$eq': 'Kabul'}})."""
+    arguments = ", ".join(repr(arg) for arg in plan["args"])
+    return f"db.{plan['collection']}.{SHELL_OPERATIONS[plan['operation']]}({arguments})"
+
+
+@lru_cache(maxsize=256)
+def _parse_mongo_query(nosql_query: str):
+    match = MONGO_QUERY_PATTERN.match(nosql_query)
+    if not match:
+        raise ValueError("Expected a query of the form db.<collection>.<operation>(...)")
+    collection, shell_operation, arguments = match.groups()
+    if shell_operation not in MONGO_OPERATIONS:
+        raise ValueError(f"Unsupported MongoDB operation: {shell_operation}")
+    try:
+        # Only Python literals are accepted, nothing is evaluated
+        args = ast.literal_eval(f"({arguments},)") if arguments.strip() else ()
+    except (ValueError, SyntaxError) as err:
+        raise ValueError(f"Invalid arguments for {shell_operation}: {err}")
+    return collection, MONGO_OPERATIONS[shell_operation], args
+
+
+def parse_mongo_query(nosql_query: str) -> Dict[str, Any]:
+    """
+    Turn the displayed form of a query back into a plan without evaluating it.
+
+    Parsed queries are cached, so executing the same query text again skips the parse.
+
+    :param nosql_query: e.g. "db.city.aggregate([{'$sort': {'CountryCode': -1}}])".
+    :return: The plan {"collection": ..., "operation": ..., "args": [...]}.
+    :raises ValueError: If the text is not a supported query.
+    """
+    collection, operation, args = _parse_mongo_query(nosql_query)
+    return {"collection": collection, "operation": operation, "args": list(args)}
+
+
+def plan_arguments(plan: Dict[str, Any]) -> List[Any]:
+    # Inserts add an _id to the documents they are given, so cached arguments are never passed as-is
+    if plan["operation"] in ["insert_one", "insert_many"]:
+        return copy.deepcopy(plan["args"])
+    return plan["args"]
@@ -2,22 +2,48 @@ import re
 from typing import List, Tuple, Dict, Any, Union
 import json, csv
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from execute_sql import execute_sql_query
-from execute_nosql import execute_nosql_query
+from execute_sql import execute_sql_query, stream_sql_query, fetch_sql_page
+from execute_nosql import execute_nosql_plan, execute_nosql_query, stream_nosql_query, fetch_nosql_page, lookup_indexes
+from identifier_trie import identifier_pattern
+from lexer import compile_token_rules
+from schema_cache import SchemaCache, SchemaEntry
+from columnar_cache import cached_csv_rows, cached_json_documents
+from mongo_plan import make_mongo_plan, format_mongo_plan
+from plan_cache import PlanCache, CompiledPlan, normalize_query_text
+from query_template import Placeholder, QueryTemplate, render_sql_literal, sql_value, template_key
+from result_stream import MAX_PAGE_SIZE, ndjson_lines, encode_page_token, decode_page_token
+from type_inference import CSV_SAMPLE_ROWS, infer_csv_column_types, infer_sql_type
+from sql_pool import SQL_POOL_SIZE
+from index_advisor import (ADVISOR_ALLOW_APPLY, ADVISOR_MAX_SELECTIVITY, ADVISOR_MIN_HITS, PredicateStats, QueryPredicates,
+                           advise, apply_advice)
+from query_explain import explain_cache, explain_compiled_query
+from compression import choose_encoding, compress_body, should_compress
+from request_log import current_request_id, get_logger, in_request_context, start_request
+from request_profile import profile_call, profile_mode, profiles
+from metrics import (add_request_timing, count_error, leave_request_timings, observe_request, registry, render_cache_stats,
+                     request_timings, stage_timer, start_timings)
+from concurrent.futures import ThreadPoolExecutor
 import random
+import time
 
-my_table_names = []
+logger = get_logger("my")
+
+try:
+    import orjson
+except ImportError:  # optional, jsonify uses the json module without it
+    orjson = None
 
 def process_table_names(file_paths):
-    global my_table_names
     my_table_names = []
     for path in file_paths:
         file_name_with_ext = os.path.basename(path)
         table_name = os.path.splitext(file_name_with_ext)[0]
         my_table_names.append(table_name)
-    print("Table names are: ", my_table_names)
+    logger.debug("Table names are: %s", my_table_names)
+    return my_table_names
 
 #词法分析模块
 # 定义 Token 类型 [The token is defined.]
@@ -29,36 +55,6 @@ class Token:
     def __repr__(self):
         return f"Token({self.type}, {self.value})"
 
-def infer_sql_type(value: Any) -> str:
-    # SQL Type Value
-    
-    if value is None or (isinstance(value, str) and value.strip() == ""):
-        return "NULL"
-    if isinstance(value, str) and value.lower() in ["true", "false"]:
-        return "BOOLEAN"
-    try:
-        if isinstance(value, str) and value.isdigit():
-            return "INTEGER"
-        float(value)
-        if "." in str(value):
-            return "REAL"
-    except ValueError:
-        pass
-    if isinstance(value, str) and value.startswith("[") and value.endswith("]"):
-        return "ARRAY"
-    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
-        return "JSON"
-    if isinstance(value, str):
-        import re
-        date_pattern = r"^\d{4}-\d{2}-\d{2}$"
-        if re.match(date_pattern, value):
-            return "DATE"
-        datetime_pattern = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$"
-        if re.match(datetime_pattern, value):
-            return "DATETIME"
-    return "TEXT"
-
-
 def infer_nosql_type(value: Any) -> str:
     # NoSQL Type Value
     if value is None or (isinstance(value, str) and value.strip() == ""):
@@ -107,6 +103,10 @@ def get_fields_and_first_two_rows_from_csv(file_path: str) -> Tuple[List[str], L
     :param file_path: Path to the CSV file.
     :return: A tuple containing a list of field names and a list of the first two rows as dictionaries.
     """
+    # An ingested file is read from its memory-mapped columnar cache
+    cached = cached_csv_rows(file_path, limit=2)
+    if cached is not None:
+        return cached
     with open(file_path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         fields = reader.fieldnames
@@ -130,39 +130,34 @@ def get_fields_and_first_two_rows_from_json(file_path: str) -> Tuple[List[str],
     :param file_path: Path to the JSON file.
     :return: A tuple containing a list of field names and a list of the first two rows as dictionaries.
     """
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        
-        if isinstance(data, dict):
-            # If the root is a dictionary, treat it as a single record
-            fields = list(data.keys())
-            rows = [data]  # Single record in JSON
-            return fields, rows[:2]  # Ensure compatibility with "first two rows" requirement
-        
-        elif isinstance(data, list):
-            # If the root is a list of dictionaries
-            if not data:
-                raise ValueError("JSON file is empty.")
-            
-            fields = list(data[0].keys())
-            rows = data[:2]  # Get the first two records
-            return fields, rows
-        
-        else:
+    # Only the first two documents are read from the file, or from its columnar cache
+    layout, data = cached_json_documents(file_path, limit=2)
+
+    if layout == "object":
+        if not isinstance(data[0], dict):
             raise ValueError("Unsupported JSON structure. Expected a dictionary or a list.")
+        # If the root is a dictionary, treat it as a single record
+        fields = list(data[0].keys())
+        rows = data  # Single record in JSON
+        return fields, rows[:2]  # Ensure compatibility with "first two rows" requirement
+
+    # If the root is a list of dictionaries or one dictionary per line
+    if not data:
+        raise ValueError("JSON file is empty.")
 
-# 全局变量
-example_tables = {}
+    fields = list(data[0].keys())
+    rows = data[:2]  # Get the first two records
+    return fields, rows
 
-def populate_example_tables(paths: List[str]) -> None:
+def populate_example_tables(paths: List[str]) -> Dict[str, Dict[str, Any]]:
     """
-    根据提供的路径列表调用之前的函数获取字段和前两行数据，并存储到全局变量 example_tables 中。
+    根据提供的路径列表调用之前的函数获取字段和前两行数据，并返回 example_tables。
+    [Return the fields and the first two rows of every file, keyed by table name.]
     """
-    global example_tables
-    example_tables = {}  # 清空 example_tables
+    example_tables = {}
     
     for path in paths:
-        print("Processing file:", path)
+        logger.debug("Processing file: %s", path)
         if path.endswith('.csv'):
             table_name = os.path.splitext(os.path.basename(path))[0]
             fields, rows = get_fields_and_first_two_rows_from_csv(path)
@@ -182,80 +177,73 @@ def populate_example_tables(paths: List[str]) -> None:
     
     if not example_tables:
         raise ValueError("No valid files provided to populate example tables.")
+    return example_tables
 
-def detect_field_types_from_csv(file_path: str) -> Dict[str, str]:
+def detect_field_types_from_csv(file_path: str, sample_rows: int = CSV_SAMPLE_ROWS, reservoir: bool = False) -> Dict[str, str]:
    # Detect Specific Field Types from CSV
-    with open(file_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        field_types = {field: None for field in reader.fieldnames}
-        first_row = next(reader, None)
-        if not first_row:
-            raise ValueError("CSV file is empty.")
-        for field, value in first_row.items():
-            field_types[field] = infer_sql_type(value)
-        return field_types
+    # The type of each column is inferred from a sample of rows and widened (INTEGER -> REAL -> TEXT),
+    # so a single empty or odd first value no longer decides the type of the whole column
+    column_types = infer_csv_column_types(file_path, sample_rows, reservoir)
+    field_types = {}
+    for field, (field_type, confidence) in column_types.items():
+        field_types[field] = field_type
+    return field_types
 
 
 def detect_field_types_from_json(file_path: str) -> Dict[str, str]:
     # Detect Specific Fields from JSON
     
-    with open(file_path, "r", encoding="utf-8") as f:
-        #data = [json.loads(line) for line in f if line.strip()]
-        data = json.load(f)
-        #print(data)
-        if isinstance(data, dict):
-            # Root is a dictionary
-            field_types = {}
-            for field, value in data.items():
-                field_types[field] = infer_nosql_type(value)
-            return field_types
-
-        elif isinstance(data, list):
-            # Root is a list
-            if not data:
-                raise ValueError("JSON file is empty.")
-            # Assuming the list contains dictionaries
-            field_types = {}
-            for field in data[0]:
-                if field == '_id':
-                    field_types[field] = "string"
-                    continue
-                sample_value = data[0][field]
-                field_types[field] = infer_nosql_type(sample_value)
-            return field_types        
-
-        else:
+    # Only the first document is read, so the size of the file does not matter
+    layout, data = cached_json_documents(file_path, limit=1)
+    #print(data)
+    if layout == "object":
+        if not isinstance(data[0], dict):
             raise ValueError("Unsupported JSON structure. Expected a dictionary or a list.")
-      
-#symbol_table: Dict[str, str] = {} 
-symbol_table: Dict[str, Dict[str, str]] = {}  # 支持多个表格的 symbol_table
+        # Root is a dictionary
+        field_types = {}
+        for field, value in data[0].items():
+            field_types[field] = infer_nosql_type(value)
+        return field_types
 
-def generate_separate_symbol_tables(paths: List[str]) -> str:
+    # Root is a list or one dictionary per line (NDJSON)
+    if not data:
+        raise ValueError("JSON file is empty.")
+    # Assuming the list contains dictionaries
+    field_types = {}
+    for field in data[0]:
+        if field == '_id':
+            field_types[field] = "string"
+            continue
+        sample_value = data[0][field]
+        field_types[field] = infer_nosql_type(sample_value)
+    return field_types
+
+def generate_separate_symbol_tables(paths: List[str]) -> Tuple[str, Dict[str, Dict[str, str]]]:
     """
     根据提供的路径列表生成 symbol_table，支持多个表。
-    返回数据库类型：SQL 或 NoSQL。
+    返回数据库类型：SQL 或 NoSQL，以及 symbol_table。
+    [Return the database type (SQL or NoSQL) and the symbol table of all tables.]
     """
-    global symbol_table
-    symbol_table = {}  # 清空 symbol_table
+    symbol_table = {}  # 支持多个表格的 symbol_table
     
     db_type = None  # 用于存储数据库类型
     for path in paths:
-        print("My current path is: ", path)
+        logger.debug("My current path is: %s", path)
         if path.endswith('.csv'):
             table_name = os.path.splitext(os.path.basename(path))[0]
             symbol_table[table_name] = detect_field_types_from_csv(path)
             db_type = "SQL" if db_type is None else db_type
         elif path.endswith('.json'):
             table_name = os.path.splitext(os.path.basename(path))[0]
-            print("My current table is: ", table_name)
+            logger.debug("My current table is: %s", table_name)
             symbol_table[table_name] = detect_field_types_from_json(path)
-            print("My cvurrent symbol table is: ", symbol_table[table_name])
+            logger.debug("My cvurrent symbol table is: %s", symbol_table[table_name])
             db_type = "NoSQL" if db_type is None else db_type
         else:
             raise ValueError(f"Unsupported file format: {path}")
     if not symbol_table:
         raise ValueError("No valid files provided to generate symbol table.")
-    return db_type  # 返回检测到的数据库类型
+    return db_type, symbol_table  # 返回检测到的数据库类型
 
 '''
 def generate_separate_symbol_tables(path: str) -> None:
@@ -272,98 +260,195 @@ def generate_separate_symbol_tables(path: str) -> None:
 '''
 
 # the rules for tokens:
-def generate_field_patterns(symbol_table):
+def field_names(symbol_table):
     # Extract all unique field names across all tables
     unique_fields = set()
     for table_fields in symbol_table.values():
         unique_fields.update(table_fields.keys())
-    # Escape the field names for regex patterns
-    escaped_fields = [re.escape(field) for field in unique_fields]
-    # Join the patterns with '|' to maintain the original return format
-    fields_pattern = "|".join(escaped_fields)
-    return fields_pattern
+    return unique_fields
+
+def generate_field_patterns(symbol_table):
+    # A trie of the field names: the longest name wins and a name never matches inside a longer word
+    return identifier_pattern(field_names(symbol_table))
 
 def generate_field_patterns2(table_selected):
-    escaped_fields = [re.escape(field) for field in table_selected]
-    fields_pattern = "|".join(escaped_fields)
-    return fields_pattern
-
-def insert_into_field(value):
-    print("The value to be added: ", value)
-    for i, rule in enumerate(TOKEN_RULES):
-        if rule[0] == "FIELD":
-            # 提取当前字段的正则表达式
-            current_fields_pattern = rule[1]
-            # 从现有正则表达式提取字段列表（假设是用 | 分隔）
-            current_fields = re.findall(r"\b\w+\b", current_fields_pattern)
-            # 合并现有字段和新的字段
-            updated_fields = sorted(set(current_fields+[value]))
-            # 重新生成正则表达式
-            updated_pattern = r"\b(" + "|".join(updated_fields) + r")\b"
-            # 更新规则
-            TOKEN_RULES[i] = ("FIELD", updated_pattern)
-            break
-    
+    return identifier_pattern(table_selected)
+
+def build_token_rules(symbol_table, table_names):
+    # The order matters: the first rule that matches at a position wins
+    return [
+        ("Explore", r"\b(explore|investigate|examine|inspect|analyze)"),
+        ("Example", r"\b(example)"),
+        ("KEYWORD", r"\b(search for|find|select|insert|add|append|create|put|write|store|include|populate|update|modify|edit|change|alter|refresh|adjust|correct|revise|replace|delete|remove|erase|clear|drop|destroy|truncate|discard|sum|count|avg|min|max|aggregate|generate)\b"),
+        ("RELATION", r"\b(equal to|greater than|less than|not equal to|greater than or equal to|less than or equal to|set|>=|<=|>|<|!=)\b"),  # 关系运算符[relational operators]
+        ("FIELD", generate_field_patterns(symbol_table)),  # 字段名[fields]  # Pending: change it into the specific fields
+        #("FIELD", r"\b(_id|shopifyId|title|descriptionHTML|handle|vendor|productType|tags|options|variants|images|createdAt|updatedAt|publishedAt)\b"),
+        ("LOGICAL_OPERATOR", r"\b(and|or|nor)\b"),  # 逻辑操作符[logical operators]
+        #("VALUE", r"(\d+|'.*?')"),  # 数值或字符串值[string or number]
+        #("AS", r"\b(as)\b"),
+        ("VALUE", r"(\d+|'.*?'|\".*?\")"),
+        ("AGGREGATION_OPERATOR", r"\b(join|group|sort|unwind|project|limit|skip|lookup|where)\b"),
+        ("GROUP_OPERATOR", r"\b(calculate|collect|list)\b"),
+        ("SORT_OPERATOR", r"\b(decreasingly|increasingly)\b"),
+        ("TABLE_NAME", generate_field_patterns2(table_names)),
+        ("WHITESPACE", r"\s+"),  # 空格（可以跳过） [whitespace]
+        ("INVALID", r".")  # 无效字符[invalid characters]
+    ]
+
+# Compiled queries are cached per schema, normalized input text and target,
+# query templates per schema, query shape and target
+plan_cache = PlanCache()
+template_cache = PlanCache()
+# How often each field is filtered on, for the index advisor
+predicate_stats = PredicateStats()
+query_predicates = QueryPredicates()
+
+def invalidate_compiled_plans(fingerprint):
+    plan_cache.invalidate(fingerprint)
+    template_cache.invalidate(fingerprint)
+    explain_cache.invalidate(fingerprint)
+
+# The schema of each file set is cached until one of the files changes,
+# the plans compiled against a dropped schema are dropped with it
+SCHEMA_CACHE_SIZE = 16
+schema_cache = SchemaCache(SCHEMA_CACHE_SIZE, on_invalidate=invalidate_compiled_plans)
+
+def build_schema_entry(file_paths, fingerprint):
+    table_names = process_table_names(file_paths)
+    db_type, symbol_table = generate_separate_symbol_tables(file_paths)
+    token_rules = tuple(build_token_rules(symbol_table, table_names))
+    return SchemaEntry(fingerprint, db_type, symbol_table, table_names, token_rules, compile_token_rules(token_rules))
+
+class CompilerContext:
+    """
+    The state one request compiles against, passed through the lexer and the semantic analyzer.
+
+    The symbol table and the table names come from the schema cache and are only read.
+    The token rules and the lexer belong to the request, because insert_into_field
+    extends the FIELD rule while lexing. Nothing is kept in module globals, so
+    concurrent requests (threads or worker processes) do not see each other's state.
+    """
+    def __init__(self, entry: SchemaEntry):
+        self.schema = entry
+        self.fingerprint = entry.fingerprint
+        self.db_type = entry.db_type
+        self.symbol_table = entry.symbol_table
+        self.table_names = list(entry.table_names)
+        self.token_rules = list(entry.token_rules)
+        self.lexer = entry.lexer
+        # filled by the "explore" command
+        self.example_tables = {}
+        # field names added by insert_into_field
+        self.inserted_fields = []
+
+    def insert_into_field(self, value):
+        logger.debug("The value to be added: %s", value)
+        self.inserted_fields.append(value)
+        for i, rule in enumerate(self.token_rules):
+            if rule[0] == "FIELD":
+                # 合并现有字段和新的字段 [the fields of the schema and the added ones]
+                updated_fields = field_names(self.symbol_table) | set(self.inserted_fields)
+                # 更新规则 [the trie pattern is rebuilt, or reused for the same fields]
+                self.token_rules[i] = ("FIELD", identifier_pattern(updated_fields))
+                break
+        # the FIELD rule has changed, so the master pattern is rebuilt
+        self.lexer = compile_token_rules(self.token_rules)
+
+    def fork(self):
+        """A fresh context on the same schema, for compiling another query without reloading it."""
+        return CompilerContext(self.schema)
+
+    def __repr__(self):
+        return f"CompilerContext({self.db_type}, {self.table_names})"
+
+def load_schema(file_paths):
+    """
+    Load the symbol table, the table names and the token rules for the files.
+    Repeated requests on unchanged files are answered from the schema cache without any file I/O.
+    Return a new CompilerContext for the request; its db_type is SQL or NoSQL.
+    """
+    entry = schema_cache.get(file_paths, build_schema_entry)
+    return CompilerContext(entry)
+
 
 # the construction of lexical analysus
-def lexical_analysis(input_text: str) -> List[Token]:
+def lexical_analysis(input_text: str, context: CompilerContext) -> List[Token]:
     # tokens array to extract each words based on the token rules defined above
     tokens = []
     # start at position 0
     pos = 0
     my_match = []
+    # all token rules are compiled once into a single master pattern
+    lexer = context.lexer
     # iterate your input one by one
     while pos < len(input_text):
 
         # match the input text with the token rules
-        match = None
-
         #The format of the entry at token_rules can be explained as (token type, pattern) 
-        for token_type, pattern in TOKEN_RULES:
-            # compile the pattern
-            regex = re.compile(pattern)  # e.g. Search for, Look Up, etc.
-            match = regex.match(input_text, pos) # match the input text with the pattern
-
-            # If it is fitted, a total of three possibilities will be considered in advance
-            if match:
-               
-
-                # whitespace
-                if token_type == "WHITESPACE":  # whitespace
-                    pos = match.end()
-                    break
-                # invalid
-                elif token_type == "INVALID":  # Any redundant characters can be ignored
-                    #print(f"Warning: Invalid character '{match.group(0)}' at position {pos}")
-                    pos = match.end()
-                    break
-                elif token_type =='VALUE':
-                    if tokens:
-                        last = tokens[len(tokens) - 1]
-                        if last.type == "GROUP_OPERATOR" and not match.group().isdigit():
-                            print("Match.groups: ",match.group())
-                            extracted_value = match.group().strip('"')
-                            insert_into_field(extracted_value)
-                            print("My updated tokens are: ", TOKEN_RULES)
-                    token_value = match.group(0)
-                    my_match.append(token_value)
-                    tokens.append(Token(token_type, token_value))
-                    pos = match.end()
-                    break
-                # the rest of the scenarios
-                else:
-                    # The rest of the scenarios
-                    token_value = match.group(0)
-                    my_match.append(token_value)
-                    tokens.append(Token(token_type, token_value))
-                    pos = match.end()
-                    break
+        token_type, match = lexer.match(input_text, pos)
+
         # The position is not found
         if not match:
             raise SyntaxError(f"Illegal character at position {pos}: {input_text[pos]}")
 
+        # If it is fitted, a total of three possibilities will be considered in advance
+        # whitespace
+        if token_type == "WHITESPACE":  # whitespace
+            pos = match.end()
+        # invalid
+        elif token_type == "INVALID":  # Any redundant characters can be ignored
+            #print(f"Warning: Invalid character '{match.group(0)}' at position {pos}")
+            pos = match.end()
+        elif token_type =='VALUE':
+            if tokens:
+                last = tokens[len(tokens) - 1]
+                if last.type == "GROUP_OPERATOR" and not match.group().isdigit():
+                    logger.debug("Match.groups: %s", match.group())
+                    extracted_value = match.group().strip('"')
+                    context.insert_into_field(extracted_value)
+                    logger.debug("My updated tokens are: %s", context.token_rules)
+                    lexer = context.lexer
+            token_value = match.group(0)
+            my_match.append(token_value)
+            tokens.append(Token(token_type, token_value))
+            pos = match.end()
+        # the rest of the scenarios
+        else:
+            # The rest of the scenarios
+            token_value = match.group(0)
+            my_match.append(token_value)
+            tokens.append(Token(token_type, token_value))
+            pos = match.end()
+
     return tokens
 
+# Verbs of the queries whose values can be lifted into a template
+SELECT_VERBS = ['search for', 'look for', 'get', 'retrieve', 'find', 'select', 'query', 'fetch', 'read', 'access', 'filter', 'extract', 'look up', 'match']
+UPDATE_VERBS = ['update', 'modify', 'set']
+DELETE_VERBS = ['delete', 'delete from', 'remove', 'erase']
+
+def extract_query_template(tokens: List[Token]):
+    """
+    Lift the values of a select, update or delete query out of its token stream.
+
+    Every VALUE token right after a RELATION token (conditions and SET pairs) is replaced
+    by a placeholder; these values never change how the query is parsed.
+    Return (template tokens, lifted values), or None if the query has no template form.
+    """
+    if not tokens or tokens[0].type != "KEYWORD" or tokens[0].value.lower() not in SELECT_VERBS + UPDATE_VERBS + DELETE_VERBS:
+        return None
+    template_tokens = []
+    values = []
+    for i, token in enumerate(tokens):
+        if token.type == "VALUE" and i > 0 and tokens[i - 1].type == "RELATION":
+            template_tokens.append(Token("VALUE", Placeholder(len(values))))
+            values.append(token.value)
+        else:
+            template_tokens.append(token)
+    if not values:
+        return None
+    return template_tokens, values
+
 #AST Type
 class ASTNode:
     """The node for AST Tree"""
@@ -406,7 +491,7 @@ class Parser:
 
         # check the token type and its expected type
         # for instance, ("FIELD", "AGE")
-        print(f"Test: Current Token -> {token}, Expected -> {expected_type}")
+        logger.debug("Test: Current Token -> %s, Expected -> %s", token, expected_type)
 
         # If it isn't a token, return the syntax error
         if token is None:
@@ -414,7 +499,7 @@ class Parser:
         
         # If the token type is found, but its corresponding type does not match the current type
         if expected_type and token.type != expected_type:
-            print(f"Debug: Current Token -> {token}, Expected -> {expected_type}")
+            logger.debug("Debug: Current Token -> %s, Expected -> %s", token, expected_type)
             raise SyntaxError(f"Expected {expected_type} but got {token.type}.")
         
         # go to the next toke
@@ -424,25 +509,25 @@ class Parser:
 
     def parse(self):
         token = self.current_token()
-        print("my current token is: ", token)
+        logger.debug("my current token is: %s", token)
         if token is None:
             raise SyntaxError("No input to parse.")
         if token.type != "KEYWORD":
             raise SyntaxError(f"Expected a KEYWORD at the beginning, but got {token.type}")
         verb = token.value.lower()
-        if verb in ['search for', 'look for', 'get', 'retrieve', 'find', 'select', 'query', 'fetch', 'read', 'access', 'filter', 'extract', 'look up', 'match']:
+        if verb in SELECT_VERBS:
             return self.parse_select_query()
         elif verb in ['insert into', 'add', 'create', 'insert']:
             return self.parse_insert_query()
-        elif verb in ['update', 'modify', 'set']:
-            print("updated")
+        elif verb in UPDATE_VERBS:
+            logger.debug("updated")
             return self.parse_update_query()
-        elif verb in ['delete', 'delete from', 'remove', 'erase']:
+        elif verb in DELETE_VERBS:
             return self.parse_delete_query()
         elif verb in ['group by', 'aggregate', 'sum', 'count', 'avg', 'min', 'max', 'distinct', 'join', 'group', 'sort', 'unwind', 'project', 'limit', 'skip', 'lookup', 'collect', 'list', 'calculate']:
             return self.parse_aggregate_query()
         elif verb in ['generate']:
-            print("generate in SQL")
+            logger.debug("generate in SQL")
             return self.parse_generate_query()
         else:
             raise SyntaxError(f"Unknown operation: {verb}")
@@ -496,8 +581,8 @@ class Parser:
         #3 finish
         verb_node = self.consume("KEYWORD")  # update
         table_node = self.consume("TABLE_NAME")  # field name
-        print("My verb is: ", verb_node)
-        print("My table is: ", table_node)
+        logger.debug("My verb is: %s", verb_node)
+        logger.debug("My table is: %s", table_node)
         # Expect 'set'
         if self.current_token() and self.current_token().value.lower() == 'set':
             self.consume("RELATION")  # Consume 'set'
@@ -511,9 +596,9 @@ class Parser:
         if self.current_token() and self.current_token().value.lower() == 'where':
             self.consume("RELATION")  # Consume 'where'
             condition_node = self.condition()
-        print("condition node")
-        print(condition_node)
-        print("condition node")
+        logger.debug("condition node")
+        logger.debug("%s", condition_node)
+        logger.debug("condition node")
         '''
         return ASTNode("UPDATE_QUERY", [verb_node, table_node, set_clause, condition_node])
 
@@ -571,8 +656,8 @@ class Parser:
         while self.current_token() and self.current_token().type == "AGGREGATION_OPERATOR":
             operator = self.consume("AGGREGATION_OPERATOR")
             stage = operator.value.lower()
-            print("my current aggregation operator: ", operator)
-            print("my stage is: ", stage)
+            logger.debug("my current aggregation operator: %s", operator)
+            logger.debug("my stage is: %s", stage)
             # SQL operation
             if stage == "join":
                 foreign_collection =  self.consume("TABLE_NAME").value
@@ -636,18 +721,18 @@ class Parser:
         return ASTNode("AGGREGATION_PIPELINE", value=local_collection, children=pipeline)
 
     def parse_generate_query(self):
-        print("Enter the function: ")
+        logger.debug("Enter the function: ")
         pipeline = []
         verb_node = self.consume("KEYWORD")
         local_collection = self.consume("TABLE_NAME").value
         select_items = []
         pipeline.append(f"FROM {local_collection}")
         while self.current_token() and self.current_token().type == "AGGREGATION_OPERATOR":
-            print("Enter the aggreation in SQL")
+            logger.debug("Enter the aggreation in SQL")
             operator = self.consume("AGGREGATION_OPERATOR")
             stage = operator.value.lower()
-            print("my current aggregation operator: ", operator)
-            print("my stage is: ", stage)
+            logger.debug("my current aggregation operator: %s", operator)
+            logger.debug("my stage is: %s", stage)
             # SQL operation
             if stage == "join":
                 foreign_collection =  self.consume("TABLE_NAME").value
@@ -775,14 +860,14 @@ class SemanticAnalyzer:
         
         # If my result type is query, then I will analyze the query.
         if ast.type == "QUERY" or ast.type == "SELECT_QUERY" or ast.type == "DELETE_QUERY" or ast.type == "INSERT_QUERY" or ast.type == "UPDATE_QUERY" or ast.type == "AGGREGATION_PIPELINE" or ast.type == "GENERATE_PIPELINE":
-            print("It is Query.")
+            logger.debug("It is Query.")
             return self.analyze_query(ast)
         else:
             raise SemanticError(f"Unsupported AST node type: {ast.type}")
     
     # start from the root of the AST, both verb and conditions are examined.
     def analyze_query(self, node):
-        print("The node at analyze_query is: ", node)
+        logger.debug("The node at analyze_query is: %s", node)
         if node.type != "AGGREGATION_PIPELINE" and node.type != "GENERATE_PIPELINE":
             """Analyze the root query node based on SQL and NoSQL"""
             for child in node.children:
@@ -800,7 +885,7 @@ class SemanticAnalyzer:
 
     # For multiple conditions, each individual condition is examined properly.
     def analyze_condition(self, node, table_name):
-        print("The node at analyze_condition method is: ", node)
+        logger.debug("The node at analyze_condition method is: %s", node)
         """check the condition node"""
         for child in node.children:
             if child.type == "SINGLE_CONDITION":
@@ -814,7 +899,7 @@ class SemanticAnalyzer:
     
     # Each single condition is checked precisely.
     def analyze_single_condition(self, node, table_name):
-        print("The node analyzed: ", node)
+        logger.debug("The node analyzed: %s", node)
         """examine multiple conditions"""
         field_node = node.children[0]
         relation_node = node.children[1]
@@ -828,7 +913,7 @@ class SemanticAnalyzer:
        
         # If the field is not in the symbol table, it is required to raise an error.
         my_check=False
-        for table_name, fields in symbol_table.items():
+        for table_name, fields in self.symbol_table.items():
             if field in fields:
                 my_check=True
                 break
@@ -846,9 +931,10 @@ class SemanticAnalyzer:
         #print("My value is: " + value)
 
         # If both of them do not match, a semantic error will be raised.
-        if not self.check_type_match(expected_type, value):
+        # The value of a template is only known when it is bound
+        if not isinstance(value, Placeholder) and not self.check_type_match(expected_type, value):
             #raise SemanticError(f"Value '{value}' does not match the expected type '{expected_type}' for field '{field}' in '{self.target}'.")
-            print(f"Value '{value}' does not match the expected type '{expected_type}' for field '{field}' in '{self.target}'.")
+            logger.debug("Value '%s' does not match the expected type '%s' for field '%s' in '%s'.", value, expected_type, field, self.target)
 
         # relational operator
         relation = relation_node.value
@@ -918,6 +1004,11 @@ class CodeGenerator:
         if target not in ["SQL", "NoSQL"]:
             raise ValueError("Target must be 'SQL' or 'NoSQL'")
         self.target = target
+        # The placeholder behind each %s of the generated SQL, in order
+        self.param_slots = []
+        # The (table, field, operator) of every condition, for the index advisor
+        self.table_name = None
+        self.predicates = []
      
      # It's time to generate the query based on Abstract Syntax Tree
      # PENDING: The name of the table needs to be modified based on the table name.
@@ -954,6 +1045,7 @@ class CodeGenerator:
             return my_query + ";" 
         
         table_name=ast.children[1].value
+        self.table_name = table_name
         #condition_node = next(child for child in ast.children if child.type == "CONDITION")
         if ast.type == "SELECT_QUERY":
             #columns = kwargs.get("columns", "*")
@@ -1004,7 +1096,8 @@ class CodeGenerator:
             updates = {}
             for update_pair in set_clause_node.children:
                 field_node, value_node = update_pair.children
-                updates[field_node.value] = value_node.value.strip("'\"")  # Remove quotes
+                # the quotes are kept, they tell a string from a number
+                updates[field_node.value] = value_node.value
 
             # Process WHERE conditions
             
@@ -1024,7 +1117,7 @@ class CodeGenerator:
                 if index != 0 and index != updates_length - 1:
                     query += ','
 
-                query += f'{key} = {updates[key]}'
+                query += f'{key} = {self.sql_value(updates[key], set_value=True)}'
                 index += 1
                 
 
@@ -1067,23 +1160,27 @@ class CodeGenerator:
     # Pending: implement various kinds of NoSQL queries
     #          Solve the question based on the NoSQL query
     def generate_mongo(self, ast):
-        print("my generate ast tree: ", ast)
+        # The string form is only for display, the executor runs the structured plan
+        return format_mongo_plan(self.generate_mongo_plan(ast))
+
+    def generate_mongo_plan(self, ast):
+        """Build the structured plan {collection, operation, args} that execute_nosql_plan dispatches to pymongo."""
+        logger.debug("my generate ast tree: %s", ast)
         if ast.type == "AGGREGATION_PIPELINE":
-            return f"db.{ast.value}.aggregate({ast.children})"
+            return make_mongo_plan(ast.value, "aggregate", list(ast.children))
         
         
         table_name=ast.children[1].value
+        self.table_name = table_name
        
         if ast.type == "SELECT_QUERY":
             # finish
             conditions = self.traverse_conditions(ast, for_sql=False)
            
             query=conditions[0]
-            print(f"search: {query}")
+            logger.debug("search: %s", query)
             
-            mongo_query = f"db.{table_name}.find({query})"
-
-            return mongo_query
+            return make_mongo_plan(table_name, "find", query)
         elif ast.type == "INSERT_QUERY":
             content_node = next(child for child in ast.children if child and child.type == "CONTENT")
             # finish
@@ -1092,10 +1189,9 @@ class CodeGenerator:
             if content_node:
                 contents = self.traverse_contents(content_node, for_sql=False)
                 query = contents
-            insert_query = f"db.{table_name}."
-            insert_query += "insertMany" if len(query)>1 else "insertOne"
-            insert_query += f"({query})"
-            return insert_query
+            if len(query)==1:
+                return make_mongo_plan(table_name, "insert_one", query[0])
+            return make_mongo_plan(table_name, "insert_many", query)
             '''
             documents = kwargs.get("documents", [])
             if not documents:
@@ -1116,7 +1212,7 @@ class CodeGenerator:
             updates = {}
             for update_pair in set_clause_node.children:
                 field_node, value_node = update_pair.children
-                updates[field_node.value] = value_node.value.strip("'\"")  # Remove quotes
+                updates[field_node.value] = self.unquote(value_node.value)  # Remove quotes
 
             # Process WHERE conditions
             query = {}
@@ -1125,29 +1221,21 @@ class CodeGenerator:
                 query = conditions[0]
                 
             update_many = True
-            update_query = f"db.{table_name}."
-            update_query += "updateMany" if update_many else "updateOne"
-            update_query += f"({query}, {{'$set': {updates}}})"
-            #update_query += f"({query}, {'$set': {updates}});"
-            return update_query
+            return make_mongo_plan(table_name, "update_many" if update_many else "update_one", query, {'$set': updates})
         
         elif ast.type == "DELETE_QUERY":
             #finish
             condition_node = next((child for child in ast.children if child and child.type == "CONDITION"), None)
-            print("The condition node for delete is: ", condition_node)
+            logger.debug("The condition node for delete is: %s", condition_node)
             query = {}
             if condition_node:
                 conditions = self.traverse_conditions(condition_node, for_sql=False)
                 query = conditions[0]
-            print("The result for delete is: ", query)
+            logger.debug("The result for delete is: %s", query)
             #delete_many = kwargs.get("delete_many", False)
             #query = {"$and": conditions} if len(conditions) > 1 else conditions[0]
-            delete_query = f"db.{table_name}."
             #delete_query += "deleteMany" if delete_many else "deleteOne"
-            delete_query += "deleteMany"
-            delete_query += f"({query}"
-            #delete_query += f"({json.dumps(query)};"
-            return delete_query
+            return make_mongo_plan(table_name, "delete_many", query)
         
         # elif ast.type == "AGGREGATE_QUERY":
         #     pipeline = []
@@ -1185,13 +1273,14 @@ class CodeGenerator:
                 value = node.children[i].children[2].value
                 if for_sql:
                     # If it is SQL, convert it into SQL
-                    if isinstance(value, str) and not value.isdigit():
-                        value = f"'{value}'"
+                    value = self.sql_value(value)
                     sql_relation = self.map_sql_operator(relation)
+                    self.predicates.append((self.table_name, field, sql_relation))
                     conditions.append(f"{field} {sql_relation} {value}")
                 else:
                     # If it is noSQL, convert it into noSQL
                     mongo_operator = self.map_mongo_operator(relation)
+                    self.predicates.append((self.table_name, field, mongo_operator))
                     conditions.append({ field: { mongo_operator: value } })
             # logical operator: and, or, nor
             elif node.children[i].type == "LOGICAL_OPERATOR":
@@ -1270,6 +1359,20 @@ class CodeGenerator:
         else:
             return nosql_docs
 
+    def unquote(self, value):
+        if isinstance(value, Placeholder):
+            return value.strip_quotes()
+        return value.strip("'\"")
+
+    def sql_value(self, value, set_value=False):
+        # A placeholder becomes a %s bind parameter, any other value is inlined as it would be bound
+        if isinstance(value, Placeholder):
+            self.param_slots.append(value.strip_quotes() if set_value else value)
+            return "%s"
+        if not isinstance(value, str):
+            return value
+        return render_sql_literal(sql_value(value, set_value))
+
     def map_sql_operator(self, relation):
         return {
             "equal to": "=",
@@ -1290,19 +1393,21 @@ class CodeGenerator:
             "less than or equal to": "$lte"
         }.get(relation.lower(), relation)
 
-def my_execute_query(input, files):
+def my_execute_query(input, files, context=None):
+    # (generated query, target), or ({"error": ...}, status) like compile_query; plain values,
+    # as it also runs outside a Flask app context (batch threads, the ASGI app)
     input_query = input
-    print("My input query is: ", input_query)
+    logger.debug("My input query is: %s", input_query)
     file_paths = files
     if not input_query:
-        return jsonify({"error": "The input query is required."}, 400)
+        return {"error": "The input query is required."}, 400
     
     # # change the name to file_paths based on the variable file_paths
     # if not nosql_file_paths:
     #     return jsonify({"error": "The file paths are required."}, 400)
     
     if not file_paths:
-        return jsonify({"error": "The file paths are required."}, 400)
+        return {"error": "The file paths are required."}, 400
     
     # if not file_paths:
     #     return jsonify({"error": "The file paths are required."}, 400)
@@ -1312,140 +1417,144 @@ def my_execute_query(input, files):
     
     #process_table_names(nosql_file_paths)
     
-    process_table_names(file_paths)
+    # the symbol table, table names and token rules are served from the schema cache,
+    # or come with the context of the caller
     try:
         # target = generate_separate_symbol_tables(nosql_file_paths)
-        target = generate_separate_symbol_tables(file_paths)
+        if context is None:
+            with stage_timer("schema"):
+                context = load_schema(file_paths)
+        target = context.db_type
     except ValueError as e:
-        return jsonify({"error": f"Error loading symbol table: {e}"}, 400)
+        return {"error": f"Error loading symbol table: {e}"}, 400
 
-    # Step 3: Define token rules used to analyze each process
-    global TOKEN_RULES
-    TOKEN_RULES = [
-        ("Explore", r"\b(explore|investigate|examine|inspect|analyze)"),
-        ("Example", r"\b(example)"),
-        ("KEYWORD", r"\b(search for|find|select|insert|add|append|create|put|write|store|include|populate|update|modify|edit|change|alter|refresh|adjust|correct|revise|replace|delete|remove|erase|clear|drop|destroy|truncate|discard|sum|count|avg|min|max|aggregate|generate)\b"),
-        ("RELATION", r"\b(equal to|greater than|less than|not equal to|greater than or equal to|less than or equal to|set|>=|<=|>|<|!=)\b"),  # 关系运算符[relational operators]
-        ("FIELD", generate_field_patterns(symbol_table)),  # 字段名[fields]  # Pending: change it into the specific fields
-        #("FIELD", r"\b(_id|shopifyId|title|descriptionHTML|handle|vendor|productType|tags|options|variants|images|createdAt|updatedAt|publishedAt)\b"),
-        ("LOGICAL_OPERATOR", r"\b(and|or|nor)\b"),  # 逻辑操作符[logical operators]
-        #("VALUE", r"(\d+|'.*?')"),  # 数值或字符串值[string or number]
-        #("AS", r"\b(as)\b"),
-        ("VALUE", r"(\d+|'.*?'|\".*?\")"),
-        ("AGGREGATION_OPERATOR", r"\b(join|group|sort|unwind|project|limit|skip|lookup|where)\b"),
-        ("GROUP_OPERATOR", r"\b(calculate|collect|list)\b"),
-        ("SORT_OPERATOR", r"\b(decreasingly|increasingly)\b"),
-        ("TABLE_NAME", generate_field_patterns2(my_table_names)),
-        ("WHITESPACE", r"\s+"),  # 空格（可以跳过） [whitespace]
-        ("INVALID", r".")  # 无效字符[invalid characters]
-    ]
+    # Step 3: The token rules used to analyze each process are set up by load_schema
     #note: there is where in the AGGREGATION_OPERATOR
 
     # Step 4: Lexcial Analysis
-    tokens = lexical_analysis(input_query)
-    print("My tokens are: ", tokens)
+    with stage_timer("lex"):
+        tokens = lexical_analysis(input_query, context)
+    logger.debug("My tokens are: %s", tokens)
 
     # Step 5: Parsing
     parser = Parser(tokens)
     try:
-        ast = parser.parse()
-        print("My AST is: ", ast)
+        with stage_timer("parse"):
+            ast = parser.parse()
+        logger.debug("My AST is: %s", ast)
     except SyntaxError as e:
-        print("My error is: ", e)
-        return jsonify({"error": f"Parsing error: {e}"}, 400)
+        logger.debug("My error is: %s", e)
+        return {"error": f"Parsing error: {e}"}, 400
     
     
     # Step 6: Semantic Analysis
-    analyzer = SemanticAnalyzer(symbol_table, target)
+    analyzer = SemanticAnalyzer(context.symbol_table, target)
     try:
-        analyzer.analyze(ast)
-        print("My analyzer is: ", analyzer)
+        with stage_timer("analyze"):
+            analyzer.analyze(ast)
+        logger.debug("My analyzer is: %s", analyzer)
     except SemanticError as e:
-        print("My error is: ", e)
-        return jsonify({"error": f"Semantic error: {e}"}, 400)
+        logger.debug("My error is: %s", e)
+        return {"error": f"Semantic error: {e}"}, 400
     
     # Step 7: Code Generator
     generator = CodeGenerator(target)
     try:
-        if target == 'SQL':
-            result = generator.generate_sql(ast)
-        elif target == 'NoSQL':
-            result = generator.generate_mongo(ast)
-        print("My result is: ", result)
+        with stage_timer("generate"):
+            if target == 'SQL':
+                result = generator.generate_sql(ast)
+            elif target == 'NoSQL':
+                result = generator.generate_mongo(ast)
+        logger.debug("My result is: %s", result)
     except ValueError as e:
-        print("My error is: ", e)
-        return jsonify({"error": f"Code generation error: {e}"}, 400)
+        logger.debug("My error is: %s", e)
+        return {"error": f"Code generation error: {e}"}, 400
     return result,target
 
-def generate_example_query(example_value, task_number, my_target, file_paths):
-    print(f"my task number {task_number}")
-    print(f"example_value{example_value}")
+def example_sentences(example_value, task_number, my_target, context, rng=random):
+    """
+    Build the natural language examples of generate_example_query on random tables and fields.
+
+    :param example_value: "join", "group", "sort", "limit" or "where" (task 3).
+    :param task_number: 2 builds one example of every kind, 3 only the one of example_value.
+    :param rng: The random number generator, seeded by callers that need a repeatable corpus.
+    :return: (the kind of each example, the examples).
+    """
     my_input=[]
     my_type=[]
     #my_table_random=my_table_names[random.randint(0,len(my_table_names)-1)]
     #myfield=symbol_table[table_name]
-    mytable=my_table_names
+    mytable=context.table_names
+    symbol_table=context.symbol_table
     myvalue=["aaa","bbb","ccc","ddd","eee","fff","ggg","hhh","iii","jjj","kkk","lll","mmm"]
-    t0=random.choice(mytable)
-    t1=random.choice(mytable)
-    t2=random.choice(mytable)
+    t0=rng.choice(mytable)
+    t1=rng.choice(mytable)
+    t2=rng.choice(mytable)
     while t1==t0 and len(mytable)>=2:
-        print("t1 "+t1)
-        t1=random.choice(mytable)
+        logger.debug("t1 %s", t1)
+        t1=rng.choice(mytable)
     while (t2==t0 or t2==t1) and len(mytable)>=3:
-        print("t2 "+t2)
-        t2=random.choice(mytable)
+        logger.debug("t2 %s", t2)
+        t2=rng.choice(mytable)
     if task_number==2 or example_value == "join":
-        print("t0:"+t0)
-        print("t1: "+t1)
-        print("field: "+random.choice(list(symbol_table[t0].keys())))
+        logger.debug("t0:%s", t0)
+        logger.debug("t1: %s", t1)
+        logger.debug("field: %s", rng.choice(list(symbol_table[t0].keys())))
 
         my_type.append("join")
         if my_target== 'SQL':
-            my_input.append(f"generate a query in Mysql on the {t0} to join the {t1} table on {random.choice(list(symbol_table[t0].keys()))} and {random.choice(list(symbol_table[t1].keys()))}. Later, join the {t2} table on {random.choice(list(symbol_table[t0].keys()))} and {random.choice(list(symbol_table[t2].keys()))}, then project only the {random.choice(list(symbol_table[t0].keys()))} in {t0}.")
+            my_input.append(f"generate a query in Mysql on the {t0} to join the {t1} table on {rng.choice(list(symbol_table[t0].keys()))} and {rng.choice(list(symbol_table[t1].keys()))}. Later, join the {t2} table on {rng.choice(list(symbol_table[t0].keys()))} and {rng.choice(list(symbol_table[t2].keys()))}, then project only the {rng.choice(list(symbol_table[t0].keys()))} in {t0}.")
         else:
-            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages: join the {t1} collection on {random.choice(list(symbol_table[t0].keys()))} and {random.choice(list(symbol_table[t1].keys()))}, aliasing the results as \"{random.choice(myvalue)}\". Later, join the {t2} collection on {random.choice(list(symbol_table[t0].keys()))} and {random.choice(list(symbol_table[t2].keys()))}, aliasing the results as \"{random.choice(myvalue)}\"")
-        print("join")
+            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages: join the {t1} collection on {rng.choice(list(symbol_table[t0].keys()))} and {rng.choice(list(symbol_table[t1].keys()))}, aliasing the results as \"{rng.choice(myvalue)}\". Later, join the {t2} collection on {rng.choice(list(symbol_table[t0].keys()))} and {rng.choice(list(symbol_table[t2].keys()))}, aliasing the results as \"{rng.choice(myvalue)}\"")
+        logger.debug("join")
     if task_number==2 or example_value == "group":
         my_type.append("group")
         if my_target== 'SQL':
             #my_input.append("generate a query in Mysql on the Product_data to group the table by origin in Product_data table to calculate \"totalPrice\" as the values of total price in Product_data table, then project only the origin in Product_data.")
-            my_input.append(f"generate a query in Mysql on the {t0} to group the table by {random.choice(list(symbol_table[t0].keys()))} in {t0} table to calculate \"{random.choice(myvalue)}\" as the values of total {random.choice(list(symbol_table[t0].keys()))} in {t0} table, then project only the {random.choice(list(symbol_table[t0].keys()))} in {t0}.")
+            my_input.append(f"generate a query in Mysql on the {t0} to group the table by {rng.choice(list(symbol_table[t0].keys()))} in {t0} table to calculate \"{rng.choice(myvalue)}\" as the values of total {rng.choice(list(symbol_table[t0].keys()))} in {t0} table, then project only the {rng.choice(list(symbol_table[t0].keys()))} in {t0}.")
         else:
             #my_input.append("aggregate a query in MongoDB on the city including the following stages: group by CountryCode decreasingly, then project Name in city and Population in city")
-            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages: group by {random.choice(list(symbol_table[t0].keys()))} decreasingly, then project {random.choice(list(symbol_table[t0].keys()))} in {t0} and {random.choice(list(symbol_table[t0].keys()))} in {t0}")
-        print("group")
+            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages: group by {rng.choice(list(symbol_table[t0].keys()))} decreasingly, then project {rng.choice(list(symbol_table[t0].keys()))} in {t0} and {rng.choice(list(symbol_table[t0].keys()))} in {t0}")
+        logger.debug("group")
     if task_number==2 or example_value == "sort":
         my_type.append("sort")
         if my_target== 'SQL':
-            my_input.append(f"generate a query in Mysql on the {t0} to sort by {random.choice(list(symbol_table[t0].keys()))} decreasingly, then project only the {random.choice(list(symbol_table[t0].keys()))} in {t0}.")
+            my_input.append(f"generate a query in Mysql on the {t0} to sort by {rng.choice(list(symbol_table[t0].keys()))} decreasingly, then project only the {rng.choice(list(symbol_table[t0].keys()))} in {t0}.")
         else:
-            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages: sort by {random.choice(list(symbol_table[t0].keys()))} decreasingly, then project {random.choice(list(symbol_table[t0].keys()))} in {t0} and {random.choice(list(symbol_table[t0].keys()))} in {t0}")
-        print("sort")
+            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages: sort by {rng.choice(list(symbol_table[t0].keys()))} decreasingly, then project {rng.choice(list(symbol_table[t0].keys()))} in {t0} and {rng.choice(list(symbol_table[t0].keys()))} in {t0}")
+        logger.debug("sort")
     if task_number==2 or example_value == "limit":
         my_type.append("limit")
-        print("t0: "+t0)
+        logger.debug("t0: %s", t0)
         if my_target== 'SQL':
-            my_input.append(f"generate a query in Mysql on the {t0} including the following steps: limit to {random.randint(1, 10)} results, then finally project only the {random.choice(list(symbol_table[t0].keys()))} in {t0}.")
+            my_input.append(f"generate a query in Mysql on the {t0} including the following steps: limit to {rng.randint(1, 10)} results, then finally project only the {rng.choice(list(symbol_table[t0].keys()))} in {t0}.")
         else:
-            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages:  limit the first {random.randint(1, 10)} results, then project {random.choice(list(symbol_table[t0].keys()))} in {t0}, {random.choice(list(symbol_table[t0].keys()))} in {t0}")
-        print("limit")
+            my_input.append(f"aggregate a query in MongoDB on the {t0} including the following stages:  limit the first {rng.randint(1, 10)} results, then project {rng.choice(list(symbol_table[t0].keys()))} in {t0}, {rng.choice(list(symbol_table[t0].keys()))} in {t0}")
+        logger.debug("limit")
     if task_number==2 or example_value == "where":
         my_type.append("where")
         if my_target== 'SQL':
-            my_input.append(f"search for items from {t0} table whose {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\" and {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\".")
+            my_input.append(f"search for items from {t0} table whose {rng.choice(list(symbol_table[t0].keys()))} is equal to \"{rng.choice(myvalue)}\" and {rng.choice(list(symbol_table[t0].keys()))} is equal to \"{rng.choice(myvalue)}\".")
             #my_input.append(f"search for {random.choice(list(symbol_table[t0].keys()))} from {t0} table whose {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\" and {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\".")
         else:
-            my_input.append(f"search for items from {t0} table whose {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\" and {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\"")
+            my_input.append(f"search for items from {t0} table whose {rng.choice(list(symbol_table[t0].keys()))} is equal to \"{rng.choice(myvalue)}\" and {rng.choice(list(symbol_table[t0].keys()))} is equal to \"{rng.choice(myvalue)}\"")
             #my_input.append(f"search for {random.choice(list(symbol_table[t0].keys()))} from {t0} table whose {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\" and {random.choice(list(symbol_table[t0].keys()))} is equal to \"{random.choice(myvalue)}\"")
+    return my_type, my_input
+
+def generate_example_query(example_value, task_number, my_target, file_paths, context):
+    logger.debug("my task number %s", task_number)
+    logger.debug("example_value%s", example_value)
+    my_type, my_input = example_sentences(example_value, task_number, my_target, context)
     my_res=my_target+" example: \n"
-    print(f"my_input: {my_input}")
+    logger.debug("my_input: %s", my_input)
     for i in range(0, len(my_input)):
         if task_number==3:
             #my_res+=f"{my_target}: \n"
             my_res+="natural language representation: \n"
             my_res+=my_input[i]+"\n"
-            res1, tar1=my_execute_query(my_input[i], file_paths)
+            res1, tar1=my_execute_query(my_input[i], file_paths, context.fork())
+            if isinstance(res1, dict):
+                return res1, tar1
             my_res+="\ndatabase query: \n"
             my_res+=res1+"\n"
             #my_res+="nosql: \n"
@@ -1455,44 +1564,536 @@ def generate_example_query(example_value, task_number, my_target, file_paths):
             #my_res+="database query: \n"
             #my_res+=res2+"\n\n"
         else:
-            print("Only With Example Query without mentioning specific command")
+            logger.debug("Only With Example Query without mentioning specific command")
             #my_res+=my_target+" example: \n"
-            print(f"My result becomes:{my_res}")
-            res1, tar1=my_execute_query(my_input[i], file_paths)
+            logger.debug("My result becomes:%s", my_res)
+            res1, tar1=my_execute_query(my_input[i], file_paths, context.fork())
+            if isinstance(res1, dict):
+                return res1, tar1
             my_res+=f"\n{my_type[i]} query: \n"
             my_res+=res1+"\n"
-            print(f"My final result becomes {my_res}")
+            logger.debug("My final result becomes %s", my_res)
             #res2, tar2=my_execute_query(my_input2[i], nosql_file_paths)
             #my_res+="nosql query: \n"
             #my_res+=res2+"\n\n"
-    return my_res
+    return my_res, 200
+
+def remember_predicates(target, queries, predicates, file_paths):
+    # the conditions count once the query is executed, see record_execution
+    if predicates:
+        table_files = {os.path.splitext(os.path.basename(path))[0]: path for path in file_paths}
+        query_predicates.remember(target, queries, predicates, table_files)
+
+def record_execution(target, query):
+    """Count the conditions of an executed query for the index advisor, if the backend generated it."""
+    entry = query_predicates.get(target, query) if isinstance(query, str) else None
+    if entry is not None:
+        predicate_stats.record(*entry)
+
+def template_result(template, values, input_query, context, file_paths, shape):
+    query, ast_repr, params = template.bind(values)
+    target = template.target
+    result = query if target == "SQL" else format_mongo_plan(query)
+    prepared = {"query": template.query, "params": params} if target == "SQL" else None
+    plan = query if target != "SQL" else None
+    plan_cache.put(context.fingerprint, input_query, target,
+                   CompiledPlan(target, result, ast_repr, prepared, template.predicates, shape, plan))
+    remember_predicates(target, [result, template.query] if target == "SQL" else [result], template.predicates, file_paths)
+    data_collected = {
+        "target": target,
+        "result": result,
+        "ast": ast_repr,
+        "type": "query"
+    }
+    if prepared:
+        data_collected["prepared"] = prepared
+    if plan is not None:
+        # what execute_compiled_query runs; response_body leaves it out of the response
+        data_collected["plan"] = plan
+    logger.debug("My data collected becomes: %s", data_collected)
+    return data_collected, 200
+
+def compile_query(input_query, file_paths, context=None, explain=False):
+    """
+    Translate a natural language query against the files: everything /generate_query does except execution.
+
+    Only the CompilerContext of this call is touched, so it can run on any thread.
+    A caller that already loaded the schema passes a fresh context for it.
+    With explain, the generated query is explained on the database and its cost summary
+    is added under "explain" (see query_explain).
+    Return (response body, status): the data_collected dictionary with 200, or {"error": ...} with 400/500.
+    """
+    try:
+        # step 2: process each table name one by one, thus generating each symbol table according to the file paths
+        # change nosql_file_paths to file_paths
+    
+        #process_table_names(nosql_file_paths)
+    
+        # the symbol table, table names and token rules are served from the schema cache
+        try:
+            # target = generate_separate_symbol_tables(nosql_file_paths)
+            if context is None:
+                with stage_timer("schema"):
+                    context = load_schema(file_paths)
+            target = context.db_type
+        except ValueError as e:
+            return {"error": f"Error loading symbol table: {e}"}, 400
+
+        # Step 3: The token rules used to analyze each process are set up by load_schema
+        #note: there is where in the AGGREGATION_OPERATOR
+
+        # A sentence that was compiled before against the same files is answered from the plan cache
+        input_query = normalize_query_text(input_query)
+        cached = plan_cache.get(context.fingerprint, input_query, target)
+        if cached is not None:
+            data_collected = {
+                "target": cached.target,
+                "result": cached.result,
+                "ast": cached.ast,
+                "type": "query"
+            }
+            if cached.prepared:
+                data_collected["prepared"] = cached.prepared
+            if cached.plan is not None:
+                data_collected["plan"] = cached.plan
+            remember_predicates(cached.target, [cached.result] + ([cached.prepared["query"]] if cached.prepared else []),
+                                cached.predicates, file_paths)
+            logger.debug("Plan cache hit: %s", data_collected)
+            if explain:
+                explain_compiled_query(data_collected, context.fingerprint, cached.shape or input_query)
+            return data_collected, 200
+
+        # Step 4: Lexcial Analysis
+        with stage_timer("lex"):
+            tokens = lexical_analysis(input_query, context)
+        logger.debug("My tokens are: %s", tokens)
+
+        # Step 5: Check type
+        if tokens[0].type == "Explore":
+            try:
+                context.example_tables = populate_example_tables(file_paths)
+            except ValueError as e:
+                return {"error": f"Error loading example from table: {e}"}, 400
+            data_collected = {
+                "target": target,
+                "result": json.dumps(context.example_tables),
+                #"result": repr(example_tables),
+                "ast": "",
+                "type": "data"
+            }
+            logger.debug("My data collected becomes: %s", data_collected)
+            #print("my return", jsonify(data_collected))
+            return data_collected, 200
+        elif tokens[0].type == "Example":
+            if len(tokens)==1:
+                logger.debug("task 2")
+                res, status=generate_example_query("", 2, target, file_paths, context)
+            else:
+                logger.debug("task 3")
+                if tokens[1].type!="AGGREGATION_OPERATOR":
+                    return {"error": f"Type error: please input the type of query."}, 400
+                example_value=tokens[1].value
+                res, status=generate_example_query(example_value, 3, target, file_paths, context)
+            if status != 200:
+                # an example that does not compile is answered with its error
+                return res, status
+        
+            data_collected = {
+                "target": target,
+                "result": res,
+                "ast": "",
+                "type": "query"
+            }
+        
+            logger.debug("My data collected becomes: %s", data_collected)
+            return data_collected, 200
+    
+        # Queries that differ only in their values share one compiled template
+        lifted = extract_query_template(tokens)
+        if lifted:
+            tokens, values = lifted
+            shape = template_key(tokens)
+            template = template_cache.get(context.fingerprint, shape, target)
+            if template is not None:
+                # binding the values is all the code generation a cached template needs
+                with stage_timer("generate"):
+                    data_collected, status = template_result(template, values, input_query, context, file_paths, shape)
+                if explain:
+                    explain_compiled_query(data_collected, context.fingerprint, shape)
+                return data_collected, status
+
+        # Step 5: Parsing
+        parser = Parser(tokens)
+        try:
+            with stage_timer("parse"):
+                ast = parser.parse()
+            logger.debug("My AST is: %s", ast)
+        except SyntaxError as e:
+            logger.debug("My error is: %s", e)
+            return {"error": f"Parsing error: {e}"}, 400
+    
+    
+        # Step 6: Semantic Analysis
+        analyzer = SemanticAnalyzer(context.symbol_table, target)
+        try:
+            with stage_timer("analyze"):
+                analyzer.analyze(ast)
+            logger.debug("My analyzer is: %s", analyzer)
+        except SemanticError as e:
+            logger.debug("My error is: %s", e)
+            return {"error": f"Semantic error: {e}"}, 400
+    
+        # Step 7: Code Generator
+        generator = CodeGenerator(target)
+        try:
+            with stage_timer("generate"):
+                if target == 'SQL':
+                    result = generator.generate_sql(ast)
+                elif target == 'NoSQL':
+                    result = generator.generate_mongo_plan(ast) if lifted else generator.generate_mongo(ast)
+            logger.debug("My result is: %s", result)
+        except ValueError as e:
+            logger.debug("My error is: %s", e)
+            return {"error": f"Code generation error: {e}"}, 400
+
+        if lifted:
+            template = QueryTemplate(target, result, generator.param_slots, repr(ast), tuple(generator.predicates))
+            template_cache.put(context.fingerprint, shape, target, template)
+            data_collected, status = template_result(template, values, input_query, context, file_paths, shape)
+            if explain:
+                explain_compiled_query(data_collected, context.fingerprint, shape)
+            return data_collected, status
+    
+        # Step 8: Return the result
+        logger.debug("My final res: %s", result)
+        predicates = tuple(generator.predicates)
+        plan_cache.put(context.fingerprint, input_query, target, CompiledPlan(target, result, repr(ast), None, predicates))
+        remember_predicates(target, [result], predicates, file_paths)
+        data_collected = {
+            "target": target,
+            "result": result,
+            "ast": repr(ast),
+            "type": "query"
+        }
+        logger.debug("My data collected becomes: %s", data_collected)
+        if explain:
+            explain_compiled_query(data_collected, context.fingerprint, input_query)
+        return data_collected, 200
+    except Exception as e:
+        logger.exception("Cannot compile %r", input_query)
+        return {"error": f"The server error occurred: {e}"}, 500
+
+def cache_statistics():
+    return {
+        "plan_cache": plan_cache.stats(),
+        "template_cache": template_cache.stats(),
+        "schema_cache": {"size": len(schema_cache.entries), "hits": schema_cache.hits, "misses": schema_cache.misses},
+        "explain_cache": explain_cache.stats(),
+        "lookup_indexes": lookup_indexes.stats(),
+        "predicate_stats": {"size": len(predicate_stats.entries), "evictions": predicate_stats.evictions}
+    }
+
+def metrics_text():
+    """The stage histograms, error counters and cache counters in the Prometheus text format."""
+    return registry.render() + render_cache_stats(cache_statistics())
+
+def index_advice(values, apply=False):
+    """
+    The indexes proposed for the filtered fields, created on the backends when apply is set.
+
+    :param values: The request parameters, min_hits and max_selectivity are optional.
+    """
+    if apply and not ADVISOR_ALLOW_APPLY:
+        raise PermissionError("Creating indexes is turned off, start the backend with CHATDB_ADVISOR_ALLOW_APPLY=1.")
+    min_hits = int(values.get("min_hits") or ADVISOR_MIN_HITS)
+    max_selectivity = float(values.get("max_selectivity") or ADVISOR_MAX_SELECTIVITY)
+    advice = advise(predicate_stats, min_hits, max_selectivity)
+    if apply:
+        advice = apply_advice(advice)
+        # the new indexes change the plans
+        explain_cache.clear()
+    return {"advice": advice}
+
+# The largest number of queries in one /generate_query/batch request
+MAX_BATCH_SIZE = 100
+
+def response_body(data_collected):
+    # the structured Mongo plan of a compiled query is not sent, its "result" text shows it
+    if "plan" not in data_collected:
+        return data_collected
+    return {key: value for key, value in data_collected.items() if key != "plan"}
+
+def execute_compiled_query(data_collected):
+    """
+    Execute a query produced by compile_query, as a prepared statement when it has one
+    and as its structured plan when it is a Mongo query bound from a template.
+    """
+    with stage_timer("execute"):
+        if data_collected["target"] == "SQL":
+            prepared = data_collected.get("prepared")
+            if prepared:
+                success, exe_result = execute_sql_query(prepared["query"], prepared["params"])
+            else:
+                success, exe_result = execute_sql_query(data_collected["result"])
+        elif "plan" in data_collected:
+            success, exe_result = execute_nosql_plan(data_collected["plan"])
+        else:
+            success, exe_result = execute_nosql_query(data_collected["result"], [])
+    if success:
+        record_execution(data_collected["target"], data_collected["result"])
+    else:
+        count_error("execute")
+    return success, exe_result
+
+def execute_in_parallel(data_collected):
+    # a worker of run_batch: its execution is in the histograms, the request timings get the batch's wall time
+    leave_request_timings()
+    return execute_compiled_query(data_collected)
+
+def runnable_batch_items(results):
+    # only generated queries run, the explore/example answers have no AST
+    return [item for item in results if item.get("type") == "query" and item.get("ast")]
+
+def run_batch(queries, file_paths, execute=False, parallel=True):
+    """
+    Compile and optionally execute many natural language queries against one set of files.
+
+    The schema is loaded once and every query gets a fresh CompilerContext for it.
+    With execute, the generated queries run on up to SQL_POOL_SIZE threads, each
+    borrowing its own pooled connection. Return one response per query, in order:
+    the data_collected dictionary (plus "execution" when executed) or {"error", "status"}.
+    """
+    try:
+        with stage_timer("schema"):
+            context = load_schema(file_paths)
+    except ValueError as e:
+        return [{"error": f"Error loading symbol table: {e}", "status": 400} for query in queries]
+
+    results = []
+    for query in queries:
+        if not isinstance(query, str) or not query:
+            results.append({"error": "The input query is required.", "status": 400})
+            continue
+        data_collected, status = compile_query(query, file_paths, context.fork())
+        if status != 200:
+            data_collected["status"] = status
+        results.append(data_collected)
+
+    if execute:
+        runnable = runnable_batch_items(results)
+        if parallel and len(runnable) > 1:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=min(SQL_POOL_SIZE, len(runnable))) as executor:
+                outcomes = list(executor.map(in_request_context(execute_in_parallel), runnable))
+            add_request_timing("execute", time.perf_counter() - start)
+        else:
+            outcomes = [execute_compiled_query(item) for item in runnable]
+        for item, (success, exe_result) in zip(runnable, outcomes):
+            item["execution"] = {"success": success, "result": exe_result}
+    return results
+
+# The files used when a request does not attach any
+DEFAULT_FILE_PATHS = ['../Database/NoSQL/Data/sampleCultureProducts.json', '../Database/NoSQL/Data/city.json', '../Database/NoSQL/Data/country.json', '../Database/NoSQL/Data/countrylanguage.json']
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify through orjson when it is installed. Dates, decimals and the other values
+    orjson does not encode itself go through Flask's default, so the output is unchanged.
+    """
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
+@app.before_request
+def start_request_log():
+    # every request gets an id for its log lines and is sampled for debug logging
+    start_request(request.headers.get("X-Request-Id"))
+    start_timings()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def add_request_id(response):
+    response.headers["X-Request-Id"] = current_request_id()
+    # the route pattern rather than the path, so unknown paths share one series
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_request(route, time.perf_counter() - g.get("request_started", time.perf_counter()))
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Large JSON answers are sent with gzip/br when the client accepts it, streamed answers as they are
+    if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers:
+        return response
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    body = response.get_data()
+    if not should_compress(body, encoding):
+        return response
+    response.set_data(compress_body(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+def request_values():
+    # GET sends the parameters in the query string, POST in a JSON body
+    if request.method == "POST":
+        return request.get_json(silent=True) or {}
+    return request.args
+
+def json_argument(value):
+    # The query string carries files and params as JSON text, a JSON body carries the values themselves
+    return json.loads(value) if isinstance(value, str) else value
+
+def is_streaming_request():
+    # ?stream=1 returns the executed result as newline-delimited JSON
+    return str(request_values().get("stream", "")).lower() in ["1", "true", "yes"]
+
+def is_explain_request():
+    # ?explain=1 adds the EXPLAIN cost summary of the generated query to the response
+    return str(request_values().get("explain", "")).lower() in ["1", "true", "yes"]
+
+def is_timings_request():
+    # ?timings=1 adds the duration of every stage of the request to the response, in milliseconds
+    return str(request_values().get("timings", "")).lower() in ["1", "true", "yes"]
+
+def timed_jsonify(data_collected):
+    # the serialization is timed for /metrics; it happens after the timings block is written
+    if is_timings_request():
+        data_collected["timings"] = request_timings()
+    with stage_timer("serialize"):
+        return jsonify(response_body(data_collected))
+
+def is_paginated_request():
+    # ?page_size=N and/or ?page_token=... return the executed result one page at a time
+    values = request_values()
+    return "page_size" in values or "page_token" in values
+
+def stream_result(target, batches):
+    header = {"target": target, "ast": "", "type": "execute"}
+    return Response(ndjson_lines(header, batches), mimetype="application/x-ndjson")
+
+def page_result(target, query, fetch_page):
+    try:
+        values = request_values()
+        page_size = min(int(values.get("page_size", MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if page_size < 1:
+            raise ValueError("The page size must be positive.")
+        page_token = values.get("page_token")
+        offset = decode_page_token(query, page_token) if page_token else 0
+    except ValueError as e:
+        return jsonify({"error": f"Pagination error: {e}"}, 400)
+    with stage_timer("execute"):
+        success, rows, has_more = fetch_page(query, offset, page_size)
+    if not success:
+        count_error("execute")
+        logger.warning("Error executing query: %s", rows)
+        return jsonify({"error": f"Error executing query: {rows}"}, 400)
+    if offset == 0:
+        # a paged query counts once, for its first page
+        record_execution(target, query)
+    data_collected = {
+        "target": target,
+        "result": rows,
+        "ast": "",
+        "type": "execute",
+        "next_page_token": encode_page_token(query, offset + len(rows)) if has_more else None
+    }
+    return timed_jsonify(data_collected)
+
+def request_params():
+    # ?params=[...] executes the query as a prepared statement with these bind parameters
+    params = request_values().get("params")
+    return json_argument(params) if params else None
+
 @app.route('/', methods=['GET'])
 def index():
     return "hello"
 
-@app.route('/generate_query', methods=['GET'])
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify(cache_statistics())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/index_advice', methods=['GET', 'POST'])
+def index_advice_route():
+    # GET proposes the indexes, POST also creates them
+    try:
+        return jsonify(index_advice(request_values(), apply=request.method == "POST"))
+    except PermissionError as e:
+        return jsonify({"error": str(e)}, 403)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}, 400)
+    except Exception as e:
+        return jsonify({"error": f"The server error occurred: {e}"}, 500)
+
+@app.route('/generate_query/batch', methods=['POST'])
+def generate_batch():
+    try:
+        payload = request.get_json(silent=True) or {}
+        queries = payload.get("queries")
+        if not isinstance(queries, list) or not queries:
+            return jsonify({"error": "The queries are required."}, 400)
+        if len(queries) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"At most {MAX_BATCH_SIZE} queries can be sent in one batch."}, 400)
+        file_paths = payload.get("files") or list(DEFAULT_FILE_PATHS)
+        results = run_batch(queries, file_paths, bool(payload.get("execute")), payload.get("parallel", True))
+        return jsonify({"results": [response_body(item) for item in results]})
+    except Exception as e:
+        return jsonify({"error": f"The server error occurred: {e}"}, 500)
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    return jsonify({"profiles": profiles.summaries()})
+
+@app.route('/profiles/<request_id>', methods=['GET'])
+def get_profile(request_id):
+    # the pstats report or the collapsed stacks as text, ?format=pstats for the cProfile dump
+    entry = profiles.get(request_id)
+    if entry is None:
+        return jsonify({"error": f"No profile for request {request_id}."}, 404)
+    if request.args.get("format") == "pstats":
+        if "dump" not in entry:
+            return jsonify({"error": "Sampled profiles have no pstats dump."}, 400)
+        return Response(entry["dump"], mimetype="application/octet-stream",
+                        headers={"Content-Disposition": f"attachment; filename={request_id}.pstats"})
+    return Response(entry["report"], mimetype="text/plain")
+
+@app.route('/generate_query', methods=['GET', 'POST'])
 def generate_result():
+    # ?profile=1 or X-ChatDB-Profile: 1 profiles the request, see request_profile
+    mode = profile_mode(request_values().get("profile") or request.headers.get("X-ChatDB-Profile"))
+    if mode:
+        return profile_call(mode, current_request_id(), request_values().get("query"), answer_query)
+    return answer_query()
+
+def answer_query():
     try:
+        values = request_values()
+        input_query = values.get("query")
+        logger.debug("My input query at backend is: %s", input_query)
         
-        input_query = request.args.get("query")
-        print("My input query at backend is: ", input_query)
-        
-        file_strings = request.args.get("files")
+        file_strings = values.get("files")
 
-        file_paths = json.loads(file_strings)
+        file_paths = json_argument(file_strings)
         
         if not input_query:
             return jsonify({"error": "The input query is required."}, 400)
 
         if not file_paths:
-            file_paths=['../Database/NoSQL/Data/sampleCultureProducts.json', '../Database/NoSQL/Data/city.json', '../Database/NoSQL/Data/country.json', '../Database/NoSQL/Data/countrylanguage.json']
-        print("file_path")
-        print(file_paths)
-        print("file_path")
+            file_paths=list(DEFAULT_FILE_PATHS)
+        logger.debug("file_path: %s", file_paths)
         # # change the name to file_paths based on the variable file_paths
         # if not nosql_file_paths:
         #     return jsonify({"error": "The file paths are required."}, 400)
@@ -1507,12 +2108,19 @@ def generate_result():
         #execute sql
         if input_query.startswith("execute sql:"):
             extracted_query = input_query[len("execute sql: "):]
-            print("Extracted query:", extracted_query)
-            success, exe_result = execute_sql_query(extracted_query)
+            logger.debug("Extracted query: %s", extracted_query)
+            params = request_params()
+            if is_streaming_request():
+                record_execution("SQL", extracted_query)
+                return stream_result("SQL", stream_sql_query(extracted_query, params=params))
+            if is_paginated_request():
+                return page_result("SQL", extracted_query,
+                                   lambda query, offset, page_size: fetch_sql_page(query, offset, page_size, params))
+            with stage_timer("execute"):
+                success, exe_result = execute_sql_query(extracted_query, params)
             if success:
-                print("Query executed successfully:")
-                for row in exe_result:
-                    print(row)
+                record_execution("SQL", extracted_query)
+                logger.debug("Query executed successfully: %d rows", len(exe_result))
                 data_collected = {
                     "target": "SQL",
                     #"result": json.dumps(exe_result),
@@ -1520,25 +2128,30 @@ def generate_result():
                     "ast": "",
                     "type": "execute"
                 }
-                print("My data collected becomes: ", data_collected)
-                return jsonify(data_collected)
+                logger.debug("My data collected becomes: %s", data_collected)
+                return timed_jsonify(data_collected)
             else:
-                print("Error executing query:", exe_result)
+                count_error("execute")
+                logger.warning("Error executing query: %s", exe_result)
                 return jsonify({"error": "Error executing sql query"}, 400)
         else:
-            print("The string does not need to be execute in sql")
+            logger.debug("The string does not need to be execute in sql")
         #execute nosql
         if input_query.startswith("execute nosql:"):
             extracted_query = input_query[len("execute nosql: "):]
-            print("Extracted query:", extracted_query)
+            logger.debug("Extracted query: %s", extracted_query)
+            if is_streaming_request():
+                record_execution("NOSQL", extracted_query)
+                return stream_result("NOSQL", stream_nosql_query(extracted_query))
+            if is_paginated_request():
+                return page_result("NOSQL", extracted_query, fetch_nosql_page)
             #success, exe_result = execute_nosql_query(extracted_query, file_paths)
-            success, exe_result = execute_nosql_query(extracted_query, [])
-            print("my res: ",success, exe_result)
+            with stage_timer("execute"):
+                success, exe_result = execute_nosql_query(extracted_query, [])
+            logger.debug("my res: %s %s", success, exe_result)
             if success:
-                print("Query executed successfully:")
-                for doc in exe_result:
-                    print(doc)
-                print("res: ", exe_result)
+                record_execution("NOSQL", extracted_query)
+                logger.debug("Query executed successfully: %d documents", len(exe_result))
                 #print("json: ", json.dumps(exe_result))
                 data_collected = {
                     "target": "NOSQL",
@@ -1547,132 +2160,19 @@ def generate_result():
                     "ast": "",
                     "type": "execute"
                 }
-                print("My data collected becomes: ", data_collected)
-                return jsonify(data_collected)
+                logger.debug("My data collected becomes: %s", data_collected)
+                return timed_jsonify(data_collected)
             else:
-                print("Error executing query:", result)
+                count_error("execute")
+                logger.warning("Error executing query: %s", exe_result)
                 return jsonify({"error": "Error executing sql query:"}, 400)
         else:
-            print("The string does not need to be execute in nosql")
-        # step 2: process each table name one by one, thus generating each symbol table according to the file paths
-        # change nosql_file_paths to file_paths
-        
-        #process_table_names(nosql_file_paths)
-        
-        process_table_names(file_paths)
-        try:
-            # target = generate_separate_symbol_tables(nosql_file_paths)
-            target = generate_separate_symbol_tables(file_paths)
-        except ValueError as e:
-            return jsonify({"error": f"Error loading symbol table: {e}"}, 400)
-
-        
-        # Step 3: Define token rules used to analyze each process
-        global TOKEN_RULES
-        TOKEN_RULES = [
-            ("Explore", r"\b(explore|investigate|examine|inspect|analyze)"),
-            ("Example", r"\b(example)"),
-            ("KEYWORD", r"\b(search for|find|select|insert|add|append|create|put|write|store|include|populate|update|modify|edit|change|alter|refresh|adjust|correct|revise|replace|delete|remove|erase|clear|drop|destroy|truncate|discard|sum|count|avg|min|max|aggregate|generate)\b"),
-            ("RELATION", r"\b(equal to|greater than|less than|not equal to|greater than or equal to|less than or equal to|set|>=|<=|>|<|!=)\b"),  # 关系运算符[relational operators]
-            ("FIELD", generate_field_patterns(symbol_table)),  # 字段名[fields]  # Pending: change it into the specific fields
-            #("FIELD", r"\b(_id|shopifyId|title|descriptionHTML|handle|vendor|productType|tags|options|variants|images|createdAt|updatedAt|publishedAt)\b"),
-            ("LOGICAL_OPERATOR", r"\b(and|or|nor)\b"),  # 逻辑操作符[logical operators]
-            #("VALUE", r"(\d+|'.*?')"),  # 数值或字符串值[string or number]
-            #("AS", r"\b(as)\b"),
-            ("VALUE", r"(\d+|'.*?'|\".*?\")"),
-            ("AGGREGATION_OPERATOR", r"\b(join|group|sort|unwind|project|limit|skip|lookup|where)\b"),
-            ("GROUP_OPERATOR", r"\b(calculate|collect|list)\b"),
-            ("SORT_OPERATOR", r"\b(decreasingly|increasingly)\b"),
-            ("TABLE_NAME", generate_field_patterns2(my_table_names)),
-            ("WHITESPACE", r"\s+"),  # 空格（可以跳过） [whitespace]
-            ("INVALID", r".")  # 无效字符[invalid characters]
-        ]
-        #note: there is where in the AGGREGATION_OPERATOR
-
-        # Step 4: Lexcial Analysis
-        tokens = lexical_analysis(input_query)
-        print("My tokens are: ", tokens)
-
-        # Step 5: Check type
-        if tokens[0].type == "Explore":
-            try:
-                populate_example_tables(file_paths)
-            except ValueError as e:
-                return jsonify({"error": f"Error loading example from table: {e}"}, 400)
-            data_collected = {
-                "target": target,
-                "result": json.dumps(example_tables),
-                #"result": repr(example_tables),
-                "ast": "",
-                "type": "data"
-            }
-            print("My data collected becomes: ", data_collected)
-            #print("my return", jsonify(data_collected))
-            return jsonify(data_collected)
-        elif tokens[0].type == "Example":
-            if len(tokens)==1:
-                print("task 2")
-                res=generate_example_query("", 2, target, file_paths)
-            else:
-                print("task 3")
-                if tokens[1].type!="AGGREGATION_OPERATOR":
-                    return jsonify({"error": f"Type error: please input the type of query."}, 400)
-                example_value=tokens[1].value
-                res=generate_example_query(example_value, 3, target, file_paths)
-            
-            data_collected = {
-                "target": target,
-                "result": res,
-                "ast": "",
-                "type": "query"
-            }
-            
-            print("My data collected becomes: ", data_collected)
-            return jsonify(data_collected)
-        
-
-        # Step 5: Parsing
-        parser = Parser(tokens)
-        try:
-            ast = parser.parse()
-            print("My AST is: ", ast)
-        except SyntaxError as e:
-            print("My error is: ", e)
-            return jsonify({"error": f"Parsing error: {e}"}, 400)
-        
-        
-        # Step 6: Semantic Analysis
-        analyzer = SemanticAnalyzer(symbol_table, target)
-        try:
-            analyzer.analyze(ast)
-            print("My analyzer is: ", analyzer)
-        except SemanticError as e:
-            print("My error is: ", e)
-            return jsonify({"error": f"Semantic error: {e}"}, 400)
-        
-        # Step 7: Code Generator
-        generator = CodeGenerator(target)
-        try:
-            if target == 'SQL':
-                result = generator.generate_sql(ast)
-            elif target == 'NoSQL':
-                result = generator.generate_mongo(ast)
-            print("My result is: ", result)
-        except ValueError as e:
-            print("My error is: ", e)
-            return jsonify({"error": f"Code generation error: {e}"}, 400)
-        
-        # Step 8: Return the result
-        print(f"My final res: {result}")
-        data_collected = {
-            "target": target,
-            "result": result,
-            "ast": repr(ast),
-            "type": "query"
-        }
-        print("My data collected becomes: ", data_collected)
-        return jsonify(data_collected)
+            logger.debug("The string does not need to be execute in nosql")
+        data_collected, status = compile_query(input_query, file_paths, explain=is_explain_request())
+        # errors keep the body and status of jsonify(body, status) used by every other branch
+        return timed_jsonify(data_collected) if status == 200 else jsonify(data_collected, status)
     except Exception as e:
+         logger.exception("Cannot answer /generate_query")
          return jsonify({"error": f"The server error occurred: {e}"}, 500)
 
 
@@ -1804,4 +2304,5 @@ def generate_result():
 #         return
 
 if __name__ == "__main__":
-    app.run(debug=True, port=6600)
+    # every request has its own CompilerContext, so requests can be served by concurrent threads
+    app.run(debug=True, port=6600, threaded=True)
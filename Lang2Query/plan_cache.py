@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+PLAN_CACHE_SIZE = int(os.environ.get("CHATDB_PLAN_CACHE_SIZE", "512"))
+# Seconds a compiled plan is served from the cache, 0 keeps plans until they are evicted
+PLAN_CACHE_TTL = float(os.environ.get("CHATDB_PLAN_CACHE_TTL", "3600"))
+
+# Quoted values are kept as they are, whitespace between them is collapsed
+_NORMALIZE_PATTERN = re.compile(r"('.*?'|\".*?\")|\s+")
+
+
+def normalize_query_text(input_text: str) -> str:
+    """
+    Normalize a natural-language query for the cache key.
+
+    Runs of whitespace become one space and the ends are stripped, except inside
+    quoted values. The lexer skips whitespace, so both forms compile to the same query.
+    Letter case is kept: field names and values are case-sensitive.
+    """
+    return _NORMALIZE_PATTERN.sub(lambda match: match.group(1) or " ", input_text).strip()
+
+
+class CompiledPlan:
+    """
+    The output of one compilation: the generated SQL/Mongo query and the AST repr.
+    prepared holds the SQL with %s markers and its parameters, for queries compiled from a template.
+    predicates holds the (table, field, operator) of its conditions, for the index advisor.
+    shape is the template key of the template it was bound from.
+    plan is the structured Mongo plan that result displays, for NoSQL queries bound from a template.
+    """
+    def __init__(self, target, result, ast, prepared=None, predicates=(), shape=None, plan=None):
+        self.target = target
+        self.result = result
+        self.ast = ast
+        self.prepared = prepared
+        self.predicates = predicates
+        self.shape = shape
+        self.plan = plan
+
+    def __repr__(self):
+        return f"CompiledPlan({self.target}, {self.result!r})"
+
+
+class PlanCache:
+    """
+    LRU cache of compiled plans keyed by (schema fingerprint, normalized input text, target).
+    The cached value is a CompiledPlan, or a QueryTemplate when the key is a template key.
+
+    The schema fingerprint changes whenever one of the data files changes, and
+    invalidate() drops the plans of a fingerprint once its schema is gone.
+    """
+    def __init__(self, maxsize: int = PLAN_CACHE_SIZE, ttl: float = PLAN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def key(self, fingerprint: tuple, input_text: str, target: str) -> tuple:
+        return fingerprint, normalize_query_text(input_text), target
+
+    def get(self, fingerprint: tuple, input_text: str, target: str) -> Optional[Any]:
+        """Return the cached plan, or None on a miss or when the plan is older than the TTL."""
+        key = self.key(fingerprint, input_text, target)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                stored_at, plan = cached
+                if not self.ttl or time.monotonic() - stored_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return plan
+                del self.entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint: tuple, input_text: str, target: str, plan: Any) -> None:
+        if self.maxsize < 1:
+            return
+        key = self.key(fingerprint, input_text, target)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), plan)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, fingerprint: tuple) -> int:
+        """Drop every plan compiled against the schema with this fingerprint, return how many."""
+        with self.lock:
+            stale = [key for key in self.entries if key[0] == fingerprint]
+            for key in stale:
+                del self.entries[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,159 @@
+"""
+Cost summaries of generated queries, from EXPLAIN (MySQL), EXPLAIN QUERY PLAN (SQLite)
+or the explain command (MongoDB and the local document store).
+
+Every backend is summarized in the same shape:
+{"rows_examined": int or None, "indexes": [...], "stages": [...], "full_scan": bool}
+"""
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+from execute_nosql import as_mongo_plan, explain_nosql_plan
+from execute_sql import explain_sql_query
+from execute_sqlite import SQL_BACKEND
+from metrics import count_error, stage_timer
+from plan_cache import PLAN_CACHE_SIZE, PlanCache
+
+# Seconds a summary is reused for the queries of one template; plans change with the data and the indexes
+EXPLAIN_CACHE_TTL = float(os.environ.get("CHATDB_EXPLAIN_CACHE_TTL", "300"))
+
+# "SEARCH Product_data USING INDEX idx_Product_data_color (color=?)", "SEARCH t USING INTEGER PRIMARY KEY (rowid=?)"
+_SQLITE_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING (INTEGER PRIMARY KEY)")
+
+
+def _text(value: Any) -> Any:
+    # Prepared cursors of mysql.connector return the string columns of EXPLAIN as bytes
+    return value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else value
+
+
+def summarize_mysql_explain(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize the rows of a MySQL EXPLAIN: the optimizer's row estimates are summed over the tables."""
+    stages, indexes, examined = [], [], 0
+    for row in rows:
+        access, table, key = _text(row.get("type")), _text(row.get("table")), _text(row.get("key"))
+        stages.append(f"{access} {table}" if table else str(access or _text(row.get("select_type"))))
+        if key:
+            indexes.append(key)
+        examined += int(row.get("rows") or 0)
+    return {
+        "rows_examined": examined,
+        "indexes": indexes,
+        "stages": stages,
+        "full_scan": any(_text(row.get("type")) == "ALL" for row in rows),
+    }
+
+
+def summarize_sqlite_plan(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize EXPLAIN QUERY PLAN; SQLite does not estimate rows, so rows_examined is None."""
+    stages, indexes, full_scan = [], [], False
+    for row in rows:
+        detail = row["detail"]
+        stages.append(detail.split(" USING ")[0])
+        match = _SQLITE_INDEX.search(detail)
+        if match:
+            indexes.append(match.group(1) or match.group(2))
+        elif detail.startswith("SCAN"):
+            full_scan = True
+    return {"rows_examined": None, "indexes": indexes, "stages": stages, "full_scan": full_scan}
+
+
+def _find_values(value: Any, key: str) -> Iterator[Any]:
+    # Every value of key in a nested explain document
+    if isinstance(value, dict):
+        for name, item in value.items():
+            if name == key:
+                yield item
+            else:
+                yield from _find_values(item, key)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _find_values(item, key)
+
+
+def _plan_nodes(node: Any) -> Iterator[Dict[str, Any]]:
+    # The stages of a winningPlan tree from the root down; the slot based engine nests it in queryPlan
+    if not isinstance(node, dict):
+        return
+    node = node.get("queryPlan", node)
+    yield node
+    for key in ["inputStage", "outerStage", "innerStage"]:
+        yield from _plan_nodes(node.get(key))
+    for child in node.get("inputStages", []):
+        yield from _plan_nodes(child)
+
+
+def summarize_mongo_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize the output of the explain command with executionStats verbosity."""
+    stages, indexes = [], []
+    for winning_plan in _find_values(explain, "winningPlan"):
+        for node in _plan_nodes(winning_plan):
+            if "stage" in node:
+                stages.append(node["stage"])
+            if node.get("indexName"):
+                indexes.append(node["indexName"])
+    # the pipeline stages that run after the query, e.g. $lookup and $group
+    for stage in explain.get("stages", []):
+        stages.extend(operator for operator in stage if operator.startswith("$") and operator != "$cursor")
+        if stage.get("indexName"):
+            indexes.append(stage["indexName"])
+    examined = [stats.get("totalDocsExamined") for stats in _find_values(explain, "executionStats")
+                if isinstance(stats, dict) and "totalDocsExamined" in stats]
+    return {
+        "rows_examined": sum(examined) if examined else None,
+        "indexes": indexes,
+        "stages": stages,
+        "full_scan": "COLLSCAN" in stages,
+    }
+
+
+def explain_query(target: str, query: Any, params: Optional[List[Any]] = None) -> Dict[str, Any]:
+    """
+    Return the cost summary of a generated query on the configured backend, or {"error": ...}.
+
+    :param target: "SQL" or "NoSQL".
+    :param query: The SQL text (with %s markers if params are given), or the Mongo query or plan.
+    """
+    if target == "SQL":
+        success, explain = explain_sql_query(query, params)
+        summarize = summarize_sqlite_plan if SQL_BACKEND == "sqlite" else summarize_mysql_explain
+    else:
+        try:
+            plan = as_mongo_plan(query)
+        except ValueError as err:
+            return {"error": str(err)}
+        success, explain = explain_nosql_plan(plan)
+        summarize = summarize_mongo_explain
+    if not success:
+        return {"error": explain}
+    return summarize(explain)
+
+
+# Summaries are cached per schema, query template and target, like the templates themselves
+explain_cache = PlanCache(PLAN_CACHE_SIZE, EXPLAIN_CACHE_TTL)
+
+
+def explain_compiled_query(data_collected: Dict[str, Any], fingerprint: tuple, key: str) -> Dict[str, Any]:
+    """
+    Add the cost summary of a query compiled by compile_query to its response, under "explain".
+
+    :param key: The template key of the query, or its text when it has no template; the
+                queries that differ only in their values are explained once per TTL.
+    """
+    target = data_collected["target"]
+    summary = explain_cache.get(fingerprint, key, target)
+    if summary is None:
+        prepared = data_collected.get("prepared")
+        with stage_timer("explain"):
+            if prepared:
+                summary = explain_query(target, prepared["query"], prepared["params"])
+            else:
+                # a Mongo query bound from a template is explained from its plan, not its text
+                summary = explain_query(target, data_collected.get("plan", data_collected["result"]))
+        # a failed EXPLAIN (e.g. the database is down) is tried again on the next request
+        if "error" in summary:
+            count_error("explain")
+        else:
+            explain_cache.put(fingerprint, key, target, summary)
+    data_collected["explain"] = summary
+    return data_collected
@@ -0,0 +1,127 @@
+import os
+import re
+from typing import Any, List, Optional, Tuple
+
+# MySQL reads a backslash in a string literal as an escape, SQLite (CHATDB_SQL_BACKEND=sqlite) does not
+BACKSLASH_ESCAPES = os.environ.get("CHATDB_SQL_BACKEND", "mysql") != "sqlite"
+
+_INTEGER = re.compile(r"[0-9]+", re.ASCII)
+
+
+class Placeholder(str):
+    """
+    A VALUE token lifted out of a query template.
+
+    The text is a sentinel that the lexer never produces, so the placeholder passes
+    through the parser and the AST repr unchanged and is replaced when the template is bound.
+    unquoted placeholders stand for a value with its quotes stripped (SET clauses).
+    """
+    def __new__(cls, index: int, unquoted: bool = False):
+        placeholder = super().__new__(cls, f"\x00{index}\x00")
+        placeholder.index = index
+        placeholder.unquoted = unquoted
+        return placeholder
+
+    def strip_quotes(self) -> "Placeholder":
+        return Placeholder(self.index, unquoted=True)
+
+    def resolve(self, values: List[str]) -> str:
+        value = values[self.index]
+        return value.strip("'\"") if self.unquoted else value
+
+
+def sql_value(text: str, set_value: bool = False) -> Any:
+    """
+    The value of a VALUE token as it is sent to the database: a quoted token is the string
+    between its quotes, an unquoted one an int if it is all ASCII digits. In a SET clause
+    NULL is the SQL NULL, None; the lexer only reads it quoted, as "NULL".
+    """
+    if set_value and text.strip("'\"").upper() == "NULL":
+        return None
+    if text[:1] in ("'", '"'):
+        return text.strip("'\"")
+    if _INTEGER.fullmatch(text):
+        return int(text)
+    return text
+
+
+def render_sql_literal(value: Any) -> str:
+    # A value of sql_value inlined in the SQL text, so it reads as the bound parameter does
+    if value is None:
+        return "NULL"
+    if isinstance(value, int):
+        return str(value)
+    if BACKSLASH_ESCAPES:
+        value = value.replace("\\", "\\\\")
+    return "'" + value.replace("'", "''") + "'"
+
+
+def sql_parameter(placeholder: Placeholder, values: List[str]) -> Any:
+    # The value sent to the database; unquoted placeholders are the values of SET clauses
+    return sql_value(values[placeholder.index], set_value=placeholder.unquoted)
+
+
+def sql_literal(placeholder: Placeholder, values: List[str]) -> str:
+    # The displayed query inlines the very value that is bound
+    return render_sql_literal(sql_parameter(placeholder, values))
+
+
+def bind_placeholders(value: Any, values: List[str]) -> Any:
+    """Return a copy of a Mongo plan argument with every placeholder replaced by its value."""
+    if isinstance(value, Placeholder):
+        return value.resolve(values)
+    if isinstance(value, dict):
+        return {key: bind_placeholders(item, values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [bind_placeholders(item, values) for item in value]
+    return value
+
+
+class QueryTemplate:
+    """
+    A compiled query with its literal values lifted out.
+
+    For SQL, query is the statement with %s markers and slots lists the placeholder
+    of each marker in order. For NoSQL, query is the Mongo plan with placeholders in
+    its filter and update documents. The template is compiled once per query shape
+    and bound to the values of every request. predicates holds the (table, field, operator)
+    of its conditions, which do not depend on the values.
+    """
+    def __init__(self, target: str, query: Any, slots: List[Placeholder], ast: str,
+                 predicates: Tuple[Tuple[str, str, str], ...] = ()):
+        self.target = target
+        self.query = query
+        self.slots = slots
+        self.ast = ast
+        self.predicates = predicates
+
+    def bind(self, values: List[str]) -> Tuple[Any, str, Optional[List[Any]]]:
+        """
+        Bind the values of one request.
+
+        :param values: The lifted VALUE tokens, in the order of the placeholders.
+        :return: A tuple of (query, AST repr, SQL parameters). The query is the SQL string
+                 with the values inlined for SQL, or the Mongo plan for NoSQL, where the
+                 parameters are None.
+        """
+        ast = self.ast
+        for index, value in enumerate(values):
+            ast = ast.replace(str(Placeholder(index)), value)
+        if self.target == "SQL":
+            pieces = self.query.split("%s")
+            inlined = [pieces[0]]
+            for placeholder, piece in zip(self.slots, pieces[1:]):
+                inlined.append(sql_literal(placeholder, values))
+                inlined.append(piece)
+            return "".join(inlined), ast, [sql_parameter(placeholder, values) for placeholder in self.slots]
+        return bind_placeholders(self.query, values), ast, None
+
+    def __repr__(self):
+        return f"QueryTemplate({self.target}, {self.query!r})"
+
+
+def template_key(tokens: List[Any]) -> str:
+    # The shape of a token stream: token types and values, with placeholders for the lifted values
+    return "\x1f".join(f"{token.type}\x1e{'?' if isinstance(token.value, Placeholder) else token.value}"
+                       for token in tokens)
+
@@ -0,0 +1,129 @@
+"""
+Leveled logging for the backend, quiet by default.
+
+Every module logs to a "chatdb.<module>" logger with lazily formatted messages
+(logger.debug("tokens: %s", tokens)), so a disabled level costs one check and the
+arguments are never turned into text.
+
+CHATDB_LOG_LEVEL        the level of the chatdb loggers (default WARNING)
+CHATDB_LOG_SAMPLE_RATE  the share of requests logged at every level whatever the level (default 0)
+CHATDB_LOG_FORMAT       "text" (default) or "json", one object per line
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+from typing import Any, Callable, Optional
+
+LOG_LEVEL = os.environ.get("CHATDB_LOG_LEVEL", "WARNING").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("CHATDB_LOG_SAMPLE_RATE", "0"))
+LOG_FORMAT = os.environ.get("CHATDB_LOG_FORMAT", "text")
+
+ROOT_LOGGER = "chatdb"
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# Request ids sent by clients are only kept when they look like one
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+_request_id = contextvars.ContextVar("chatdb_request_id", default=None)
+_sampled = contextvars.ContextVar("chatdb_sampled", default=False)
+_lock = threading.Lock()
+
+
+class SampledLogger(logging.Logger):
+    """A logger that is enabled at every level while a sampled request is handled."""
+    def isEnabledFor(self, level: int) -> bool:
+        return _sampled.get() or super().isEnabledFor(level)
+
+
+class RequestFilter(logging.Filter):
+    # Tags every record with the request it was logged for
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        record.sampled = _sampled.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "sampled": getattr(record, "sampled", False),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _sampled_logger(name: str) -> logging.Logger:
+    # Loggers are created by the logging manager, which builds them with the current logger class
+    with _lock:
+        previous = logging.getLoggerClass()
+        logging.setLoggerClass(SampledLogger)
+        try:
+            return logging.getLogger(name)
+        finally:
+            logging.setLoggerClass(previous)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, stream: Any = None) -> logging.Logger:
+    """(Re)configure the chatdb loggers: their level and the one handler that writes them to stderr."""
+    root = _sampled_logger(ROOT_LOGGER)
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.addFilter(RequestFilter())
+    handler.setFormatter(JSONFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    root.addHandler(handler)
+    # the records are not passed on to the root logger of the application
+    root.propagate = False
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return the logger of a module, e.g. get_logger("my") -> chatdb.my."""
+    return _sampled_logger(f"{ROOT_LOGGER}.{name}")
+
+
+def start_request(request_id: Optional[str] = None, sample_rate: float = LOG_SAMPLE_RATE) -> str:
+    """
+    Mark the start of a request in the current context: give it an id and decide
+    whether it is sampled, i.e. logged at every level. Return the request id.
+    """
+    if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    _sampled.set(sample_rate > 0 and random.random() < sample_rate)
+    return request_id
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def in_request_context(function: Callable) -> Callable:
+    """
+    Wrap a function so it runs with the request id and sampling of the caller, for
+    thread pools: run_in_executor and ThreadPoolExecutor.submit do not carry them over.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        # a context can only be entered by one thread at a time, every call gets its own copy
+        return context.copy().run(function, *args, **kwargs)
+    return run
+
+
+configure_logging()
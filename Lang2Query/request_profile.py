@@ -0,0 +1,158 @@
+"""
+Opt-in profiles of single requests, kept in a bounded ring buffer.
+
+A request asks for a profile with ?profile=1 or the X-ChatDB-Profile: 1 header:
+- "1" (or "cprofile") runs it under cProfile and keeps the pstats report and dump;
+- "sample" samples the stack of its thread every CHATDB_PROFILE_INTERVAL seconds
+  from a background thread and keeps the collapsed stacks, at a much lower overhead.
+
+Only one request is profiled with cProfile at a time (from Python 3.12 it hooks every
+thread), another one asking at the same time is sampled instead. The last
+CHATDB_PROFILE_BUFFER_SIZE profiles are kept under their request id and served by
+GET /profiles; 0 turns profiling off. A request that does not ask for a profile only
+pays for reading the flag.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional
+
+PROFILE_BUFFER_SIZE = int(os.environ.get("CHATDB_PROFILE_BUFFER_SIZE", "32"))
+# Seconds between two stack samples of a sampled request
+PROFILE_INTERVAL = float(os.environ.get("CHATDB_PROFILE_INTERVAL", "0.005"))
+# Functions listed in the pstats report, by cumulative time
+PROFILE_TOP = 40
+
+_MODES = {"1": "cprofile", "true": "cprofile", "yes": "cprofile", "cprofile": "cprofile", "sample": "sample"}
+
+_cprofile_lock = threading.Lock()
+
+
+def profile_mode(value: Any) -> Optional[str]:
+    """The profiler a request asked for ("cprofile" or "sample"), or None."""
+    if not value or not PROFILE_BUFFER_SIZE:
+        return None
+    return _MODES.get(str(value).lower())
+
+
+class ProfileBuffer:
+    """The last profiles, oldest dropped first."""
+    def __init__(self, maxsize: int = PROFILE_BUFFER_SIZE):
+        self.entries = deque(maxlen=max(maxsize, 1))
+        self.lock = threading.Lock()
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries.append(entry)
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        # a client may send the same request id twice, the latest profile wins
+        with self.lock:
+            for entry in reversed(self.entries):
+                if entry["request_id"] == request_id:
+                    return entry
+        return None
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """The profiles without their reports, newest first."""
+        with self.lock:
+            entries = list(self.entries)
+        return [{key: value for key, value in entry.items() if key not in ("report", "dump")}
+                for entry in reversed(entries)]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+profiles = ProfileBuffer()
+
+
+class StackSampler:
+    """Count the stacks of one thread, sampled from a background thread."""
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="chatdb-profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[collapse_stack(frame)] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self) -> str:
+        # one "outer;...;inner count" line per stack, the input of flamegraph.pl and speedscope
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+def collapse_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _cprofile_report(profiler: cProfile.Profile):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    profiler.create_stats()
+    # the format of Profile.dump_stats, loadable with pstats.Stats or snakeviz
+    return stream.getvalue(), marshal.dumps(profiler.stats)
+
+
+def profile_call(mode: str, request_id: str, query: Any, function: Callable, *args, **kwargs):
+    """
+    Call function under the profiler of mode and keep its profile under request_id.
+    Return what function returns; its exceptions are raised after the profile is kept.
+    """
+    profiler = None
+    if mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+    else:
+        mode = "sample"
+        sampler = StackSampler(threading.get_ident())
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            try:
+                return profiler.runcall(function, *args, **kwargs)
+            finally:
+                _cprofile_lock.release()
+        sampler.start()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            sampler.stop()
+    finally:
+        entry = {
+            "request_id": request_id,
+            "mode": mode,
+            "query": query,
+            "started": started,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+        if profiler is not None:
+            entry["report"], entry["dump"] = _cprofile_report(profiler)
+        else:
+            entry["samples"] = sum(sampler.counts.values())
+            entry["report"] = sampler.report()
+        profiles.add(entry)
@@ -0,0 +1,110 @@
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List
+
+try:
+    import orjson
+except ImportError:  # optional, the json module is used without it
+    orjson = None
+
+# The number of rows fetched from the database at a time in streaming mode
+STREAM_BATCH_SIZE = 500
+# The largest page a client can ask for in paginated mode
+MAX_PAGE_SIZE = 1000
+
+
+def json_default(value: Any) -> Any:
+    # Values that json.dumps does not know, e.g. DECIMAL/DATE columns or ObjectId
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def dumps_json(value: Any) -> str:
+    """Serialize a response or a row, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(value, default=json_default)
+
+
+def ndjson_lines(header: Dict[str, Any], batches: Iterable[List[Any]]) -> Iterator[str]:
+    """
+    Turn batches of rows into a newline-delimited JSON response body.
+
+    The first line is the header, then one {"row": ...} line per row and a final
+    {"done": true, "count": n} line. An error in the middle of the result ends the
+    stream with an {"error": ...} line instead.
+
+    :param header: The first line, e.g. {"target": "SQL", "type": "execute"}.
+    :param batches: Batches of rows, as produced by stream_sql_query or stream_nosql_query.
+    :return: An iterator of response lines.
+    """
+    yield dumps_json(header) + "\n"
+    count = 0
+    try:
+        for batch in batches:
+            count += len(batch)
+            if batch:
+                yield _row_lines(batch)
+    except Exception as err:
+        yield dumps_json({"error": str(err), "count": count}) + "\n"
+        return
+    yield dumps_json({"done": True, "count": count}) + "\n"
+
+
+async def ndjson_lines_async(header: Dict[str, Any], batches: AsyncIterable[List[Any]]) -> AsyncIterator[str]:
+    """The same response body as ndjson_lines, for batches produced by an async database driver."""
+    yield dumps_json(header) + "\n"
+    count = 0
+    try:
+        async for batch in batches:
+            count += len(batch)
+            if batch:
+                yield _row_lines(batch)
+    except Exception as err:
+        yield dumps_json({"error": str(err), "count": count}) + "\n"
+        return
+    yield dumps_json({"done": True, "count": count}) + "\n"
+
+
+def _row_lines(batch: List[Any]) -> str:
+    return "\n".join(dumps_json({"row": row}) for row in batch) + "\n"
+
+
+def _query_digest(query: str) -> str:
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_page_token(query: str, offset: int) -> str:
+    """
+    Return the opaque token for the page of the query that starts at offset.
+
+    The token is bound to the query text, so it cannot be replayed against another query.
+    It holds an offset, not a keyset cursor: the next page is read with LIMIT/OFFSET or a
+    cursor skip, as the generated queries have no unique sort key to resume after.
+    """
+    payload = json.dumps({"q": _query_digest(query), "o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(query: str, token: str) -> int:
+    """
+    Return the offset stored in a page token.
+
+    :raises ValueError: If the token is malformed or was issued for another query.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        digest, offset = payload["q"], int(payload["o"])
+    except (ValueError, KeyError, TypeError) as err:
+        raise ValueError(f"Invalid page token: {err}")
+    if digest != _query_digest(query) or offset < 0:
+        raise ValueError("The page token does not belong to this query.")
+    return offset
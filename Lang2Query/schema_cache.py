@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def file_fingerprint(file_paths: List[str]) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    Identify a set of data files by path, modification time and size.
+
+    :param file_paths: Paths of the uploaded CSV/JSON files.
+    :return: A tuple of (path, mtime in ns, size) entries, in the order of the paths.
+    """
+    fingerprint = []
+    for path in file_paths:
+        stat = os.stat(path)
+        fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+class SchemaEntry:
+    """Everything derived from the data files that the compiler needs for one dataset."""
+    def __init__(self, fingerprint, db_type, symbol_table, table_names, token_rules, lexer):
+        self.fingerprint = fingerprint
+        self.db_type = db_type
+        self.symbol_table = symbol_table
+        self.table_names = table_names
+        self.token_rules = token_rules
+        self.lexer = lexer
+
+    def __repr__(self):
+        return f"SchemaEntry({self.db_type}, {self.table_names})"
+
+
+class SchemaCache:
+    """
+    LRU cache of schema entries keyed by the file fingerprint.
+
+    A changed file gets a new fingerprint, so it misses the cache and the stale
+    entry for the same paths is dropped. on_invalidate is called with the
+    fingerprint of every dropped or evicted entry, so caches built on top of a
+    schema can forget it as well.
+    """
+    def __init__(self, maxsize: int = 16, on_invalidate: Optional[Callable[[tuple], None]] = None):
+        self.maxsize = maxsize
+        self.on_invalidate = on_invalidate
+        self.entries: "OrderedDict[tuple, SchemaEntry]" = OrderedDict()
+        # path tuple -> fingerprint currently cached for these paths
+        self.latest: Dict[Tuple[str, ...], tuple] = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, file_paths: List[str], loader: Callable[[List[str], tuple], SchemaEntry]) -> SchemaEntry:
+        """
+        Return the schema entry for the files, building it with the loader on a miss.
+
+        :param file_paths: Paths of the uploaded CSV/JSON files.
+        :param loader: Called as loader(file_paths, fingerprint) to build a missing entry.
+        :return: The cached or freshly built entry.
+        """
+        fingerprint = file_fingerprint(file_paths)
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is not None:
+                self.entries.move_to_end(fingerprint)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = loader(file_paths, fingerprint)
+
+        paths = tuple(file_paths)
+        dropped = []
+        with self.lock:
+            stale = self.latest.get(paths)
+            if stale is not None and stale != fingerprint:
+                self.entries.pop(stale, None)
+                dropped.append(stale)
+            self.latest[paths] = fingerprint
+            self.entries[fingerprint] = entry
+            self.entries.move_to_end(fingerprint)
+            while len(self.entries) > self.maxsize:
+                evicted, _ = self.entries.popitem(last=False)
+                dropped.append(evicted)
+                evicted_paths = tuple(path for path, _, _ in evicted)
+                if self.latest.get(evicted_paths) == evicted:
+                    del self.latest[evicted_paths]
+        self._invalidate(dropped)
+        return entry
+
+    def _invalidate(self, fingerprints: List[tuple]) -> None:
+        if self.on_invalidate is not None:
+            for fingerprint in fingerprints:
+                self.on_invalidate(fingerprint)
+
+    def clear(self) -> None:
+        with self.lock:
+            dropped = list(self.entries)
+            self.entries.clear()
+            self.latest.clear()
+        self._invalidate(dropped)
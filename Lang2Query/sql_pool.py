@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# The MySQL database loaded by Database/SQL/chatdb/backend_insert_data.go
+MYSQL_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 3306,
+    "user": "root",
+    "password": "Ilikedsci551",
+    "database": "project551",
+    # pooled connections live across requests, without autocommit every
+    # SELECT would keep reading the snapshot of an old transaction
+    "autocommit": True,
+}
+
+SQL_POOL_SIZE = int(os.environ.get("CHATDB_SQL_POOL_SIZE", "5"))
+SQL_POOL_TIMEOUT = float(os.environ.get("CHATDB_SQL_POOL_TIMEOUT", "10"))
+SQL_POOL_RECYCLE = float(os.environ.get("CHATDB_SQL_POOL_RECYCLE", "3600"))
+SQL_POOL_PING_AFTER = float(os.environ.get("CHATDB_SQL_POOL_PING_AFTER", "30"))
+
+
+class PoolTimeoutError(Exception):
+    # No connection became free within the pool timeout
+    pass
+
+
+def default_ping(connection) -> None:
+    """Raise if the connection is no longer usable."""
+    if hasattr(connection, "ping"):
+        connection.ping(reconnect=False)
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+class _PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of database connections.
+
+    At most size connections are open at a time. A connection older than
+    recycle seconds is closed and replaced on checkout, and a connection that
+    has been idle for more than ping_after seconds is health checked with ping
+    before it is handed out. Any DB-API driver works, the connect function
+    only has to return a new connection.
+    """
+    def __init__(self, connect: Callable[[], Any], size: int = SQL_POOL_SIZE, timeout: float = SQL_POOL_TIMEOUT,
+                 recycle: float = SQL_POOL_RECYCLE, ping_after: float = SQL_POOL_PING_AFTER,
+                 ping: Callable[[Any], None] = default_ping):
+        if size < 1:
+            raise ValueError("The pool size must be at least 1.")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.ping = ping
+        self.idle = []
+        self.open_count = 0
+        self.condition = threading.Condition()
+        self.metrics = {
+            "checkouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _close(self, pooled: _PooledConnection) -> None:
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def _check(self, pooled: _PooledConnection) -> Optional[str]:
+        # Runs outside the lock, the connection is owned by the caller at this point.
+        # Return the metric to count if the connection has to be replaced.
+        now = time.monotonic()
+        if now - pooled.created_at > self.recycle:
+            return "recycled"
+        if now - pooled.last_used > self.ping_after:
+            try:
+                self.ping(pooled.connection)
+            except Exception:
+                return "failed_health_checks"
+        return None
+
+    def acquire(self) -> _PooledConnection:
+        """Check a connection out of the pool, opening one if the pool is not full."""
+        start = time.monotonic()
+        waited = False
+        while True:
+            with self.condition:
+                while not self.idle and self.open_count >= self.size:
+                    waited = True
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self.metrics["timeouts"] += 1
+                        raise PoolTimeoutError(f"No database connection became free within {self.timeout} seconds.")
+                    self.condition.wait(remaining)
+                if self.idle:
+                    pooled = self.idle.pop()
+                else:
+                    pooled = None
+                    self.open_count += 1
+
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(self.connect())
+                except Exception:
+                    with self.condition:
+                        self.open_count -= 1
+                        self.condition.notify()
+                    raise
+                with self.condition:
+                    self.metrics["created"] += 1
+                break
+
+            replaced = self._check(pooled)
+            if replaced is None:
+                break
+            self._close(pooled)
+            with self.condition:
+                self.metrics[replaced] += 1
+                self.open_count -= 1
+
+        wait_seconds = time.monotonic() - start
+        with self.condition:
+            self.metrics["checkouts"] += 1
+            if waited:
+                self.metrics["waits"] += 1
+                self.metrics["wait_seconds_total"] += wait_seconds
+                self.metrics["wait_seconds_max"] = max(self.metrics["wait_seconds_max"], wait_seconds)
+        return pooled
+
+    def release(self, pooled: _PooledConnection, discard: bool = False) -> None:
+        """Return a connection to the pool, or close it if discard is True."""
+        if discard:
+            self._close(pooled)
+        else:
+            pooled.last_used = time.monotonic()
+        with self.condition:
+            if discard:
+                self.open_count -= 1
+            else:
+                self.idle.append(pooled)
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with block.
+
+        If the block raises, the open transaction is rolled back; a connection
+        that cannot even roll back is closed instead of being returned.
+        """
+        pooled = self.acquire()
+        discard = False
+        try:
+            yield pooled.connection
+        except BaseException:
+            # also covers GeneratorExit when a streaming generator is closed early
+            try:
+                pooled.connection.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(pooled, discard=discard)
+
+    def close_all(self) -> None:
+        """Close the idle connections, for example before the process exits."""
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.open_count -= len(idle)
+            self.condition.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.condition:
+            stats = dict(self.metrics)
+            stats["size"] = self.size
+            stats["open"] = self.open_count
+            stats["idle"] = len(self.idle)
+        return stats
+
+
+_sql_pool: Optional[ConnectionPool] = None
+_sql_pool_lock = threading.Lock()
+
+
+def get_sql_pool() -> ConnectionPool:
+    """Return the process-wide pool of MySQL connections, creating it on first use."""
+    global _sql_pool
+    if _sql_pool is None:
+        with _sql_pool_lock:
+            if _sql_pool is None:
+                # the driver is only needed for the MySQL pool, ConnectionPool works with any DB-API module
+                import mysql.connector
+                _sql_pool = ConnectionPool(lambda: mysql.connector.connect(**MYSQL_CONFIG))
+    return _sql_pool
@@ -0,0 +1,112 @@
+"""
+Tests of the columnar cache: every dataset must read back exactly as it was written.
+
+Run inside the Lang2Query folder: python3 -m unittest test_columnar_cache
+"""
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from columnar_cache import ColumnarTable, ingest_file, open_columnar
+from json_stream import read_json_documents
+
+
+class ColumnarCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.folder, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, text):
+        path = os.path.join(self.folder, name)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return path
+
+    def table(self, path):
+        table = ColumnarTable(ingest_file(path, self.cache_dir))
+        self.addCleanup(table.close)
+        return table
+
+    def kinds(self, table):
+        return {column["name"]: column["kind"] for column in table.meta["columns"]}
+
+    def test_csv_round_trip(self):
+        path = self.write("people.csv", 'Name,Code,Note\nAnn,01,"a, b"\nBob,2,\nÉva,3,"line\nbreak"\n')
+        table = self.table(path)
+        with open(path, "r", encoding="utf-8") as f:
+            expected = list(csv.DictReader(f))
+        self.assertEqual(table.fields, ["Name", "Code", "Note"])
+        self.assertEqual(table.rows(), expected)
+        self.assertEqual(table.rows(1, start=1), expected[1:2])
+        # CSV cells stay strings, "01" keeps its leading zero
+        self.assertEqual(table.column("Code"), ["01", "2", "3"])
+        self.assertEqual(set(self.kinds(table).values()), {"str"})
+
+    def test_json_round_trip(self):
+        documents = [
+            {"id": 1, "price": 1.5, "mixed": 1, "name": "a", "tags": ["x"], "nested": {"k": None}},
+            {"id": 2, "price": 2.25, "mixed": 2.5, "name": None, "tags": [], "extra": True},
+            {"id": 3, "price": -0.5, "mixed": 3, "name": "ü", "tags": ["y", 1]},
+        ]
+        path = self.write("items.json", json.dumps(documents))
+        table = self.table(path)
+        self.assertEqual(list(table.iter_rows()), documents)
+        self.assertEqual(table.layout, "array")
+        kinds = self.kinds(table)
+        self.assertEqual((kinds["id"], kinds["price"], kinds["mixed"]), ("int64", "float64", "json"))
+        # a column mixing ints and floats keeps the type of every cell
+        self.assertEqual([type(value) for value in table.column("mixed")], [int, float, int])
+        self.assertEqual(list(table.column("id")), [1, 2, 3])
+
+    def test_missing_fields_are_not_present(self):
+        documents = [{"a": 1}, {"b": 2}, {"a": 3, "b": None}]
+        path = self.write("sparse.json", "\n".join(json.dumps(document) for document in documents))
+        table = self.table(path)
+        self.assertEqual(table.rows(), documents)
+        self.assertEqual(table.cell("a", 1), (False, None))
+        self.assertEqual(table.cell("b", 2), (True, None))
+        self.assertEqual(table.layout, "ndjson")
+        self.assertEqual(read_json_documents(path), ("ndjson", table.rows()))
+
+    def test_big_ints_stay_exact(self):
+        documents = [{"n": 2 ** 63 - 1}, {"n": 2 ** 63}, {"n": -2 ** 63}]
+        table = self.table(self.write("big.json", json.dumps(documents)))
+        self.assertEqual(self.kinds(table)["n"], "json")
+        self.assertEqual(table.rows(), documents)
+
+    def test_empty_dataset(self):
+        table = self.table(self.write("empty.json", "[]"))
+        self.assertEqual((table.row_count, table.rows()), (0, []))
+
+    def test_changed_file_is_not_served(self):
+        path = self.write("items.json", json.dumps([{"a": 1}]))
+        ingest_file(path, self.cache_dir)
+        table = open_columnar(path, self.cache_dir)
+        self.assertEqual(table.rows(), [{"a": 1}])
+        self.assertIs(open_columnar(path, self.cache_dir), table)
+        time.sleep(0.01)
+        self.write("items.json", json.dumps([{"a": 1}, {"a": 2}]))
+        self.assertIsNone(open_columnar(path, self.cache_dir))
+        ingest_file(path, self.cache_dir)
+        table = open_columnar(path, self.cache_dir)
+        self.addCleanup(table.close)
+        self.assertEqual(table.rows(), [{"a": 1}, {"a": 2}])
+
+    def test_unsupported_files(self):
+        with self.assertRaises(ValueError):
+            ingest_file(self.write("notes.txt", "x"), self.cache_dir)
+        with self.assertRaises(ValueError):
+            ingest_file(self.write("scalars.json", "[1, 2]"), self.cache_dir)
+        # the half-written cache was removed
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Tests of the in-process document store that stands in for MongoDB.
+
+Run inside the Lang2Query folder: python3 -m unittest test_document_store
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from document_store import DocumentStore, matches
+
+COUNTRIES = [
+    {"_id": {"$oid": "c1"}, "Code": "AFG", "Name": "Afghanistan", "Continent": "Asia", "Population": 22720000,
+     "Languages": ["Pashto", "Dari"], "Capital": {"Name": "Kabul"}},
+    {"_id": {"$oid": "c2"}, "Code": "NLD", "Name": "Netherlands", "Continent": "Europe", "Population": 15864000,
+     "Languages": ["Dutch"], "Capital": {"Name": "Amsterdam"}},
+    {"_id": {"$oid": "c3"}, "Code": "BEL", "Name": "Belgium", "Continent": "Europe", "Population": 10239000,
+     "Languages": [], "Capital": {"Name": "Brussels"}},
+]
+CITIES = [
+    {"_id": "k1", "Name": "Kabul", "CountryCode": "AFG"},
+    {"_id": "k2", "Name": "Herat", "CountryCode": "AFG"},
+    {"_id": "k3", "Name": "Amsterdam", "CountryCode": "NLD"},
+]
+
+
+class DocumentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for name, documents in [("country", COUNTRIES), ("city", CITIES)]:
+            with open(os.path.join(self.folder, f"{name}.json"), "w", encoding="utf-8") as f:
+                json.dump(documents, f)
+        self.store = DocumentStore(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def aggregate(self, name, pipeline):
+        return list(self.store.aggregate(name, pipeline))
+
+    def test_extended_json_ids(self):
+        self.assertEqual([document["_id"] for document in self.store.find("country")], ["c1", "c2", "c3"])
+
+    def test_match(self):
+        result = self.aggregate("country", [{"$match": {"Continent": "Europe", "Population": {"$gt": 11000000}}}])
+        self.assertEqual([document["Code"] for document in result], ["NLD"])
+        result = self.aggregate("country", [{"$match": {"$or": [{"Code": "BEL"}, {"Capital.Name": "Kabul"}]}}])
+        self.assertEqual([document["Code"] for document in result], ["AFG", "BEL"])
+        # an equality on an array field matches its elements
+        self.assertEqual([d["Code"] for d in self.store.find("country", {"Languages": "Dutch"})], ["NLD"])
+        self.assertFalse(matches({"a": 1}, {"b": {"$exists": True}}))
+        with self.assertRaises(ValueError):
+            self.aggregate("country", [{"$match": {"$where": "1"}}])
+
+    def test_match_on_an_index_gives_the_same_documents(self):
+        query = {"Continent": "Europe", "Population": {"$lt": 12000000}}
+        scanned = list(self.store.find("country", query))
+        self.assertTrue(self.store.create_index("country", "Continent"))
+        self.assertFalse(self.store.create_index("country", "Continent"))
+        self.assertEqual(list(self.store.find("country", query)), scanned)
+        self.assertEqual(len(self.store.collection("country").candidates(query)), 2)
+
+    def test_lookup(self):
+        pipeline = [{"$match": {"Continent": "Asia"}},
+                    {"$lookup": {"from": "city", "localField": "Code", "foreignField": "CountryCode", "as": "Cities"}}]
+        for index in [False, True]:
+            if index:
+                self.store.create_index("city", "CountryCode")
+            [country] = self.aggregate("country", pipeline)
+            self.assertEqual([city["Name"] for city in country["Cities"]], ["Kabul", "Herat"], index)
+        result = self.aggregate("country", [{"$lookup": {"from": "city", "localField": "Code",
+                                                         "foreignField": "CountryCode", "as": "Cities"}}])
+        self.assertEqual([len(document["Cities"]) for document in result], [2, 1, 0])
+        with self.assertRaises(ValueError):
+            self.aggregate("country", [{"$lookup": {"from": "city", "pipeline": []}}])
+
+    def test_group(self):
+        result = self.aggregate("country", [
+            {"$group": {"_id": "$Continent", "total": {"$sum": "$Population"}, "count": {"$count": {}},
+                        "average": {"$avg": "$Population"}, "smallest": {"$min": "$Population"},
+                        "codes": {"$push": "$Code"}}},
+            {"$sort": {"_id": 1}}])
+        self.assertEqual(result, [
+            {"_id": "Asia", "total": 22720000, "count": 1, "average": 22720000.0, "smallest": 22720000,
+             "codes": ["AFG"]},
+            {"_id": "Europe", "total": 26103000, "count": 2, "average": 13051500.0, "smallest": 10239000,
+             "codes": ["NLD", "BEL"]},
+        ])
+        self.assertEqual(self.aggregate("country", [{"$group": {"_id": None, "n": {"$sum": 1}}}]),
+                         [{"_id": None, "n": 3}])
+        with self.assertRaises(ValueError):
+            self.aggregate("country", [{"$group": {"_id": None, "n": {"$median": "$Population"}}}])
+
+    def test_unwind(self):
+        result = self.aggregate("country", [{"$unwind": "$Languages"}, {"$project": {"_id": 0, "Languages": 1}}])
+        self.assertEqual(result, [{"Languages": "Pashto"}, {"Languages": "Dari"}, {"Languages": "Dutch"}])
+        result = self.aggregate("country", [{"$unwind": {"path": "$Languages", "preserveNullAndEmptyArrays": True}},
+                                            {"$project": {"_id": 0, "Code": 1, "Languages": 1}}])
+        self.assertEqual(result[-1], {"Code": "BEL"})
+        self.assertEqual(len(result), 4)
+        # the stored documents are not changed
+        self.assertEqual(self.store.collection("country").documents[0]["Languages"], ["Pashto", "Dari"])
+
+    def test_project(self):
+        [result] = self.aggregate("country", [{"$match": {"Code": "NLD"}},
+                                              {"$project": {"Name": 1, "Capital.Name": 1, "Head": "$Capital.Name"}}])
+        self.assertEqual(result, {"_id": "c2", "Name": "Netherlands", "Capital": {"Name": "Amsterdam"},
+                                  "Head": "Amsterdam"})
+        [result] = self.store.find("country", {"Code": "BEL"}, {"_id": 0, "Languages": 0, "Capital": 0})
+        self.assertEqual(result, {"Code": "BEL", "Name": "Belgium", "Continent": "Europe", "Population": 10239000})
+        [result] = self.store.find("country", {"Code": "AFG"}, {"_id": 0, "Code": 1, "Missing": 1})
+        self.assertEqual(result, {"Code": "AFG"})
+
+    def test_unsupported_stage(self):
+        with self.assertRaises(ValueError):
+            self.aggregate("country", [{"$facet": {}}])
+        with self.assertRaises(ValueError):
+            self.aggregate("country", [{"$match": {}, "$limit": 1}])
+
+    def test_writes(self):
+        reader = self.store.find("city")
+        first = next(reader)
+        self.assertEqual(self.store.insert("city", [{"Name": "Utrecht", "CountryCode": "NLD"}]), 1)
+        self.assertEqual(self.store.update("city", {"CountryCode": "AFG"}, {"$set": {"Country.Code": "AF"}}), 2)
+        self.assertEqual(self.store.update("city", {"CountryCode": "NLD"}, {"$inc": {"Visits": 2}}, many=False), 1)
+        self.assertEqual(self.store.delete("city", {"Name": "Herat"}), 1)
+        self.assertEqual(self.store.delete("city", {"Name": "Nowhere"}), 0)
+        # a reader that started before the writes sees the documents it started with
+        self.assertEqual([city["Name"] for city in [first, *reader]], ["Kabul", "Herat", "Amsterdam"])
+        cities = list(self.store.find("city"))
+        self.assertEqual([city["Name"] for city in cities], ["Kabul", "Amsterdam", "Utrecht"])
+        self.assertEqual(cities[0]["Country"], {"Code": "AF"})
+        self.assertEqual([city.get("Visits") for city in cities], [None, 2, None])
+        with self.assertRaises(ValueError):
+            self.store.update("city", {}, {"$push": {"Tags": "x"}})
+
+    def test_changed_file_is_reloaded(self):
+        self.store.create_index("city", "CountryCode")
+        self.store.insert("city", [{"Name": "Utrecht"}])
+        with open(os.path.join(self.folder, "city.json"), "w", encoding="utf-8") as f:
+            json.dump(CITIES[:1] + [{"_id": "k9", "Name": "Ghent", "CountryCode": "BEL"}], f)
+        os.utime(os.path.join(self.folder, "city.json"), ns=(0, 1))
+        self.assertEqual([city["Name"] for city in self.store.find("city")], ["Kabul", "Ghent"])
+        self.assertIn("CountryCode", self.store.collection("city").indexes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Tests of the incremental JSON reader, with values cut at every chunk boundary.
+
+Run inside the Lang2Query folder: python3 -m unittest test_json_stream
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from json_stream import iter_json_documents, read_json_documents
+
+
+class JsonStreamTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, text):
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def documents(self, chunk_size):
+        return [document for layout, document in iter_json_documents(self.path, chunk_size=chunk_size)]
+
+    def test_values_cut_at_every_chunk_boundary(self):
+        documents = [1.5, 1e5, 1.5e+3, -0.25, 10, True, False, None, "a\\u00e9\\\"b",
+                     {"price": 12.75, "tags": ["x", 3e-2]}, [[], {}]]
+        self.write(json.dumps(documents))
+        expected = json.loads(json.dumps(documents))
+        for chunk_size in range(1, 20):
+            self.assertEqual(self.documents(chunk_size), expected, chunk_size)
+
+    def test_number_cut_after_its_point_at_the_default_chunk_size(self):
+        for number in ("1.5", "1e5", "1.5e+3"):
+            cut = number.index(next(char for char in number if char in ".e")) + 1
+            padding = " " * (64 * 1024 - 1 - cut)
+            self.write("[" + padding + number + "]")
+            self.assertEqual(self.documents(64 * 1024), [json.loads(number)], number)
+
+    def test_ndjson_ending_in_a_number(self):
+        self.write('{"a": 1}\n{"b": [2]}\n3.5e10')
+        for chunk_size in range(1, 12):
+            self.assertEqual(self.documents(chunk_size), [{"a": 1}, {"b": [2]}, 3.5e10], chunk_size)
+        self.assertEqual(read_json_documents(self.path, 2), ("ndjson", [{"a": 1}, {"b": [2]}]))
+
+    def test_layouts(self):
+        self.write('{"a": 1}')
+        self.assertEqual(read_json_documents(self.path), ("object", [{"a": 1}]))
+        self.write(" [ ] ")
+        self.assertEqual(read_json_documents(self.path), (None, []))
+        self.write('[{"a": 1}, {"a": 2}, {"a": 3}]')
+        self.assertEqual(read_json_documents(self.path, 2), ("array", [{"a": 1}, {"a": 2}]))
+
+    def test_missing_or_extra_commas_are_errors(self):
+        for text in ("[1 2]", "[1,,2]", "[,1]", "[1,]", "[truex]", '[1"a"]'):
+            self.write(text)
+            for chunk_size in (1, 2, 64):
+                with self.assertRaises(json.JSONDecodeError, msg=(text, chunk_size)):
+                    self.documents(chunk_size)
+
+    def test_unterminated_array(self):
+        self.write("[1, 2")
+        with self.assertRaises(ValueError):
+            self.documents(3)
+
+    def test_errors_report_file_positions(self):
+        self.write('[{"a": 1},\n {"b": 2},\n {"c": tru}]')
+        for chunk_size in (1, 4, 7, 64):
+            with self.assertRaises(json.JSONDecodeError) as raised:
+                self.documents(chunk_size)
+            with self.assertRaises(json.JSONDecodeError) as expected:
+                json.loads('{"c": tru}')
+            self.assertEqual((raised.exception.lineno, raised.exception.colno, raised.exception.pos),
+                             (3, 8, 29), chunk_size)
+            self.assertEqual(raised.exception.msg, expected.exception.msg)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests of the values bound to query templates and inlined in the displayed SQL.
+
+Run inside the Lang2Query folder: python3 -m unittest test_query_template
+"""
+import unittest
+
+import query_template
+from query_template import Placeholder, QueryTemplate, render_sql_literal, sql_value
+
+
+class SqlValueTest(unittest.TestCase):
+    def test_unquoted_ascii_digits_are_ints(self):
+        self.assertEqual(sql_value("5"), 5)
+        self.assertEqual(sql_value("01234"), 1234)
+
+    def test_quoted_values_stay_strings(self):
+        self.assertEqual(sql_value('"01234"'), "01234")
+        self.assertEqual(sql_value("'5'"), "5")
+        self.assertEqual(sql_value("'Black'"), "Black")
+        self.assertEqual(sql_value('"²"'), "²")
+
+    def test_other_digits_are_not_ints(self):
+        self.assertEqual(sql_value("²"), "²")
+        self.assertEqual(sql_value("٣"), "٣")
+
+    def test_null_only_in_set_clauses(self):
+        self.assertIsNone(sql_value('"NULL"', set_value=True))
+        self.assertIsNone(sql_value("NULL", set_value=True))
+        self.assertEqual(sql_value('"NULL"'), "NULL")
+
+
+class RenderSqlLiteralTest(unittest.TestCase):
+    def setUp(self):
+        self.backslash_escapes = query_template.BACKSLASH_ESCAPES
+
+    def tearDown(self):
+        query_template.BACKSLASH_ESCAPES = self.backslash_escapes
+
+    def test_literals(self):
+        self.assertEqual(render_sql_literal(None), "NULL")
+        self.assertEqual(render_sql_literal(12), "12")
+        self.assertEqual(render_sql_literal("O'Brien"), "'O''Brien'")
+
+    def test_backslashes(self):
+        query_template.BACKSLASH_ESCAPES = True
+        self.assertEqual(render_sql_literal("C:\\"), "'C:\\\\'")
+        query_template.BACKSLASH_ESCAPES = False
+        self.assertEqual(render_sql_literal("C:\\"), "'C:\\'")
+
+
+class QueryTemplateTest(unittest.TestCase):
+    def test_sql_bind_inlines_the_bound_values(self):
+        template = QueryTemplate("SQL", "UPDATE t SET code = %s WHERE name = %s AND n > %s;",
+                                 [Placeholder(0).strip_quotes(), Placeholder(1), Placeholder(2)], "AST")
+        query, ast, params = template.bind(['"01234"', "'O''x'", "7"])
+        self.assertEqual(params, ["01234", "O''x", 7])
+        self.assertEqual(query, "UPDATE t SET code = '01234' WHERE name = 'O''''x' AND n > 7;")
+        query, ast, params = template.bind(['"NULL"', '"²"', "²"])
+        self.assertEqual(params, [None, "²", "²"])
+        self.assertEqual(query, "UPDATE t SET code = NULL WHERE name = '²' AND n > '²';")
+
+    def test_nosql_bind_replaces_placeholders(self):
+        plan = {"filter": {"Name": {"$eq": Placeholder(0)}}, "update": {"$set": {"Code": Placeholder(1).strip_quotes()}}}
+        template = QueryTemplate("NoSQL", plan, [], f"AST {Placeholder(0)}")
+        query, ast, params = template.bind(["'Kabul'", '"01"'])
+        self.assertEqual(query, {"filter": {"Name": {"$eq": "'Kabul'"}}, "update": {"$set": {"Code": "01"}}})
+        self.assertEqual(ast, "AST 'Kabul'")
+        self.assertIsNone(params)
+
+
+if __name__ == "__main__":
+    unittest.main()
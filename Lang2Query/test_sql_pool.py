@@ -0,0 +1,91 @@
+"""
+Tests of the connection pool with sqlite3 standing in for MySQL.
+
+Run inside the Lang2Query folder: python3 -m unittest test_sql_pool
+"""
+import sqlite3
+import threading
+import time
+import unittest
+
+from sql_pool import ConnectionPool, PoolTimeoutError, default_ping
+
+
+def connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def test_checkout_reuses_connections(self):
+        pool = ConnectionPool(connect, size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual((stats["created"], stats["checkouts"], stats["open"], stats["idle"]), (1, 2, 1, 1))
+
+    def test_timeout_when_pool_is_exhausted(self):
+        pool = ConnectionPool(connect, size=1, timeout=0.05)
+        held = pool.acquire()
+        with self.assertRaises(PoolTimeoutError):
+            pool.acquire()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        pool.release(held)
+        self.assertIs(pool.acquire(), held)
+
+    def test_waiter_gets_released_connection(self):
+        pool = ConnectionPool(connect, size=1, timeout=5)
+        held = pool.acquire()
+        threading.Timer(0.05, pool.release, [held]).start()
+        self.assertIs(pool.acquire(), held)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_recycle_replaces_old_connections(self):
+        pool = ConnectionPool(connect, size=1, recycle=0)
+        with pool.connection() as first:
+            pass
+        time.sleep(0.001)
+        with pool.connection() as second:
+            self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()["recycled"], 1)
+        # the recycled connection was closed
+        with self.assertRaises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+
+    def test_failed_ping_replaces_idle_connection(self):
+        pool = ConnectionPool(connect, size=1, ping_after=0)
+        with pool.connection() as first:
+            pass
+        first.close()
+        time.sleep(0.001)
+        with pool.connection() as second:
+            self.assertIsNot(first, second)
+            default_ping(second)
+        self.assertEqual(pool.stats()["failed_health_checks"], 1)
+
+    def test_rollback_on_error(self):
+        pool = ConnectionPool(connect, size=1)
+        with pool.connection() as connection:
+            connection.execute("CREATE TABLE t (x INTEGER)")
+            connection.commit()
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as connection:
+                connection.execute("INSERT INTO t VALUES (1)")
+                raise RuntimeError("the request failed")
+        with pool.connection() as connection:
+            self.assertEqual(connection.execute("SELECT count(*) FROM t").fetchone(), (0,))
+
+    def test_connection_that_cannot_roll_back_is_discarded(self):
+        pool = ConnectionPool(connect, size=1)
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as connection:
+                connection.close()
+                raise RuntimeError("the connection broke")
+        self.assertEqual((pool.stats()["open"], pool.stats()["idle"]), (0, 0))
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, connection)
+
+
+if __name__ == "__main__":
+    unittest.main()
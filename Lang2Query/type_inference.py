@@ -0,0 +1,170 @@
+import csv
+import random
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from columnar_cache import open_columnar
+
+
+def infer_sql_type(value: Any) -> str:
+    # SQL Type Value
+
+    if value is None or (isinstance(value, str) and value.strip() == ""):
+        return "NULL"
+    if isinstance(value, str) and value.lower() in ["true", "false"]:
+        return "BOOLEAN"
+    try:
+        if isinstance(value, str) and value.isdigit():
+            return "INTEGER"
+        float(value)
+        if "." in str(value):
+            return "REAL"
+    except ValueError:
+        pass
+    if isinstance(value, str) and value.startswith("[") and value.endswith("]"):
+        return "ARRAY"
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return "JSON"
+    if isinstance(value, str):
+        date_pattern = r"^\d{4}-\d{2}-\d{2}$"
+        if re.match(date_pattern, value):
+            return "DATE"
+        datetime_pattern = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$"
+        if re.match(datetime_pattern, value):
+            return "DATETIME"
+    return "TEXT"
+
+
+# The number of rows sampled per CSV file when the column types are inferred
+CSV_SAMPLE_ROWS = 1000
+
+# Whole-column checks: the sampled values of a column are joined with newlines
+# and matched once, instead of calling infer_sql_type for every cell.
+_INTEGER = r"[+-]?\d+"
+_REAL = r"(?:[+-]?\d+|[+-]?\d+\.\d*(?:[eE][+-]?\d+)?|[+-]?\.\d+(?:[eE][+-]?\d+)?)"
+_DATE = r"\d{4}-\d{2}-\d{2}"
+_DATETIME = r"\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}:\d{2})?"
+SIGNED_INTEGER = re.compile(_INTEGER)
+COLUMN_PATTERNS = [
+    ("INTEGER", re.compile(f"{_INTEGER}(?:\\n{_INTEGER})*")),
+    ("REAL", re.compile(f"{_REAL}(?:\\n{_REAL})*")),
+    ("DATE", re.compile(f"{_DATE}(?:\\n{_DATE})*")),
+    ("DATETIME", re.compile(f"{_DATETIME}(?:\\n{_DATETIME})*")),
+]
+
+
+def infer_sample_type(value: str) -> str:
+    # infer_sql_type only accepts unsigned integers, a sampled column also counts "-5" as INTEGER
+    if SIGNED_INTEGER.fullmatch(value):
+        return "INTEGER"
+    return infer_sql_type(value)
+
+
+def widen_sql_type(current: str, new: str) -> str:
+    """
+    Return the narrowest SQL type that holds values of both types.
+
+    NULL fits every type, INTEGER widens to REAL, DATE widens to DATETIME
+    and any other mix widens to TEXT.
+    """
+    if current == new or new == "NULL":
+        return current
+    if current == "NULL":
+        return new
+    pair = {current, new}
+    if pair == {"INTEGER", "REAL"}:
+        return "REAL"
+    if pair == {"DATE", "DATETIME"}:
+        return "DATETIME"
+    return "TEXT"
+
+
+def infer_column_type(values: List[Optional[str]]) -> Tuple[str, float]:
+    """
+    Infer the SQL type of a column from a sample of its values.
+
+    :param values: The sampled values of the column.
+    :return: A tuple of (type, confidence), where confidence is the share of the
+             non-null values whose own type is the inferred type or widens to it
+             without falling back to TEXT. A column without values is NULL with
+             confidence 0.
+    """
+    present = [value for value in values if value is not None and value.strip() != ""]
+    if not present:
+        return "NULL", 0.0
+
+    # Fast path: one match over the whole column, unless a value contains a newline
+    column = "\n".join(present)
+    if column.count("\n") == len(present) - 1:
+        for sql_type, pattern in COLUMN_PATTERNS:
+            if pattern.fullmatch(column):
+                return sql_type, 1.0
+
+    # Slow path: infer every value and widen the column type
+    cell_types = [infer_sample_type(value) for value in present]
+    column_type = "NULL"
+    for cell_type in cell_types:
+        column_type = widen_sql_type(column_type, cell_type)
+    matching = sum(1 for cell_type in cell_types if widen_sql_type(cell_type, column_type) == column_type
+                   and (column_type != "TEXT" or cell_type == "TEXT"))
+    return column_type, matching / len(cell_types)
+
+
+def sample_csv_rows(file_path: str, sample_rows: int = CSV_SAMPLE_ROWS, reservoir: bool = False,
+                    seed: Optional[int] = None) -> Tuple[List[str], List[Dict[str, str]]]:
+    """
+    Sample rows from a CSV file.
+
+    :param file_path: Path to the CSV file.
+    :param sample_rows: The number of rows to sample.
+    :param reservoir: If True, sample uniformly across the whole file (reservoir sampling),
+                      otherwise take the first rows, which only reads the head of the file.
+    :param seed: Seed for the reservoir sampling.
+    :return: A tuple of (field names, sampled rows).
+    """
+    table = open_columnar(file_path)
+    if table is not None:
+        # An ingested file: the sampled rows are read by index from the memory-mapped columns
+        if not reservoir or table.row_count <= sample_rows:
+            return table.fields, table.rows(sample_rows)
+        indexes = sorted(random.Random(seed).sample(range(table.row_count), sample_rows))
+        return table.fields, [table.row(index) for index in indexes]
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames
+        if not fields:
+            raise ValueError("CSV file is empty or has no headers.")
+        rows = []
+        if not reservoir:
+            for row in reader:
+                rows.append(row)
+                if len(rows) >= sample_rows:
+                    break
+            return fields, rows
+
+        rng = random.Random(seed)
+        for index, row in enumerate(reader):
+            if index < sample_rows:
+                rows.append(row)
+            else:
+                slot = rng.randint(0, index)
+                if slot < sample_rows:
+                    rows[slot] = row
+        return fields, rows
+
+
+def infer_csv_column_types(file_path: str, sample_rows: int = CSV_SAMPLE_ROWS,
+                           reservoir: bool = False) -> Dict[str, Tuple[str, float]]:
+    """
+    Infer the SQL type and the confidence of every column of a CSV file from a sample of rows.
+
+    :param file_path: Path to the CSV file.
+    :param sample_rows: The number of rows to sample.
+    :param reservoir: If True, sample across the whole file instead of its first rows.
+    :return: A dictionary of field name -> (type, confidence).
+    """
+    fields, rows = sample_csv_rows(file_path, sample_rows, reservoir)
+    if not rows:
+        raise ValueError("CSV file is empty.")
+    return {field: infer_column_type([row.get(field) for row in rows]) for field in fields}